@@ -0,0 +1,256 @@
+"""Benchmark how long the cloudlaunch command takes to start.
+
+Runs representative subcommands of the cloudlaunch entry point in fresh
+interpreters and records:
+
+- warm start: median wall time with bytecode already cached
+- cold start: wall time with an empty bytecode cache (Python 3.8+), as on the
+  first run after an install without precompiled files
+- a ``-X importtime`` breakdown of importing cloudlaunch_cli.main and
+  cloudlaunch_cli.api.client
+
+Times are recorded as overhead over starting a bare interpreter, so that
+results from machines of different speed are comparable. All commands run
+offline against a temporary home and cache directory.
+
+Usage:
+    python benchmarks/startup.py                  # measure and print
+    python benchmarks/startup.py --check          # fail if slower than
+                                                  # the baseline
+    python benchmarks/startup.py --save-baseline  # update stored baseline
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+# The package is benchmarked from the source tree the script is in, whether
+# or not it's installed
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'startup_baseline.json')
+
+# What the cloudlaunch console script runs
+ENTRY_POINT = ('import sys; from cloudlaunch_cli.main import client; '
+               'sys.exit(client())')
+
+# Subcommands run by the benchmark, '{catalog}' is replaced by the path of a
+# small catalog file
+COMMANDS = collections.OrderedDict([
+    ('help', ['--help']),
+    ('deployments-create-help', ['deployments', 'create', '--help']),
+    ('config-set', ['config', 'set', 'url',
+                    'http://localhost:8000/cloudlaunch/api/v1']),
+    ('cache-clear', ['cache', 'clear', '--all']),
+    ('find-vm-types', ['clouds', 'find-vm-types', '--catalog', '{catalog}',
+                       '--min_vcpus', '2']),
+])
+
+# Modules whose import time is broken down
+MODULES = ('cloudlaunch_cli.main', 'cloudlaunch_cli.api.client')
+
+# A metric regresses if it exceeds its baseline by both the relative
+# threshold and the absolute slack, which absorbs noise of fast commands
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_SLACK_MS = 25.0
+
+
+def run(args, env, repeat):
+    """Run a command repeat times and return list of wall times in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def summarize(times):
+    return {'median': round(statistics.median(times), 2),
+            'min': round(min(times), 2),
+            'max': round(max(times), 2)}
+
+
+def import_times(module, env):
+    """Return -X importtime breakdown of importing module.
+
+    Returns dict with the cumulative import time of module in ms and the
+    slowest modules it imports as [name, self ms, cumulative ms] lists.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import {module}'.format(module=module)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        check=True, universal_newlines=True)
+    # (depth, name, self ms, cumulative ms) in the order they're reported:
+    # a module is reported after the modules it imports, which are nested
+    # one level deeper
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((len(name) - len(name.lstrip()), name.strip(),
+                        int(self_us) / 1000, int(cumulative_us) / 1000))
+    position = next(i for i, m in enumerate(modules) if m[1] == module)
+    depth, _, _, total = modules[position]
+    imported = []
+    for m in reversed(modules[:position]):
+        if m[0] <= depth:
+            break
+        imported.append(m[1:])
+    slowest = sorted(imported, key=lambda m: m[2], reverse=True)[:15]
+    return {'total_ms': round(total, 2),
+            'slowest': [[name, round(self_ms, 2), round(cumulative, 2)]
+                        for name, self_ms, cumulative in slowest]}
+
+
+def write_catalog(path):
+    from cloudlaunch_cli.api.catalog import Catalog
+
+    vm_types = [{'name': 'm{size}.large'.format(size=size),
+                 'vcpus': str(size), 'ram': str(size * 4)}
+                for size in range(1, 65)]
+    zones = [{'zone_id': 'zone{i}'.format(i=i), 'name': 'Zone',
+              'vm_types': vm_types} for i in range(4)]
+    regions = [{'region_id': 'region{i}'.format(i=i), 'name': 'Region',
+                'zones': zones} for i in range(4)]
+    Catalog([{'id': 'cloud', 'name': 'Cloud', 'regions': regions}],
+            url='http://localhost:8000/cloudlaunch/api/v1').save(path)
+
+
+def benchmark(repeat, cold_repeat):
+    workdir = tempfile.mkdtemp(prefix='cloudlaunch-startup-')
+    try:
+        env = dict(os.environ, HOME=workdir,
+                   CLOUDLAUNCH_CACHE_DIR=os.path.join(workdir, 'cache'),
+                   PYTHONPATH=os.pathsep.join(filter(None, [
+                       REPO_DIR, os.environ.get('PYTHONPATH')])))
+        for name in ('CLOUDLAUNCH_SERVER_URL', 'CLOUDLAUNCH_AUTH_TOKEN'):
+            env.pop(name, None)
+        catalog_path = os.path.join(workdir, 'catalog.json.gz')
+        write_catalog(catalog_path)
+
+        # Populate bytecode caches before measuring warm starts
+        run([sys.executable, '-c', ENTRY_POINT, '--help'], env, 1)
+        interpreter = statistics.median(
+            run([sys.executable, '-c', 'pass'], env, repeat))
+        results = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'interpreter_ms': round(interpreter, 2),
+            'commands': collections.OrderedDict(),
+            'imports': collections.OrderedDict(),
+        }
+        for name, args in COMMANDS.items():
+            args = [sys.executable, '-c', ENTRY_POINT] + [
+                arg.format(catalog=catalog_path) for arg in args]
+            warm = summarize(run(args, env, repeat))
+            command = {'warm_ms': warm,
+                       'warm_overhead_ms': round(
+                           warm['median'] - interpreter, 2)}
+            if cold_repeat and sys.version_info >= (3, 8):
+                cold_times = []
+                for _ in range(cold_repeat):
+                    cold_env = dict(env, PYTHONPYCACHEPREFIX=tempfile.mkdtemp(
+                        dir=workdir))
+                    cold_times.extend(run(args, cold_env, 1))
+                command['cold_ms'] = summarize(cold_times)
+            results['commands'][name] = command
+        for module in MODULES:
+            results['imports'][module] = import_times(module, env)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, threshold, slack_ms):
+    """Return list of messages describing regressions against baseline."""
+    metrics = []
+    for name, command in baseline['commands'].items():
+        if name in results['commands']:
+            metrics.append(('{name} warm start'.format(name=name),
+                            command['warm_overhead_ms'],
+                            results['commands'][name]['warm_overhead_ms']))
+    for module, breakdown in baseline['imports'].items():
+        if module in results['imports']:
+            metrics.append(('import {module}'.format(module=module),
+                            breakdown['total_ms'],
+                            results['imports'][module]['total_ms']))
+    regressions = []
+    for name, expected, actual in metrics:
+        if (actual > expected * (1 + threshold) and
+                actual - expected > slack_ms):
+            regressions.append(
+                "{name}: {actual:.1f}ms, baseline {expected:.1f}ms".format(
+                    name=name, actual=actual, expected=expected))
+    return regressions
+
+
+def print_results(results):
+    print("Python {python}, interpreter start {interpreter_ms:.1f}ms".format(
+        **results))
+    print("{:28s}  {:>10s}  {:>10s}  {:>10s}".format(
+        "Command", "Warm (ms)", "Overhead", "Cold (ms)"))
+    for name, command in results['commands'].items():
+        cold = command.get('cold_ms')
+        print("{:28s}  {:10.1f}  {:10.1f}  {:>10s}".format(
+            name, command['warm_ms']['median'], command['warm_overhead_ms'],
+            '{:.1f}'.format(cold['median']) if cold else '-'))
+    for module, breakdown in results['imports'].items():
+        print("\nimport {module}: {total_ms:.1f}ms, slowest imports:".format(
+            module=module, **breakdown))
+        for name, self_ms, cumulative in breakdown['slowest'][:8]:
+            print("  {:40s}  {:8.1f}".format(name, cumulative))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Warm runs of each command')
+    parser.add_argument('--cold-repeat', type=int, default=3,
+                        help='Cold runs of each command, 0 to skip them')
+    parser.add_argument('--output', help='File to write results to as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with an error if slower than the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed relative slowdown')
+    parser.add_argument('--slack', type=float, default=DEFAULT_SLACK_MS,
+                        help='Allowed absolute slowdown in ms')
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.repeat, args.cold_repeat)
+    print_results(results)
+    for path in ([args.output] if args.output else []) + (
+            [args.baseline] if args.save_baseline else []):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.slack)
+        if regressions:
+            print("\nStartup regressions:")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("\nNo startup regressions.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Benchmark latency and throughput of the API client.
+
+Drives APIClient against the fake CloudLaunch server
+(cloudlaunch_cli.testing.server), started in a subprocess so that it doesn't
+compete with the client for the GIL, and measures:
+
+- get, list (1, 100 and 10k items), create and nested subroute requests
+- building resources and compact records from response data
+- rendering deployments as a table and as JSON
+
+For each benchmark the p50/p95/p99 latency and operations per second are
+reported. Results can be saved as JSON and compared with the results of an
+earlier version.
+
+Usage:
+    python benchmarks/throughput.py --output results.json
+    python benchmarks/throughput.py --only get,list-100 --threads 4
+    python benchmarks/throughput.py --compare old.json
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+# The package is benchmarked from the source tree the script is in, whether
+# or not it's installed
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import cloudlaunch_cli  # noqa: E402
+from cloudlaunch_cli import main as cli  # noqa: E402
+from cloudlaunch_cli import output  # noqa: E402
+from cloudlaunch_cli.api import resources  # noqa: E402
+from cloudlaunch_cli.api.client import APIClient  # noqa: E402
+
+# Deployments on the server, enough for listing 10k items
+DEPLOYMENTS = 10000
+
+
+@contextlib.contextmanager
+def fake_server(deployments=DEPLOYMENTS, latency=0, payload_size=0):
+    """Run the fake server in a subprocess and yield its API URL."""
+    process = subprocess.Popen(
+        [sys.executable, '-u', '-m', 'cloudlaunch_cli.testing.server',
+         '--port', '0', '--deployments', str(deployments),
+         '--latency', str(latency), '--payload-size', str(payload_size)],
+        stdout=subprocess.PIPE, universal_newlines=True,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+            REPO_DIR, os.environ.get('PYTHONPATH')]))))
+    try:
+        # The server prints its URL once it's listening
+        line = process.stdout.readline()
+        if not line:
+            raise Exception("Fake CloudLaunch server didn't start")
+        yield line.split()[-1]
+    finally:
+        process.terminate()
+        process.wait()
+
+
+class Benchmark(object):
+    """Operation called iterations times, after warmup calls.
+
+    func is called with the number of the iteration.
+    """
+
+    def __init__(self, name, func, iterations, warmup=3):
+        self.name = name
+        self.func = func
+        self.iterations = iterations
+        self.warmup = warmup
+
+    def run(self, threads=1, scale=1.0):
+        """Run benchmark on threads and return dict of its statistics."""
+        for i in range(self.warmup):
+            self.func(i)
+        iterations = max(1, int(self.iterations * scale))
+        counter = itertools.count()
+        latencies = []
+        lock = threading.Lock()
+
+        def worker():
+            times = []
+            for i in iter(lambda: next(counter), None):
+                if i >= iterations:
+                    break
+                start = time.perf_counter()
+                self.func(i)
+                times.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(times)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return summarize(latencies, elapsed)
+
+
+def percentile(values, p):
+    """Return the p-th percentile of sorted values (nearest rank)."""
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+
+    def ms(seconds):
+        return round(seconds * 1000, 4)
+
+    return collections.OrderedDict([
+        ('iterations', len(latencies)),
+        ('ops_per_sec', round(len(latencies) / elapsed, 2)),
+        ('mean_ms', ms(sum(latencies) / len(latencies))),
+        ('p50_ms', ms(percentile(latencies, 50))),
+        ('p95_ms', ms(percentile(latencies, 95))),
+        ('p99_ms', ms(percentile(latencies, 99))),
+        ('min_ms', ms(latencies[0])),
+        ('max_ms', ms(latencies[-1])),
+    ])
+
+
+def create_benchmarks(client):
+    """Return list of Benchmarks of client, connected to the fake server."""
+    deployments = client.deployments
+    ids = list(range(1, 1001))
+    deployment = deployments.get(1)
+    task_id = deployment.latest_task.id
+    data = deployment.asdict()
+    page = [deployments.get(id) for id in ids[:100]]
+
+    def render(output_format):
+        def func(i):
+            output.render(page, cli.DEPLOYMENT_COLUMNS, output_format,
+                          stream=io.StringIO())
+        return func
+
+    def create(i):
+        deployments.create(
+            name='benchmark-{i}'.format(i=i), application='application-0',
+            deployment_target_id=1, application_version='1.0')
+
+    return [
+        Benchmark('get', lambda i: deployments.get(ids[i % len(ids)]), 500),
+        Benchmark('list-1', lambda i: deployments.list(limit=1, page_size=1),
+                  500),
+        Benchmark('list-100',
+                  lambda i: deployments.list(limit=100, page_size=100), 100),
+        Benchmark('list-10k',
+                  lambda i: deployments.list(limit=10000, page_size=1000), 5,
+                  warmup=1),
+        Benchmark('list-10k-compact',
+                  lambda i: list(deployments.iter(
+                      limit=10000, page_size=1000, compact=True)), 5,
+                  warmup=1),
+        Benchmark('subroute-get',
+                  lambda i: deployment.tasks.get(task_id), 500),
+        Benchmark('subroutes',
+                  lambda i: deployments.subroutes(ids[i % len(ids)]), 20000),
+        Benchmark('resource', lambda i: resources.Deployment(data), 5000),
+        Benchmark('resource-from-response',
+                  lambda i: resources.Deployment.from_response(
+                      json.loads(json.dumps(data))), 5000),
+        Benchmark('compact-record',
+                  lambda i: resources.compact_record(
+                      resources.Deployment, data), 5000),
+        Benchmark('render-table-100', render('table'), 100),
+        Benchmark('render-json-100', render('json'), 100),
+        # Last, since it adds deployments to the server
+        Benchmark('create', create, 200),
+    ]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(url, only=None, threads=1, scale=1.0,
+              conditional_requests=False):
+    results = collections.OrderedDict([
+        ('version', cloudlaunch_cli.__version__),
+        ('revision', git_revision()),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('created', datetime.datetime.now().isoformat()),
+        ('threads', threads),
+        ('conditional_requests', conditional_requests),
+        ('benchmarks', collections.OrderedDict()),
+    ])
+    # Conditional requests are off unless asked for, so that repeated reads
+    # measure the same thing as runs of versions without them
+    with APIClient(url=url, token='token', schema_cache=False,
+                   pool_size=max(threads, 10),
+                   conditional_requests=conditional_requests) as client:
+        for bench in create_benchmarks(client):
+            if only and bench.name not in only:
+                continue
+            stats = bench.run(threads=threads, scale=scale)
+            results['benchmarks'][bench.name] = stats
+            print_result(bench.name, stats)
+    return results
+
+
+def print_result(name, stats, previous=None):
+    line = ("{name:24s} {ops_per_sec:12.1f} {p50_ms:10.3f} {p95_ms:10.3f} "
+            "{p99_ms:10.3f}".format(name=name, **stats))
+    if previous:
+        line += "  {speedup:6.2f}x".format(
+            speedup=stats['ops_per_sec'] / previous['ops_per_sec'])
+    print(line)
+
+
+def print_header(compare=False):
+    print("{:24s} {:>12s} {:>10s} {:>10s} {:>10s}{}".format(
+        "Benchmark", "ops/sec", "p50 (ms)", "p95 (ms)", "p99 (ms)",
+        "  vs old" if compare else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='URL of an already running (fake) '
+                        'server, by default one is started')
+    parser.add_argument('--only', help='Comma separated benchmarks to run')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Threads making calls at the same time')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier of the number of iterations')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds by which the server delays responses')
+    parser.add_argument('--payload-size', type=int, default=0,
+                        help='Characters of log in the result of each task')
+    parser.add_argument('--conditional-requests', action='store_true',
+                        help='Make conditional GET requests, so repeated '
+                        'reads are 304 (Not Modified) responses')
+    parser.add_argument('--output', help='File to write results to as JSON')
+    parser.add_argument('--compare',
+                        help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+    only = set(args.only.split(',')) if args.only else None
+
+    print_header()
+    if args.url:
+        results = benchmark(args.url, only, args.threads, args.scale,
+                            args.conditional_requests)
+    else:
+        with fake_server(latency=args.latency,
+                         payload_size=args.payload_size) as url:
+            results = benchmark(url, only, args.threads, args.scale,
+                                args.conditional_requests)
+    results['server'] = {'url': args.url, 'latency': args.latency,
+                         'payload_size': args.payload_size}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print("\nCompared with {version} ({revision}):".format(**previous))
+        if (previous.get('conditional_requests', False) !=
+                args.conditional_requests):
+            print("Warning: only one of the runs made conditional requests")
+        print_header(compare=True)
+        for name, stats in results['benchmarks'].items():
+            print_result(name, stats, previous['benchmarks'].get(name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
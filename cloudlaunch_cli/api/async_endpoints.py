@@ -0,0 +1,297 @@
+"""Asynchronous (asyncio) CloudLaunch API endpoints.
+
+Requires the optional aiohttp dependency (``pip install
+cloudlaunch-cli[async]``). Async endpoints wrap the synchronous endpoint
+classes in endpoints.py, so paths, url kwargs, subroutes and resource types are
+shared between the two clients.
+"""
+import asyncio
+import collections
+import itertools
+import json
+
+import coreapi
+from coreapi.client import _lookup_link, _validate_parameters
+from coreapi.transports.http import (_coerce_to_error, _get_encoding,
+                                     _get_headers, _get_method, _get_params,
+                                     _get_url)
+from coreapi.utils import negotiate_decoder
+
+from . import endpoints
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncAPIConnection(object):
+    """aiohttp session and API schema shared by async endpoints.
+
+    The aiohttp session is created on first use since it must be created
+    from within a running event loop.
+    """
+
+    def __init__(self, api_config):
+        if aiohttp is None:
+            raise Exception("aiohttp is required for asynchronous API access. "
+                            "Install it with: pip install "
+                            "cloudlaunch-cli[async]")
+        url = api_config.url
+        if not api_config.token or not url:
+            raise Exception("Auth token and url are required.")
+        self.api_config = api_config
+        self.decoders = coreapi.Client().decoders
+        url = url if url.endswith("/") else url + "/"
+        self.schema_url = '{url}schema/'.format(url=url)
+        self.headers = {
+            'Authorization': 'Token {token}'.format(token=api_config.token)
+        }
+        if api_config.cloud_credentials:
+            self.headers.update(
+                api_config.cloud_credentials.to_http_headers())
+        self._session = None
+        self._schema = None
+        self._schema_lock = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.api_config.pool_size,
+                force_close=not self.api_config.keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=self.headers)
+        return self._session
+
+    async def schema(self):
+        """Return API schema document, downloading it only when needed."""
+        if self._schema_lock is None:
+            self._schema_lock = asyncio.Lock()
+        async with self._schema_lock:
+            if self._schema is None:
+                self._schema = await self._fetch_schema()
+            return self._schema
+
+    async def _fetch_schema(self):
+        schema_cache = self.api_config.schema_cache
+        if not schema_cache:
+            return await self.request('GET', self.schema_url)
+        document, headers = schema_cache.lookup(
+            self.schema_url, self.api_config.token, self.decoders)
+        if document is not None:
+            return document
+        async with self.session.get(self.schema_url,
+                                    headers=headers) as response:
+            if response.status != 304:
+                response.raise_for_status()
+            content = await response.read()
+            return schema_cache.store(
+                self.schema_url, self.api_config.token, self.decoders,
+                response.status, response.headers, content)
+
+    async def action(self, document, keys, params=None, validate=True):
+        """Perform action identified by keys, like coreapi.Client.action."""
+        params = params or {}
+        link, link_ancestors = _lookup_link(document, keys)
+        if validate:
+            _validate_parameters(link, params)
+        method = _get_method(link.action)
+        encoding = _get_encoding(link.encoding)
+        params = _get_params(method, encoding, link.fields, params)
+        if params.files:
+            raise Exception("File uploads are not supported by the "
+                            "asynchronous client")
+        url = _get_url(link.url, params.path)
+        kwargs = {}
+        if params.query:
+            kwargs['params'] = _query_params(params.query)
+        if params.data:
+            if encoding == 'application/json':
+                kwargs['data'] = json.dumps(params.data)
+                kwargs['headers'] = {'Content-Type': encoding}
+            else:
+                kwargs['data'] = params.data
+        return await self.request(method, url, **kwargs)
+
+    async def request(self, method, url, headers=None, **kwargs):
+        """Make a request and return the decoded response content."""
+        request_headers = _get_headers(url, self.decoders)
+        request_headers.update(headers or {})
+        async with self.session.request(method, url, headers=request_headers,
+                                        **kwargs) as response:
+            content = await response.read()
+            result = None
+            if content:
+                content_type = response.headers.get('Content-Type')
+                codec = negotiate_decoder(self.decoders, content_type)
+                options = {'base_url': str(response.url)}
+                if content_type:
+                    options['content_type'] = content_type
+                result = codec.load(content, **options)
+            if 400 <= response.status <= 599:
+                raise coreapi.exceptions.ErrorMessage(_coerce_to_error(
+                    result, '%d %s' % (response.status, response.reason)))
+            return result
+
+    async def close(self):
+        """Close the aiohttp session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _query_params(query):
+    """Convert query params to strings, the same way requests does."""
+    params = []
+    for name, value in query.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        params.extend((name, str(item)) for item in values)
+    return params
+
+
+class AsyncAPIEndpoint(object):
+    """Asynchronous version of a CoreAPIBasedAPIEndpoint.
+
+    Wraps an instance of a synchronous endpoint class and provides coroutine
+    versions of its methods. Subroutes of the wrapped endpoint are available
+    as attributes and are wrapped as well.
+    """
+
+    def __init__(self, endpoint_type, connection, parent_id=None,
+                 parent_url_kwargs=None):
+        self.connection = connection
+        self.endpoint = endpoint_type(connection.api_config,
+                                      parent_id=parent_id,
+                                      parent_url_kwargs=parent_url_kwargs)
+
+    @property
+    def resource_type(self):
+        return self.endpoint.resource_type
+
+    @property
+    def path(self):
+        return self.endpoint.path
+
+    def __getattr__(self, name):
+        if name == 'endpoint':
+            raise AttributeError(name)
+        value = getattr(self.endpoint, name)
+        if isinstance(value, endpoints.APIEndpoint):
+            return AsyncAPIEndpoint(
+                value.__class__, self.connection,
+                parent_url_kwargs=dict(value.parent_url_kwargs))
+        return value
+
+    async def get(self, id, **kwargs):
+        params = self.endpoint._create_params(id=id, **kwargs)
+        item = await self._action('read', params)
+        return self._create_response(item)
+
+    async def list(self, **kwargs):
+        return [resource async for resource in self.iter(**kwargs)]
+
+    async def iter(self, page_size=None, limit=None, prefetch=None,
+                   compact=False, **kwargs):
+        """Asynchronously iterate over resources, page by page.
+
+        See CoreAPIBasedAPIEndpoint.iter().
+        """
+        if page_size:
+            kwargs['page_size'] = page_size
+        if limit is not None and limit <= 0:
+            return
+        shared_values = {}
+        count = 0
+        async for item in self._list_items(prefetch, limit, **kwargs):
+            if compact:
+                yield self.endpoint._create_record(item, shared_values)
+            else:
+                yield self._create_response(item)
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    async def create(self, **kwargs):
+        params = self.endpoint._create_params(**kwargs)
+        item = await self._action('create', params)
+        return self._create_response(item)
+
+    async def update(self, id, **kwargs):
+        params = self.endpoint._create_params(id=id, **kwargs)
+        # See CoreAPIBasedAPIEndpoint.update() for why validation is off
+        item = await self._action('update', params, validate=False)
+        return self._create_response(item)
+
+    async def partial_update(self, id, **kwargs):
+        params = self.endpoint._create_params(id=id, **kwargs)
+        item = await self._action('partial_update', params)
+        return self._create_response(item)
+
+    async def delete(self, id):
+        params = self.endpoint._create_params(id=id)
+        await self._action('delete', params)
+
+    def subroutes(self, id):
+        return {
+            resource_type: AsyncAPIEndpoint(
+                endpoint.__class__, self.connection,
+                parent_url_kwargs=dict(endpoint.parent_url_kwargs))
+            for resource_type, endpoint
+            in self.endpoint.subroutes(id).items()
+        }
+
+    async def _action(self, action, params, validate=True):
+        document = await self.connection.schema()
+        return await self.connection.action(
+            document, self.endpoint.path + [action], params=params,
+            validate=validate)
+
+    async def _list_items(self, prefetch, limit, **kwargs):
+        params = self.endpoint._create_params(**kwargs)
+        page = await self._action('list', params)
+        # Unpaginated list responses are a plain list of items
+        if not isinstance(page, dict):
+            for item in page:
+                yield item
+            return
+        page_urls = (endpoints._remaining_page_urls(page, limit)
+                     if prefetch else None)
+        if page_urls is not None:
+            for item in page['results']:
+                yield item
+            async for results in self._fetch_pages(page_urls, prefetch):
+                for item in results:
+                    yield item
+            return
+        while True:
+            for item in page['results']:
+                yield item
+            if not page.get('next'):
+                return
+            page = await self.connection.request('GET', page['next'])
+
+    async def _fetch_pages(self, page_urls, max_workers):
+        """Fetch pages concurrently and generate their results in order.
+
+        At most twice max_workers pages are fetched ahead of the consumer.
+        """
+        page_urls = iter(page_urls)
+        pending = collections.deque(
+            asyncio.ensure_future(self.connection.request('GET', url))
+            for url in itertools.islice(page_urls, max_workers * 2))
+        try:
+            while pending:
+                page = await pending.popleft()
+                for url in itertools.islice(page_urls, 1):
+                    pending.append(asyncio.ensure_future(
+                        self.connection.request('GET', url)))
+                yield page['results']
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _create_response(self, data):
+        api_response = self.endpoint.resource_type.from_response(data)
+        api_response.register_update_endpoint(self)
+        return api_response
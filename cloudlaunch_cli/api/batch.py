@@ -0,0 +1,129 @@
+"""Run CloudLaunch API operations for many items concurrently."""
+import collections
+import concurrent.futures
+import itertools
+import time
+
+DEFAULT_CONCURRENCY = 8
+
+# Task states after which a task's status no longer changes
+TASK_READY_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+# Outcome of running an operation on one item: result is set if the operation
+# succeeded, otherwise error is the exception it raised.
+BatchResult = collections.namedtuple('BatchResult',
+                                     ['item', 'result', 'error'])
+
+
+def run_concurrently(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """Call func for each item on a pool of concurrency threads.
+
+    Generates a BatchResult for each item as soon as its call completes, so
+    results are in order of completion. Items are consumed lazily: at most
+    concurrency calls are in flight at any time.
+    """
+    items = iter(items)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency) as executor:
+        pending = {executor.submit(func, item): item
+                   for item in itertools.islice(items, concurrency)}
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                for next_item in itertools.islice(items, 1):
+                    pending[executor.submit(func, next_item)] = next_item
+                try:
+                    yield BatchResult(item, future.result(), None)
+                except Exception as e:
+                    yield BatchResult(item, None, e)
+
+
+def create_deployments(clients, specs, concurrency=DEFAULT_CONCURRENCY):
+    """Create deployments concurrently.
+
+    Arguments:
+    clients -- dict of cloud id to the APIClient to create its deployments
+               with, so that cloud credentials are only resolved once per
+               cloud, or to the exception raised creating it, which fails
+               the specs for that cloud
+    specs -- iterable of dicts with the deployment's 'cloud' and the params
+             for creating it ('name', 'application', 'deployment_target_id',
+             'application_version' and, optionally, 'config_app')
+
+    Generates a BatchResult per spec, with the created Deployment as result,
+    in order of completion.
+    """
+    def create(spec):
+        client = clients[spec['cloud']]
+        if isinstance(client, Exception):
+            raise client
+        params = {k: v for k, v in spec.items() if k != 'cloud'}
+        return client.deployments.create(**params)
+
+    return run_concurrently(create, specs, concurrency=concurrency)
+
+
+def run_health_checks(deployments, concurrency=DEFAULT_CONCURRENCY,
+                      timeout=600, poll_interval=2, max_poll_interval=30,
+                      backoff=1.5, tasks_for=None):
+    """Run a health check on each deployment and wait for them to finish.
+
+    HEALTH_CHECK tasks are created concurrently, then all unfinished tasks
+    are polled in rounds. Rounds share a single interval, starting at
+    poll_interval and multiplied by backoff after each round, up to
+    max_poll_interval.
+
+    Arguments:
+    deployments -- iterable of Deployment resources
+
+    Keyword arguments:
+    timeout -- seconds to wait for health checks to finish
+    tasks_for -- callable returning the tasks endpoint to use for a
+                 deployment, for example to use a client with the credentials
+                 of the deployment's cloud. Defaults to deployment.tasks.
+
+    Generates a BatchResult per deployment, with the finished Task as result,
+    in order of completion. Health checks that couldn't be started or didn't
+    finish in time have an error.
+    """
+    tasks_for = tasks_for or (lambda deployment: deployment.tasks)
+    deadline = time.time() + timeout
+    pending = {}
+    for result in run_concurrently(
+            lambda d: tasks_for(d).create(action='HEALTH_CHECK'),
+            deployments, concurrency=concurrency):
+        if result.error:
+            yield result
+        elif result.result.status in TASK_READY_STATES:
+            yield result
+        else:
+            pending[result.item.id] = result
+
+    interval = poll_interval
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_poll_interval)
+        polled = run_concurrently(
+            lambda r: tasks_for(r.item).get(r.result.id),
+            list(pending.values()), concurrency=concurrency)
+        for result in polled:
+            deployment = result.item.item
+            if result.error:
+                # Keep polling, the error may be transient
+                continue
+            if result.result.status in TASK_READY_STATES:
+                del pending[deployment.id]
+                yield BatchResult(deployment, result.result, None)
+            else:
+                pending[deployment.id] = BatchResult(
+                    deployment, result.result, None)
+
+    for result in pending.values():
+        yield BatchResult(result.item, result.result, Exception(
+            "Timed out waiting for health check task {id}".format(
+                id=result.result.id)))
@@ -0,0 +1,352 @@
+"""Client side caches for CloudLaunch API data."""
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from os.path import expanduser
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Media types sent when fetching the API schema
+SCHEMA_ACCEPT = 'application/coreapi+json, application/vnd.coreapi+json, */*'
+
+
+def user_cache_dir():
+    """Return the directory in which CloudLaunch CLI caches data.
+
+    Defaults to ``$XDG_CACHE_HOME/cloudlaunch`` (``~/.cache/cloudlaunch``) and
+    can be overridden with the ``CLOUDLAUNCH_CACHE_DIR`` environment variable.
+    """
+    cache_dir = os.environ.get('CLOUDLAUNCH_CACHE_DIR')
+    if cache_dir:
+        return expanduser(cache_dir)
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'cloudlaunch')
+
+
+def _cache_key(*parts):
+    """Hash parts into a key that is safe to use as a file name."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+class SchemaCache(object):
+    """Persistent cache of API schema documents.
+
+    Schemas are stored on disk keyed by schema URL and auth token, so users
+    with different permissions don't share a schema. A cached schema is used
+    as is for ``ttl`` seconds, after which it is revalidated with the server
+    using its ETag/Last-Modified validators and only downloaded again if it
+    has changed. Decoded documents are also kept in memory so repeated
+    lookups in the same process don't parse the schema again.
+    """
+
+    DEFAULT_TTL = 60 * 60
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_TTL):
+        self.cache_dir = os.path.join(cache_dir or user_cache_dir(), 'schemas')
+        self.ttl = ttl
+        # Maps cache key to (document, entry) tuples
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, url, token, decoders):
+        """Return the schema document at url, fetching it only if needed.
+
+        Arguments:
+        session -- requests session, with authentication, used to fetch
+                   schema
+        url -- URL of the schema
+        token -- auth token, used to scope the cache entry
+        decoders -- list of coreapi codecs with which to decode the schema
+        """
+        document, headers = self.lookup(url, token, decoders)
+        metrics.cache_lookup('schema', document is not None)
+        if document is not None:
+            return document
+        response = session.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return self.store(url, token, decoders, response.status_code,
+                          response.headers, response.content)
+
+    def lookup(self, url, token, decoders):
+        """Look up a fresh cached schema.
+
+        Returns a (document, headers) tuple. If the cached schema is fresh
+        document is set, otherwise it is None and headers contains the
+        headers with which to (conditionally) request the schema, after which
+        store() must be called with the response.
+        """
+        key = _cache_key(url, token)
+        with self._lock:
+            document, entry = self._documents.get(key, (None, None))
+        if not entry:
+            entry = self._read_entry(key)
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            if document is None:
+                document = self._decode(entry, decoders)
+            self._remember(key, document, entry)
+            return document, None
+
+        headers = {'Accept': SCHEMA_ACCEPT}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return None, headers
+
+    def store(self, url, token, decoders, status_code, headers, content):
+        """Store a schema response and return the schema document.
+
+        A 304 status code refreshes the previously cached schema.
+        """
+        key = _cache_key(url, token)
+        with self._lock:
+            document, entry = self._documents.get(key, (None, None))
+        if not entry:
+            entry = self._read_entry(key)
+        if status_code == 304 and entry:
+            log.debug("Schema at %s not modified", url)
+            entry['fetched_at'] = time.time()
+        else:
+            entry = {
+                'url': url,
+                'fetched_at': time.time(),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+                'content': content.decode('utf-8'),
+            }
+            document = None
+        if document is None:
+            document = self._decode(entry, decoders)
+        self._write_entry(key, entry)
+        self._remember(key, document, entry)
+        return document
+
+    def invalidate(self, url=None, token=None):
+        """Remove cached schema for url and token, or all schemas if no url.
+
+        Returns the number of cache entries removed.
+        """
+        if url:
+            keys = [_cache_key(url, token)]
+        elif os.path.isdir(self.cache_dir):
+            keys = [os.path.splitext(name)[0]
+                    for name in os.listdir(self.cache_dir)
+                    if name.endswith('.json')]
+        else:
+            keys = []
+        with self._lock:
+            if url:
+                self._documents.pop(keys[0], None)
+            else:
+                self._documents.clear()
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self._entry_path(key))
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _remember(self, key, document, entry):
+        with self._lock:
+            self._documents[key] = (document, entry)
+
+    def _decode(self, entry, decoders):
+        # coreapi is slow to import and isn't needed by users of the cache
+        # that don't decode schemas, such as the offline catalog
+        from coreapi.utils import negotiate_decoder
+
+        codec = negotiate_decoder(decoders, entry.get('content_type'))
+        options = {'base_url': entry['url']}
+        if entry.get('content_type'):
+            options['content_type'] = entry['content_type']
+        return codec.load(entry['content'].encode('utf-8'), **options)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _read_entry(self, key):
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        path = self._entry_path(key)
+        tmp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Unable to write schema cache %s: %s", path, e)
+
+
+class MemoryCache(object):
+    """In-memory LRU cache of values that expire."""
+
+    DEFAULT_MAX_ENTRIES = 1024
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, expires) tuple for key or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(object):
+    """Persistent LRU cache of JSON serializable values that expire.
+
+    The database is only opened when the cache is first used.
+    """
+
+    DEFAULT_MAX_ENTRIES = 10000
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(user_cache_dir(),
+                                         'responses.sqlite3')
+        self.max_entries = max_entries
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                             "key TEXT PRIMARY KEY, value TEXT, "
+                             "expires REAL, accessed REAL)")
+        return self._db
+
+    def get(self, key):
+        """Return (value, expires) tuple for key or None if not cached."""
+        with self._lock:
+            db = self._connect()
+            now = time.time()
+            row = db.execute("SELECT value, expires FROM responses "
+                             "WHERE key = ? AND expires > ?",
+                             (key, now)).fetchone()
+            if row is None:
+                return None
+            with db:
+                db.execute("UPDATE responses SET accessed = ? WHERE key = ?",
+                           (now, key))
+        value = json.loads(row[0], object_pairs_hook=collections.OrderedDict)
+        return value, row[1]
+
+    def set(self, key, value, expires):
+        value = json.dumps(value)
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute("INSERT OR REPLACE INTO responses "
+                           "VALUES (?, ?, ?, ?)",
+                           (key, value, expires, time.time()))
+                # Evict expired entries, then least recently used ones
+                db.execute("DELETE FROM responses WHERE expires <= ?",
+                           (time.time(),))
+                db.execute("DELETE FROM responses WHERE key NOT IN ("
+                           "SELECT key FROM responses "
+                           "ORDER BY accessed DESC LIMIT ?)",
+                           (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            if self._db is None and not os.path.exists(self.path):
+                return
+            db = self._connect()
+            with db:
+                db.execute("DELETE FROM responses")
+
+
+class ResponseCache(object):
+    """Cache of decoded API responses.
+
+    Responses are cached in memory and, if a persistent cache such as a
+    SQLiteCache is given, on disk, each for the TTL of the endpoint they came
+    from. With refresh set cached responses are never returned but new
+    responses are still stored, refreshing the cache.
+    """
+
+    def __init__(self, memory=None, persistent=None, refresh=False):
+        self.memory = memory if memory is not None else MemoryCache()
+        self.persistent = persistent
+        self.refresh = refresh
+
+    def get(self, key):
+        """Return cached response for key or None."""
+        if self.refresh:
+            return None
+        entry = self.memory.get(key)
+        if entry is None and self.persistent is not None:
+            entry = self.persistent.get(key)
+            if entry is not None:
+                self.memory.set(key, *entry)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        expires = time.time() + ttl
+        self.memory.set(key, value, expires)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value, expires)
+            except (OSError, TypeError, ValueError, sqlite3.Error) as e:
+                log.warning("Unable to write response cache: %s", e)
+
+    def get_or_fetch(self, key_parts, ttl, fetch):
+        """Return cached response for key_parts or fetch and cache it.
+
+        key_parts is a list of JSON serializable values identifying the
+        response and fetch a callable returning the response.
+        """
+        key = _cache_key(json.dumps(key_parts, sort_keys=True, default=str))
+        value = self.get(key)
+        metrics.cache_lookup('response', value is not None)
+        if value is None:
+            value = fetch()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
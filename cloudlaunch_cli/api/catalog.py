@@ -0,0 +1,324 @@
+"""Local snapshot of the CloudLaunch infrastructure catalog.
+
+The catalog is the tree of clouds, their regions, the regions' zones and the
+vm types available in each zone. Crawling it takes one request per node, so
+crawl() makes them on a pool of threads and the resulting Catalog can be
+saved to a compact file and queried offline.
+"""
+import bisect
+import concurrent.futures
+import gzip
+import itertools
+import json
+import os
+import time
+
+from . import resources
+from .batch import DEFAULT_CONCURRENCY
+from .cache import _cache_key, user_cache_dir
+
+CATALOG_VERSION = 1
+# Seconds for which a catalog is used instead of asking the server, the same
+# as the TTL of cached vm type listings
+MAX_AGE = 24 * 60 * 60
+
+# Name of the child list of each level of the tree
+CHILDREN = {
+    'clouds': 'regions',
+    'regions': 'zones',
+    'zones': 'vm_types',
+    'vm_types': None,
+}
+
+
+def default_path(url):
+    """Return the default path of the catalog file for the server at url."""
+    return os.path.join(user_cache_dir(), 'catalogs',
+                        _cache_key(url) + '.json.gz')
+
+
+def crawl(api_client, concurrency=DEFAULT_CONCURRENCY, clients=None):
+    """Crawl the infrastructure tree of a server and return a Catalog.
+
+    Every list request below the clouds is made on a pool of concurrency
+    threads as soon as its parent is known. If listing the children of a node
+    fails, the error is recorded in the node's 'error' field and the crawl
+    continues.
+
+    Keyword arguments:
+    clients -- dict of cloud id to the APIClient to crawl that cloud with, so
+               that requests can be made with the cloud's credentials, or
+               to the exception raised creating it, which is recorded as the
+               cloud's error. Clouds not in clients are crawled with
+               api_client.
+    """
+    clients = clients or {}
+
+    def list_children(resource, name):
+        if name == 'regions' and resource.id in clients:
+            client = clients[resource.id]
+            if isinstance(client, Exception):
+                raise client
+            clouds = client.infrastructure.clouds
+            return clouds.subroutes(resource.id)[resources.Region].list()
+        return getattr(resource, name).list()
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency) as executor:
+        # Maps futures listing children to the node they belong to and the
+        # name of the list of children
+        pending = {}
+
+        def add_children(node, name, resources):
+            node[name] = []
+            for resource in resources:
+                child = resource.asdict()
+                node[name].append(child)
+                child_name = CHILDREN[name]
+                if child_name:
+                    future = executor.submit(list_children, resource,
+                                             child_name)
+                    pending[future] = (child, child_name)
+
+        root = {}
+        add_children(root, 'clouds', api_client.infrastructure.clouds.list())
+        clouds = root['clouds']
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                node, name = pending.pop(future)
+                try:
+                    add_children(node, name, future.result())
+                except Exception as e:
+                    node[name] = []
+                    node['error'] = str(e)
+    return Catalog(clouds, url=api_client.api_config.url)
+
+
+class Catalog(object):
+    """Snapshot of clouds, regions, zones and vm types.
+
+    Nodes are the dicts returned by the API, each with a list of its
+    children ('regions', 'zones' or 'vm_types').
+    """
+
+    def __init__(self, clouds, url=None, created=None):
+        self.clouds = clouds
+        self.url = url
+        self.created = created or time.time()
+        self._index = None
+
+    @property
+    def age(self):
+        """Seconds since the catalog was crawled."""
+        return time.time() - self.created
+
+    def save(self, path):
+        """Save catalog to a gzipped JSON file at path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+        with gzip.open(tmp_path, 'wt') as f:
+            json.dump({
+                'version': CATALOG_VERSION,
+                'url': self.url,
+                'created': self.created,
+                'clouds': self.clouds,
+            }, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a catalog saved with save(). Returns None if there is none."""
+        try:
+            with gzip.open(path, 'rt') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != CATALOG_VERSION:
+            return None
+        return cls(data['clouds'], url=data.get('url'),
+                   created=data.get('created'))
+
+    def walk(self):
+        """Generate (level, node) for each node of the tree, depth first.
+
+        level is the name of the list the node is in, e.g. 'regions'.
+        """
+        def walk(nodes, level):
+            for node in nodes:
+                yield level, node
+                if CHILDREN[level]:
+                    for item in walk(node.get(CHILDREN[level], []),
+                                     CHILDREN[level]):
+                        yield item
+
+        return walk(self.clouds, 'clouds')
+
+    def counts(self):
+        """Return dict of number of nodes at each level of the tree."""
+        counts = dict.fromkeys(CHILDREN, 0)
+        for level, node in self.walk():
+            counts[level] += 1
+        return counts
+
+    def errors(self):
+        """Generate nodes whose children couldn't be listed."""
+        return (node for level, node in self.walk() if 'error' in node)
+
+    def zones(self, cloud_id=None, region_id=None, zone_id=None):
+        """Generate (cloud, region, zone) tuples, optionally filtered by id."""
+        for cloud in self.clouds:
+            if cloud_id is not None and cloud['id'] != cloud_id:
+                continue
+            for region in cloud.get('regions', []):
+                if region_id is not None and region['region_id'] != region_id:
+                    continue
+                for zone in region.get('zones', []):
+                    if zone_id is not None and zone['zone_id'] != zone_id:
+                        continue
+                    yield cloud, region, zone
+
+    def find_zone(self, cloud_id, region_id, zone_id):
+        """Return zone dict with given ids or None if not in the catalog."""
+        for cloud, region, zone in self.zones(cloud_id, region_id, zone_id):
+            return zone
+        return None
+
+    @property
+    def index(self):
+        """VmTypeIndex of (cloud, region, zone, vm_type) tuples."""
+        if self._index is None:
+            self._index = VmTypeIndex(
+                ((cloud, region, zone, vm_type)
+                 for cloud, region, zone in self.zones()
+                 for vm_type in zone.get('vm_types', [])),
+                vm_type=lambda item: item[3])
+        return self._index
+
+    def vm_types(self, cloud_id=None, region_id=None, zone_id=None,
+                 best_fit=False, **query):
+        """Return list of (cloud, region, zone, vm_type) tuples matching query.
+
+        query is passed to VmTypeIndex.query(), or VmTypeIndex.best_fit() if
+        best_fit is set, and results are filtered by cloud, region and zone.
+        """
+        def in_zone(item):
+            cloud, region, zone, vm_type = item
+            return ((cloud_id is None or cloud['id'] == cloud_id) and
+                    (region_id is None or region['region_id'] == region_id) and
+                    (zone_id is None or zone['zone_id'] == zone_id))
+
+        if best_fit:
+            match = self.index.best_fit(where=in_zone, **query)
+            return [match] if match else []
+        return [item for item in self.index.query(**query) if in_zone(item)]
+
+
+def _number(value):
+    """Convert a vcpus or ram value, which the API returns as a string."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class VmTypeIndex(object):
+    """In memory index of vm types for range, prefix and best fit queries.
+
+    Items are kept sorted by vcpus and by ram so that range queries are
+    bisections of those lists, and by name so that the items with a name
+    prefix are a contiguous range of the sorted names. Queries scan the
+    smallest of the candidate ranges and filter it by the other constraints.
+
+    Items can be vm type dicts or any other object, such as the
+    (cloud, region, zone, vm_type) tuples of a Catalog, in which case
+    vm_type is a callable returning an item's vm type dict.
+    """
+
+    SORT_KEYS = ('vcpus', 'ram', 'name')
+
+    def __init__(self, items, vm_type=None):
+        vm_type = vm_type or (lambda item: item)
+        # (vcpus, ram, name, position, item) records, position breaking ties
+        # between items that are otherwise equal
+        records = []
+        for position, item in enumerate(items):
+            data = vm_type(item)
+            records.append((_number(data.get('vcpus')),
+                            _number(data.get('ram')),
+                            data.get('name') or '', position, item))
+        self._by_vcpus = sorted(records)
+        self._vcpus = [record[0] for record in self._by_vcpus]
+        self._by_ram = sorted(records, key=lambda r: (r[1], r[0], r[2], r[3]))
+        self._ram = [record[1] for record in self._by_ram]
+        self._by_name = sorted(records, key=lambda r: (r[2], r[3]))
+        self._names = [record[2] for record in self._by_name]
+
+    def __len__(self):
+        return len(self._by_vcpus)
+
+    def _candidates(self, min_vcpus, max_vcpus, min_ram, max_ram, prefix):
+        """Return the smallest range of records that can match a query."""
+        ranges = [
+            (self._by_vcpus, _range(self._vcpus, min_vcpus, max_vcpus)),
+            (self._by_ram, _range(self._ram, min_ram, max_ram)),
+        ]
+        if prefix:
+            ranges.append((self._by_name, (
+                bisect.bisect_left(self._names, prefix),
+                bisect.bisect_left(self._names, prefix + '\uffff'))))
+        records, (start, end) = min(ranges, key=lambda r: r[1][1] - r[1][0])
+        return (records[i] for i in range(start, end))
+
+    def query(self, min_vcpus=0, max_vcpus=None, min_ram=0, max_ram=None,
+              prefix='', sort=SORT_KEYS):
+        """Return list of items within vcpus and ram ranges and name prefix.
+
+        Items are sorted by the sort keys, 'vcpus', 'ram' or 'name', each
+        optionally prefixed with '-' for descending order.
+        """
+        min_vcpus, min_ram = _number(min_vcpus), _number(min_ram)
+        max_vcpus = _number(max_vcpus) if max_vcpus is not None else None
+        max_ram = _number(max_ram) if max_ram is not None else None
+        matches = [
+            record for record in self._candidates(
+                min_vcpus, max_vcpus, min_ram, max_ram, prefix)
+            if (min_vcpus <= record[0] and
+                (max_vcpus is None or record[0] <= max_vcpus) and
+                min_ram <= record[1] and
+                (max_ram is None or record[1] <= max_ram) and
+                record[2].startswith(prefix))]
+        # Sort by the least significant key first, relying on sorts being
+        # stable, so that descending keys don't need to be numeric
+        matches.sort(key=lambda record: record[3])
+        for key in reversed(sort):
+            name = key.lstrip('-')
+            if name not in self.SORT_KEYS:
+                raise Exception("Can't sort vm types by {key}".format(key=key))
+            position = self.SORT_KEYS.index(name)
+            matches.sort(key=lambda record: record[position],
+                         reverse=key.startswith('-'))
+        return [record[4] for record in matches]
+
+    def best_fit(self, min_vcpus=0, min_ram=0, prefix='', where=None):
+        """Return the smallest item with at least min_vcpus and min_ram.
+
+        Smallest is fewest vcpus, then least ram. where is an optional
+        callable further restricting which items match. Returns None if no
+        item matches.
+        """
+        min_vcpus, min_ram = _number(min_vcpus), _number(min_ram)
+        start = bisect.bisect_left(self._vcpus, min_vcpus)
+        for record in itertools.islice(self._by_vcpus, start, None):
+            if (record[1] >= min_ram and record[2].startswith(prefix) and
+                    (where is None or where(record[4]))):
+                return record[4]
+        return None
+
+
+def _range(keys, minimum, maximum):
+    """Return (start, end) of the keys between minimum and maximum."""
+    return (bisect.bisect_left(keys, minimum),
+            bisect.bisect_right(keys, maximum) if maximum is not None
+            else len(keys))
@@ -3,24 +3,109 @@ try:
 except: # Python 2
     from argparse import Namespace as SimpleNamespace
 
+import threading
+
+from . import cache
 from . import endpoints
+from . import transport
 
 
 class APIConfig:
     """Config object with needed config values for accessing API."""
-    def __init__(self, url, token, cloud_credentials=None):
+    def __init__(self, url, token, cloud_credentials=None, schema_cache=None,
+                 pool_size=transport.DEFAULT_POOL_SIZE, keep_alive=True,
+                 conditional_requests=True, response_cache=None,
+                 retry_policy=None, circuit_breaker=None):
         self.url = url
         self.token = token
         # cloud_credentials is a dict
         self.cloud_credentials = cloud_credentials
+        # schema_cache is a cache.SchemaCache, if None the API schema is
+        # downloaded once per connection
+        self.schema_cache = schema_cache
+        # Max number of pooled connections kept open per host
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        # Whether to make conditional GET requests using ETag/Last-Modified
+        # validators of previous responses, on by default as in APIClient
+        self.conditional_requests = conditional_requests
+        # response_cache is a cache.ResponseCache for caching responses of
+        # endpoints with a cache_ttl, such as infrastructure endpoints
+        self.response_cache = response_cache
+        # retry_policy is a transport.RetryPolicy, if None failed requests
+        # aren't retried
+        self.retry_policy = retry_policy
+        # circuit_breaker is a transport.CircuitBreaker, possibly shared with
+        # other configs, that fails requests fast while the API is down
+        self.circuit_breaker = circuit_breaker
+        self._connection = None
+        self._connection_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """Return the APIConnection shared by endpoints using this config."""
+        with self._connection_lock:
+            if not self._connection:
+                self._connection = transport.APIConnection(self)
+            return self._connection
+
+    def close(self):
+        """Close the shared connection, if any."""
+        with self._connection_lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
 
 
 class APIClient:
 
-    def __init__(self, url=None, token=None, cloud_credentials=None):
+    def __init__(self, url=None, token=None, cloud_credentials=None,
+                 schema_cache=None, pool_size=transport.DEFAULT_POOL_SIZE,
+                 keep_alive=True, conditional_requests=True,
+                 response_cache=None, retry_policy=None,
+                 circuit_breaker=None):
+        """Create API client.
+
+        By default the API schema is cached on disk (see cache.SchemaCache).
+        Pass a SchemaCache instance as schema_cache to customize the cache or
+        schema_cache=False to download the schema once per client.
+
+        All endpoints of a client share one HTTP session with a pool of up to
+        pool_size connections. Call close() or use the client as a context
+        manager to release them.
+
+        With conditional_requests, the default, repeated GET requests for the
+        same URL send the validators of the previous response and unchanged
+        resources aren't downloaded again, which makes polling resources,
+        for example with APIResource.refresh(), cheap.
+
+        With a response_cache (cache.ResponseCache) read requests to endpoints
+        whose data rarely changes, such as clouds, regions, zones and vm
+        types, are served from the cache for the endpoint's cache_ttl.
+
+        Requests failing transiently are retried according to retry_policy,
+        by default a transport.RetryPolicy() retrying idempotent requests,
+        and requests to a CloudLaunch server that keeps failing fail fast
+        with a transport.CircuitOpenError according to circuit_breaker, by
+        default a transport.CircuitBreaker() of this client. Pass False to
+        disable either.
+        """
+        if schema_cache is None:
+            schema_cache = cache.SchemaCache()
+        if retry_policy is None:
+            retry_policy = transport.RetryPolicy()
+        if circuit_breaker is None:
+            circuit_breaker = transport.CircuitBreaker()
         # create config object from url and token (and optionally, credentials)
         config = APIConfig(url=url, token=token,
-                           cloud_credentials=cloud_credentials)
+                           cloud_credentials=cloud_credentials,
+                           schema_cache=schema_cache or None,
+                           pool_size=pool_size, keep_alive=keep_alive,
+                           conditional_requests=conditional_requests,
+                           response_cache=response_cache,
+                           retry_policy=retry_policy or None,
+                           circuit_breaker=circuit_breaker or None)
+        self.api_config = config
         self.deployments = endpoints.Deployments(config)
         self.applications = endpoints.Applications(config)
         self.auth = SimpleNamespace()
@@ -29,6 +114,60 @@ class APIClient:
         self.infrastructure = SimpleNamespace()
         self.infrastructure.clouds = endpoints.Clouds(config)
 
+    def close(self):
+        """Close pooled HTTP connections."""
+        self.api_config.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncAPIClient:
+    """Asyncio version of APIClient.
+
+    Has the same endpoints as APIClient but their methods are coroutines,
+    for example ``await client.deployments.get(id)``. Requires aiohttp.
+    """
+
+    def __init__(self, url=None, token=None, cloud_credentials=None,
+                 schema_cache=None, pool_size=transport.DEFAULT_POOL_SIZE,
+                 keep_alive=True):
+        # Imported here so aiohttp is only imported when needed
+        from . import async_endpoints
+        if schema_cache is None:
+            schema_cache = cache.SchemaCache()
+        config = APIConfig(url=url, token=token,
+                           cloud_credentials=cloud_credentials,
+                           schema_cache=schema_cache or None,
+                           pool_size=pool_size, keep_alive=keep_alive)
+        self.api_config = config
+        self.connection = async_endpoints.AsyncAPIConnection(config)
+
+        def endpoint(endpoint_type):
+            return async_endpoints.AsyncAPIEndpoint(endpoint_type,
+                                                    self.connection)
+
+        self.deployments = endpoint(endpoints.Deployments)
+        self.applications = endpoint(endpoints.Applications)
+        self.auth = SimpleNamespace()
+        self.auth.user = endpoint(endpoints.Users)
+        self.auth.user.credentials = endpoint(endpoints.Credentials)
+        self.infrastructure = SimpleNamespace()
+        self.infrastructure.clouds = endpoint(endpoints.Clouds)
+
+    async def close(self):
+        """Close the HTTP session."""
+        await self.connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
 
 # For testing purposes only
 if __name__ == '__main__':
@@ -1,18 +1,19 @@
 import abc
-
-try:
-    from urllib.parse import urlparse
-except ImportError:  # python 2
-    from urlparse import urlparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import threading
+from urllib.parse import parse_qs, urlencode, urlparse
 
 try:
     from types import SimpleNamespace
 except:  # Python 2
     from argparse import Namespace as SimpleNamespace
 
-import coreapi
-
 from . import resources
+from . import tracing
 
 
 class APIEndpoint(object):
@@ -46,6 +47,21 @@ class APIEndpoint(object):
         """Get a list of resources and return a list of APIResources."""
         pass
 
+    @abc.abstractmethod
+    def iter(self, page_size=None, limit=None, prefetch=None, compact=False,
+             **kwargs):
+        """Get resources page by page and return an iterator of APIResources.
+
+        Keyword arguments:
+        page_size -- number of resources to request per page
+        limit -- maximum number of resources to return
+        prefetch -- if set, the number of pages to fetch concurrently once
+                    the total number of resources is known
+        compact -- if set, return read-only CompactRecords instead of
+                   APIResources, sharing equal nested values between them
+        """
+        pass
+
     @abc.abstractmethod
     def create(self, **kwargs):
         """Create a resource and return an APIResource."""
@@ -80,79 +96,304 @@ class APIEndpoint(object):
         pass
 
 
+# Guards checking the properties of endpoint classes for subroutes
+_subroute_properties_lock = threading.Lock()
+
+
+class _Call(object):
+    """Call in progress of a SingleFlight."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key into one call.
+
+    While a call for a key is in progress, other calls for the same key wait
+    for it and get its result, or exception, instead of calling again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Call func unless a call for key is in progress.
+
+        Returns a (result, shared) tuple, shared being whether the result
+        was also returned to other callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        # No waiters are added once the call is removed
+        return call.result, call.waiters > 0
+
+
+# Read requests in progress, shared by all endpoints so that clients with
+# the same config, such as ones created for each deployment, share them too
+_reads_in_flight = SingleFlight()
+
+
+class subroute(object):
+    """Declare a subroute of an endpoint class.
+
+    For example, a Deployments endpoint with ``tasks = subroute(Tasks)``
+    has a Tasks endpoint, without a parent id, as its tasks attribute, and
+    subroutes() returns Tasks endpoints for given deployment ids.
+    """
+
+    def __init__(self, endpoint_type):
+        self.endpoint_type = endpoint_type
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        # Store endpoint in instance so later lookups don't get here
+        endpoint = instance.__dict__[self.name] = self.endpoint_type(
+            instance.api_config)
+        return endpoint
+
+
 class CoreAPIBasedAPIEndpoint(APIEndpoint):
 
     path = None
     id_param_name = 'id'
     parent_url_kwarg = None
     resource_type = resources.APIResource
-    _subroute_types = None
+    # Seconds to cache responses of read requests for, if the APIConfig has a
+    # response cache. None for endpoints whose data shouldn't be cached.
+    cache_ttl = None
+    # Number of parent ids for which subroute endpoints are kept
+    max_cached_subroutes = 256
+    # Dict of resource type to endpoint type of the subroutes of this class
+    _subroute_types = {}
+    # Names of properties that may return subroute endpoints, which are
+    # checked the first time subroutes() is called for this class
+    _subroute_properties = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._subroute_types = {}
+        cls._subroute_properties = []
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if isinstance(value, subroute):
+                    endpoint_type = value.endpoint_type
+                    cls._subroute_types[endpoint_type.resource_type] = \
+                        endpoint_type
+                elif isinstance(value, property):
+                    cls._subroute_properties.append(name)
 
     def __init__(self, api_config, parent_id=None, parent_url_kwargs=None):
         self.api_config = api_config
-        self.parent_url_kwargs = parent_url_kwargs if parent_url_kwargs else {}
+        # Copy parent_url_kwargs since the parent's dict is passed in and
+        # sibling subroutes set different ids
+        self.parent_url_kwargs = dict(parent_url_kwargs or {})
         # TODO: maybe warn if parent_id is specified but not parent_url_kwarg
         if parent_id and self.parent_url_kwarg:
             self.parent_url_kwargs[self.parent_url_kwarg] = parent_id
+        # Subroute endpoints by parent id, least recently used first
+        self._subroutes = collections.OrderedDict()
+        self._subroutes_lock = threading.Lock()
 
     def get(self, id, **kwargs):
-        document = self._create_client()
         params = self._create_params(id=id, **kwargs)
-        item = self._client.action(document, self.path + ['read'],
-                                   params=params)
-        return self._create_response(item)
+        item, shared = self._read('read', params)
+        return self._create_response(item, shared)
 
     def list(self, **kwargs):
-        document = self._create_client()
-        params = self._create_params(**kwargs)
-        items = self._client.action(document, self.path + ['list'],
-                                    params=params)
-        # TODO: return a wrapper that supports pagination
-        return [self._create_response(item) for item in items['results']]
+        return list(self.iter(**kwargs))
+
+    def iter(self, page_size=None, limit=None, prefetch=None, compact=False,
+             **kwargs):
+        if page_size:
+            kwargs['page_size'] = page_size
+        # Pages are only requested as the iterator is consumed and islice
+        # stops consuming once limit is reached
+        items = itertools.islice(
+            self._list_items(prefetch=prefetch, limit=limit, **kwargs), limit)
+        if compact:
+            # Records of a listing share equal nested values
+            shared_values = {}
+            return (self._create_record(item, shared_values)
+                    for item, _ in items)
+        return (self._create_response(item, shared) for item, shared in items)
 
     def create(self, **kwargs):
-        document = self._create_client()
         params = self._create_params(**kwargs)
-        item = self._client.action(document, self.path + ['create'],
-                                   params=params)
+        item = self._action('create', params)
         return self._create_response(item)
 
     def update(self, id, **kwargs):
-        document = self._create_client()
         params = self._create_params(id=id, **kwargs)
         # Turn off validation for update since in general the params include
         # all of a resource's fields, including ones that are read-only
-        item = self._client.action(document, self.path + ['update'],
-                                   params=params, validate=False)
+        item = self._action('update', params, validate=False)
         return self._create_response(item)
 
     def partial_update(self, id, **kwargs):
-        document = self._create_client()
         params = self._create_params(id=id, **kwargs)
-        item = self._client.action(document, self.path + ['partial_update'],
-                                   params=params)
+        item = self._action('partial_update', params)
         return self._create_response(item)
 
     def delete(self, id):
-        document = self._create_client()
         params = self._create_params(id=id)
-        self._client.action(document, self.path + ['delete'], params=params)
+        self._action('delete', params)
 
     def subroutes(self, id):
-        # Assume that attributes that are APIEndpoint instances are subroutes
-        if not self._subroute_types:
-            self._subroute_types = {}
-            for name in dir(self):
-                val = getattr(self, name)
-                if isinstance(val, APIEndpoint):
-                    self._subroute_types[val.resource_type] = val.__class__
-        subroutes = {}
-        for resource_type, endpoint_type in self._subroute_types.items():
-            subroutes[resource_type] = endpoint_type(
+        with self._subroutes_lock:
+            subroutes = self._subroutes.get(id)
+            if subroutes is not None:
+                self._subroutes.move_to_end(id)
+                return dict(subroutes)
+        subroutes = {
+            resource_type: endpoint_type(
                 self.api_config,
                 parent_id=id,
                 parent_url_kwargs=self.parent_url_kwargs)
-        return subroutes
+            for resource_type, endpoint_type
+            in self._get_subroute_types().items()
+        }
+        with self._subroutes_lock:
+            self._subroutes[id] = subroutes
+            while len(self._subroutes) > self.max_cached_subroutes:
+                self._subroutes.popitem(last=False)
+        return dict(subroutes)
+
+    def _get_subroute_types(self):
+        cls = type(self)
+        if cls._subroute_properties:
+            # Subroutes can also be properties returning an endpoint, which
+            # are found by getting each property once per class
+            with _subroute_properties_lock:
+                for name in cls._subroute_properties:
+                    value = getattr(self, name, None)
+                    if isinstance(value, APIEndpoint):
+                        cls._subroute_types[value.resource_type] = \
+                            value.__class__
+                cls._subroute_properties = []
+        return cls._subroute_types
+
+    def _list_items(self, prefetch=None, limit=None, **kwargs):
+        """Generate (data, shared) tuples of the items of a list, by page."""
+        params = self._create_params(**kwargs)
+        page, shared = self._read('list', params)
+        # Unpaginated list responses are a plain list of items
+        if not isinstance(page, dict):
+            for item in page:
+                yield item, shared
+            return
+        page_urls = _remaining_page_urls(page, limit) if prefetch else None
+        if page_urls is not None:
+            for item in page['results']:
+                yield item, shared
+            for results, shared in self._fetch_pages(page_urls, prefetch):
+                for item in results:
+                    yield item, shared
+            return
+        while True:
+            for item in page['results']:
+                yield item, shared
+            if not page.get('next'):
+                return
+            page, shared = self._get_page(page['next'])
+
+    def _fetch_pages(self, page_urls, max_workers):
+        """Fetch pages concurrently, generating (results, shared) in order.
+
+        At most twice max_workers pages are fetched ahead of the consumer.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+        page_urls = iter(page_urls)
+        pending = collections.deque(
+            executor.submit(self._get_page, url)
+            for url in itertools.islice(page_urls, max_workers * 2))
+        try:
+            while pending:
+                page, shared = pending.popleft().result()
+                for url in itertools.islice(page_urls, 1):
+                    pending.append(executor.submit(self._get_page, url))
+                yield page['results'], shared
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _action(self, action, params, **kwargs):
+        """Perform action on this endpoint and return the response data."""
+        document = self._create_client()
+        keys = self.path + [action]
+        with tracing.action(keys):
+            return self._client.action(document, keys, params=params,
+                                       **kwargs)
+
+    def _read(self, action, params):
+        """Perform a read only action and return (data, shared) tuple.
+
+        See _shared_read() for how the response is shared.
+        """
+        return self._shared_read([self.path, action, params],
+                                 lambda: self._action(action, params))
+
+    def _get_page(self, url):
+        """Get a page of a list and return (data, shared) tuple."""
+        def fetch():
+            self._create_client()
+            with tracing.action(self.path + ['list']):
+                return self._client.get(url)
+        return self._shared_read([url], fetch)
+
+    def _shared_read(self, key_parts, fetch):
+        """Return (data, shared) tuple of the response returned by fetch.
+
+        Concurrent identical reads share one request and its decoded
+        response, which is also cached if the response cache is enabled.
+        shared is whether the response may be returned to other callers too,
+        in which case it must not be modified.
+        """
+        credentials = self.api_config.cloud_credentials
+        headers = credentials.to_http_headers() if credentials else None
+        # Responses may differ by server, user and cloud credentials
+        key_parts = [self.api_config.url, self.api_config.token,
+                     headers] + key_parts
+        response_cache = self.api_config.response_cache
+        if self.cache_ttl and response_cache is not None:
+            def read():
+                return response_cache.get_or_fetch(key_parts, self.cache_ttl,
+                                                   fetch)
+        else:
+            read = fetch
+        data, shared = _reads_in_flight.do(
+            json.dumps(key_parts, sort_keys=True, default=str), read)
+        return data, shared or self._shares_responses()
 
     def _create_params(self, id=None, **kwargs):
         params = kwargs if kwargs else {}
@@ -162,29 +403,60 @@ class CoreAPIBasedAPIEndpoint(APIEndpoint):
             params.update(self.parent_url_kwargs)
         return params
 
-    def _create_response(self, data):
-        api_response = self.resource_type(data)
+    def _create_response(self, data, shared=False):
+        # Responses are decoded for each request, so resources can take
+        # ownership of them, unless they are shared with concurrent reads or
+        # through the cache
+        api_response = self.resource_type.from_response(
+            data, shared=shared or self._shares_responses())
         api_response.register_update_endpoint(self)
         return api_response
 
+    def _create_record(self, data, shared_values=None):
+        return resources.compact_record(self.resource_type, data,
+                                        shared_values)
+
+    def _shares_responses(self):
+        """Return whether read responses may be cached and returned again."""
+        return bool(self.cache_ttl and
+                    self.api_config.response_cache is not None)
+
     def _create_client(self):
-        url = self.api_config.url
-        auth_token = self.api_config.token
-        if not auth_token or not url:
-            raise Exception("Auth token and url are required.")
-        hostname = urlparse(url).netloc.split(":")[0]
-        http_headers = {}
-        if self.api_config.cloud_credentials:
-            http_headers = self.api_config.cloud_credentials.to_http_headers()
-        auth = coreapi.auth.TokenAuthentication(scheme='Token', token=auth_token)
-        custom_transports = [
-            coreapi.transports.HTTPTransport(
-                auth=auth,
-                headers=http_headers)
-        ]
-        self._client = coreapi.Client(transports=custom_transports)
-        url = url if url and url.endswith("/") else url + "/"
-        return self._client.get('{url}schema/'.format(url=url))
+        connection = self.api_config.connection
+        self._client = connection.client
+        return connection.schema()
+
+
+def _remaining_page_urls(page, limit=None):
+    """Return URLs of the pages after given page of a paginated list.
+
+    URLs are derived from the 'next' link and the total 'count' of the page,
+    for both page number and limit/offset pagination. Returns None if they
+    can't be determined.
+    """
+    count = page.get('count')
+    next_url = page.get('next')
+    page_length = len(page.get('results') or [])
+    if not count or not next_url or not page_length:
+        return None
+    if limit is not None:
+        count = min(count, limit)
+    url = urlparse(next_url)
+    query = parse_qs(url.query, keep_blank_values=True)
+
+    def page_url(name, value):
+        query[name] = [str(value)]
+        return url._replace(query=urlencode(query, doseq=True)).geturl()
+
+    if 'page' in query:
+        last_page = int(math.ceil(count / float(page_length)))
+        return [page_url('page', number)
+                for number in range(int(query['page'][0]), last_page + 1)]
+    if 'offset' in query:
+        return [page_url('offset', offset)
+                for offset in range(int(query['offset'][0]), count,
+                                    page_length)]
+    return None
 
 
 class DeploymentTasks(CoreAPIBasedAPIEndpoint):
@@ -198,13 +470,7 @@ class DeploymentTasks(CoreAPIBasedAPIEndpoint):
 class Deployments(CoreAPIBasedAPIEndpoint):
     path = ['deployments']
     resource_type = resources.Deployment
-    _tasks = None
-
-    @property
-    def tasks(self):
-        if not self._tasks:
-            self._tasks = DeploymentTasks(self.api_config)
-        return self._tasks
+    tasks = subroute(DeploymentTasks)
 
 
 class Users(CoreAPIBasedAPIEndpoint):
@@ -221,31 +487,12 @@ class Applications(CoreAPIBasedAPIEndpoint):
     id_param_name = 'slug'
 
 
-class Clouds(CoreAPIBasedAPIEndpoint):
-    path = ['infrastructure', 'clouds']
-    resource_type = resources.Cloud
-    id_param_name = 'id'
-    _regions = None
-
-    @property
-    def regions(self):
-        if not self._regions:
-            self._regions = Regions(self.api_config)
-        return self._regions
-
-
-class Regions(CoreAPIBasedAPIEndpoint):
-    path = ['infrastructure', 'clouds', 'regions']
-    resource_type = resources.Region
-    parent_url_kwarg = 'cloud_pk'
+class VmTypes(CoreAPIBasedAPIEndpoint):
+    path = ['infrastructure', 'clouds', 'regions', 'zones', 'compute', 'vm_types']
+    resource_type = resources.VmType
+    parent_url_kwarg = 'zone_pk'
     id_param_name = 'id'
-    _zones = None
-
-    @property
-    def zones(self):
-        if not self._zones:
-            self._zones = Zones(self.api_config)
-        return self._zones
+    cache_ttl = 24 * 60 * 60
 
 
 class Zones(CoreAPIBasedAPIEndpoint):
@@ -253,17 +500,22 @@ class Zones(CoreAPIBasedAPIEndpoint):
     resource_type = resources.Zone
     parent_url_kwarg = 'region_pk'
     id_param_name = 'id'
-    _vm_types = None
+    cache_ttl = 24 * 60 * 60
+    vm_types = subroute(VmTypes)
 
-    @property
-    def vm_types(self):
-        if not self._vm_types:
-            self._vm_types = VmTypes(self.api_config)
-        return self._vm_types
 
+class Regions(CoreAPIBasedAPIEndpoint):
+    path = ['infrastructure', 'clouds', 'regions']
+    resource_type = resources.Region
+    parent_url_kwarg = 'cloud_pk'
+    id_param_name = 'id'
+    cache_ttl = 24 * 60 * 60
+    zones = subroute(Zones)
 
-class VmTypes(CoreAPIBasedAPIEndpoint):
-    path = ['infrastructure', 'clouds', 'regions', 'zones', 'compute', 'vm_types']
-    resource_type = resources.VmType
-    parent_url_kwarg = 'zone_pk'
+
+class Clouds(CoreAPIBasedAPIEndpoint):
+    path = ['infrastructure', 'clouds']
+    resource_type = resources.Cloud
     id_param_name = 'id'
+    cache_ttl = 60 * 60
+    regions = subroute(Regions)
@@ -0,0 +1,361 @@
+"""Prometheus metrics of the API calls made by API clients.
+
+Programs that use the API package, such as long running automation, can
+call enable() to collect metrics of all API clients of the process and
+export them in the Prometheus text format (or OpenMetrics) with
+start_http_server() or write_textfile(), the latter for the textfile
+collector of the Prometheus node exporter::
+
+    metrics.enable()
+    metrics.start_http_server(9464)
+
+The metrics, labelled by endpoint (e.g. ``deployments.tasks``) and action
+(e.g. ``create``), are:
+
+- cloudlaunch_client_requests_total: requests by method and status, or the
+  name of the exception if the request failed
+- cloudlaunch_client_request_duration_seconds: histogram of request latency,
+  from sending the request to receiving the whole response
+- cloudlaunch_client_request_phase_seconds_total: time spent in each phase
+  of requests (dns, connect, tls, ttfb, transfer, decode and backoff before
+  retries), which tells apart time spent in the network, by the server
+  (ttfb) and by the client
+- cloudlaunch_client_response_bytes_total: size of response bodies
+- cloudlaunch_client_retries_total: requests retried
+- cloudlaunch_client_cache_lookups_total: lookups in the schema, response
+  and conditional request caches by result (hit or miss), from which hit
+  ratios can be computed
+
+Requests are observed through the hooks of the tracing module. This module
+only uses the standard library so that it's cheap to import.
+"""
+import abc
+import math
+import os
+import threading
+
+from . import tracing
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = ('application/openmetrics-text; version=1.0.0; '
+                            'charset=utf-8')
+
+_active = None
+_lock = threading.Lock()
+
+
+class Metric(abc.ABC):
+    """Family of samples of one metric, by label values."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Maps tuples of label values to values
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def samples(self):
+        """Return list of (suffix, labels, value) tuples."""
+        pass
+
+    def _labels(self, values, extra=()):
+        return tuple(zip(self.labelnames, values)) + tuple(extra)
+
+
+class Counter(Metric):
+    """Value that only goes up, exposed with a _total suffix."""
+
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [('_total', self._labels(labels), value)
+                for labels, value in values]
+
+
+class Histogram(Metric):
+    """Counts of observed values in cumulative buckets, with their sum."""
+
+    type = 'histogram'
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0,
+                       2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, labels, value):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # Count per bucket, followed by the sum of values
+                counts = self._values[labels] = [0] * len(self.buckets) + [0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def get(self, labels=()):
+        """Return (count, sum) of values observed with labels."""
+        counts = self._values.get(labels)
+        if counts is None:
+            return 0, 0
+        return sum(counts[:-1]), counts[-1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts))
+                            for labels, counts in self._values.items())
+        samples = []
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(('_bucket', self._labels(
+                    labels, [('le', _format_value(bound))]), cumulative))
+            samples.append(('_count', self._labels(labels), cumulative))
+            samples.append(('_sum', self._labels(labels), counts[-1]))
+        return samples
+
+
+class ClientMetrics(object):
+    """Metrics of the requests made by API clients."""
+
+    def __init__(self, prefix='cloudlaunch_client'):
+        def name(suffix):
+            return '{prefix}_{suffix}'.format(prefix=prefix, suffix=suffix)
+
+        self.requests = Counter(
+            name('requests'), 'Requests made to the CloudLaunch API.',
+            ['endpoint', 'action', 'method', 'status'])
+        self.request_duration = Histogram(
+            name('request_duration_seconds'),
+            'Latency of requests made to the CloudLaunch API.',
+            ['endpoint', 'action'])
+        self.request_phases = Counter(
+            name('request_phase_seconds'),
+            'Time spent in each phase of requests.',
+            ['endpoint', 'action', 'phase'])
+        self.response_bytes = Counter(
+            name('response_bytes'), 'Size of response bodies.',
+            ['endpoint', 'action'])
+        self.retries = Counter(
+            name('retries'), 'Requests retried.', ['endpoint', 'action'])
+        self.cache_lookups = Counter(
+            name('cache_lookups'), 'Lookups in client side caches.',
+            ['cache', 'result'])
+        self.metrics = [self.requests, self.request_duration,
+                        self.request_phases, self.response_bytes,
+                        self.retries, self.cache_lookups]
+
+    def observe_request(self, request):
+        """Update metrics with a finished tracing.RequestTrace."""
+        path = request.action or ['']
+        endpoint = '.'.join(path[:-1])
+        action = path[-1]
+        status = request.error or str(request.status)
+        self.requests.inc((endpoint, action, request.method, status))
+        self.request_duration.observe((endpoint, action), request.duration)
+        for phase, seconds in request.timings.items():
+            self.request_phases.inc((endpoint, action, phase), seconds)
+        if request.bytes:
+            self.response_bytes.inc((endpoint, action), request.bytes)
+        if request.retries:
+            self.retries.inc((endpoint, action), request.retries)
+        if request.validator_lookup:
+            self.cache_lookups.inc(('conditional', 'hit'
+                                    if request.not_modified else 'miss'))
+
+    def exposition(self, openmetrics=False):
+        """Return the metrics in the Prometheus text format or OpenMetrics."""
+        lines = []
+        for metric in self.metrics:
+            name = metric.name
+            if metric.type == 'counter' and not openmetrics:
+                name += '_total'
+            lines.append('# HELP {name} {doc}'.format(
+                name=name, doc=_escape(metric.documentation)))
+            lines.append('# TYPE {name} {type}'.format(
+                name=name, type=metric.type))
+            for suffix, labels, value in metric.samples():
+                lines.append('{name}{suffix}{labels} {value}'.format(
+                    name=metric.name, suffix=suffix,
+                    labels=_format_labels(labels),
+                    value=_format_value(value)))
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value, quote=False):
+    value = value.replace('\\', r'\\').replace('\n', r'\n')
+    if quote:
+        value = value.replace('"', r'\"')
+    return value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{name}="{value}"'.format(
+        name=name, value=_escape(value, quote=True))
+        for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def enable(metrics=None):
+    """Start collecting metrics of API requests and return the ClientMetrics.
+
+    Replaces the metrics previously enabled, if any.
+    """
+    global _active
+    with _lock:
+        if _active is not None:
+            tracing.remove_listener(_active.observe_request)
+        _active = metrics or ClientMetrics()
+        tracing.add_listener(_active.observe_request)
+        return _active
+
+
+def disable():
+    """Stop collecting metrics and return the ClientMetrics, if any."""
+    global _active
+    with _lock:
+        metrics, _active = _active, None
+        if metrics is not None:
+            tracing.remove_listener(metrics.observe_request)
+        return metrics
+
+
+def current():
+    """Return the enabled ClientMetrics or None."""
+    return _active
+
+
+def cache_lookup(cache, hit):
+    """Count a lookup in the named client side cache, if metrics are enabled.
+    """
+    metrics = _active
+    if metrics is not None:
+        metrics.cache_lookups.inc((cache, 'hit' if hit else 'miss'))
+
+
+def write_textfile(path, metrics=None):
+    """Write metrics to path in the Prometheus text format.
+
+    The file is replaced atomically, as required by the textfile collector
+    of the node exporter. Call this periodically to keep the file current.
+    """
+    metrics = metrics or _active or ClientMetrics()
+    tmp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(metrics.exposition())
+    os.replace(tmp_path, path)
+
+
+def _create_http_server(host, port, metrics):
+    # http.server is slow to import and only needed to serve metrics, so
+    # it's imported when a server is created
+    import http.server
+    import socketserver
+
+    class HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            current = metrics or _active or ClientMetrics()
+            openmetrics = ('application/openmetrics-text' in
+                           self.headers.get('Accept', ''))
+            body = current.exposition(openmetrics=openmetrics).encode(
+                'utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE
+                             if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes shouldn't clutter the output of the program
+            pass
+
+    return HTTPServer((host, port), MetricsHandler)
+
+
+class MetricsServer(object):
+    """HTTP server exposing metrics at /metrics from a background thread.
+
+    Serves the given ClientMetrics or, by default, the enabled ones. The
+    server is started by start() or on entering a with block, and stopped
+    on leaving it.
+    """
+
+    def __init__(self, port=0, host='127.0.0.1', metrics=None):
+        self._httpd = _create_http_server(host, port, metrics)
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    @property
+    def url(self):
+        host, port = self.address[:2]
+        return 'http://{host}:{port}/metrics'.format(host=host, port=port)
+
+    def start(self):
+        """Serve requests on a background thread, if not already started."""
+        if self._thread:
+            return self
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def start_http_server(port=0, host='127.0.0.1', metrics=None):
+    """Start and return a MetricsServer on host and port.
+
+    Listens on localhost by default. Port 0 picks a free port, see the
+    server's url.
+    """
+    return MetricsServer(port, host, metrics).start()
@@ -1,4 +1,6 @@
 import copy
+import inspect
+import keyword
 
 
 class APIResource(object):
@@ -11,34 +13,88 @@ class APIResource(object):
     data_mappings = {}
     _id = None
     _data = None
+    # Whether _data may be used elsewhere, in which case it is copied before
+    # it is changed
+    _shared = False
+    # Whether values nested in _data may be used elsewhere
+    _nested_shared = False
+    # Names of data_mappings fields whose values have been mapped
+    _mapped = frozenset()
     _update_endpoint = None
+    # Resource this resource is a data_mappings field of, whose endpoint's
+    # subroute is this resource's update endpoint
+    _parent = None
 
     def __init__(self, data=None):
-        self._id = data.get(self.id_field_name)
         # Copy data so updates don't affect the passed in dict
-        self._data = self._apply_data_mappings(copy.deepcopy(data))
-
-    def _apply_data_mappings(self, data):
-        """Subclasses should apply necessary data mappings."""
-        for k, v in self.data_mappings.items():
-            if k in data:
-                if isinstance(data[k], list):
-                    data[k] = [v(item) for item in data[k]]
-                else:
-                    data[k] = v(data[k])
-        return data
+        self._wrap(copy.deepcopy(data), shared=False)
+
+    @classmethod
+    def from_response(cls, data, shared=False):
+        """Create resource from decoded response data without copying it.
+
+        Unless shared, the resource takes ownership of data and changes to
+        the resource change data. If shared, data may also be used elsewhere,
+        for example by a response cache, and is copied the first time an
+        attribute of the resource is set. Values nested in shared data must
+        not be modified in place.
+        """
+        resource = cls.__new__(cls)
+        resource._wrap(data, shared)
+        return resource
+
+    def _wrap(self, data, shared):
+        # data_mappings are applied when their field is first accessed
+        self._id = data.get(self.id_field_name)
+        self._data = data
+        self._shared = shared
+        self._nested_shared = shared
+
+    def _map_field(self, name, value):
+        """Apply the data mapping of field name and store the result."""
+        mapping = self.data_mappings[name]
+        if isinstance(value, list):
+            value = [self._map_value(mapping, item) for item in value]
+        elif value is not None:
+            value = self._map_value(mapping, value)
+        if self._shared:
+            self._copy_data()
+        self._data[name] = value
+        self._mapped = self._mapped | {name}
+        return value
+
+    def _map_value(self, mapping, value):
+        if isinstance(mapping, type) and issubclass(mapping, APIResource):
+            # The value is either owned by this resource or shared, so it
+            # doesn't need to be copied again
+            child = mapping.from_response(value, shared=self._nested_shared)
+            child._parent = self
+            return child
+        return mapping(value)
+
+    def _copy_data(self):
+        object.__setattr__(self, '_data', dict(self._data))
+        object.__setattr__(self, '_shared', False)
+
+    def _get_update_endpoint(self):
+        """Return update endpoint, resolving it from the parent if needed."""
+        if self._update_endpoint is None and self._parent is not None:
+            parent_endpoint = self._parent._get_update_endpoint()
+            if parent_endpoint is not None:
+                self._update_endpoint = self._parent.subroute_for(type(self))
+        return self._update_endpoint
 
     def update(self, **kwargs):
         """Update this instance, applying kwargs to data before updating."""
-        if not self._update_endpoint:
+        update_endpoint = self._get_update_endpoint()
+        if not update_endpoint:
             raise Exception("No endpoint for updating instance")
         data = self.asdict()
         data.update(kwargs)
         # Remove 'id' item from data dict so it's not specified twice
         del data['id']
-        api_response = self._update_endpoint.update(self.id, **data)
-        self._data = api_response._data
-        return api_response
+        api_response = update_endpoint.update(self.id, **data)
+        return self._apply_update(api_response)
 
     def partial_update(self, **kwargs):
         """Update this instance using the values specified in kwargs.
@@ -46,17 +102,53 @@ class APIResource(object):
         NOTE: this doesn't apply any updates that have been made to the data
         attribute.
         """
-        if not self._update_endpoint:
+        update_endpoint = self._get_update_endpoint()
+        if not update_endpoint:
             raise Exception("No endpoint for updating instance")
-        api_response = self._update_endpoint.partial_update(self.id, **kwargs)
-        self._data = api_response._data
-        return api_response
+        api_response = update_endpoint.partial_update(self.id, **kwargs)
+        return self._apply_update(api_response)
+
+    def refresh(self):
+        """Reload the data of this instance from the API, in place.
+
+        Changes to the data that haven't been saved are discarded. Returns
+        the resource returned by the endpoint, like update(), or with an
+        asynchronous endpoint an awaitable.
+        """
+        update_endpoint = self._get_update_endpoint()
+        if not update_endpoint:
+            raise Exception("No endpoint for refreshing instance")
+        return self._apply_update(update_endpoint.get(self.id))
 
     def delete(self):
-        """Delete this instance."""
-        if not self._update_endpoint:
+        """Delete this instance.
+
+        With an asynchronous endpoint this returns an awaitable.
+        """
+        update_endpoint = self._get_update_endpoint()
+        if not update_endpoint:
             raise Exception("No endpoint for deleting instance")
-        self._update_endpoint.delete(self.id)
+        return update_endpoint.delete(self.id)
+
+    def _apply_update(self, api_response):
+        """Apply the data of an updated resource returned by the endpoint.
+
+        Asynchronous endpoints return an awaitable, in which case an awaitable
+        that applies the update once the response arrives is returned.
+        """
+        if inspect.isawaitable(api_response):
+            return self._apply_async_update(api_response)
+        self._take_data(api_response)
+        return api_response
+
+    async def _apply_async_update(self, awaitable):
+        api_response = await awaitable
+        self._take_data(api_response)
+        return api_response
+
+    def _take_data(self, resource):
+        for name in ('_data', '_shared', '_nested_shared', '_mapped'):
+            object.__setattr__(self, name, getattr(resource, name))
 
     @property
     def id(self):
@@ -67,13 +159,21 @@ class APIResource(object):
         if name == '_data':
             raise AttributeError
         try:
-            return self._data[name]
+            value = self._data[name]
         except KeyError:
             raise AttributeError
+        if name in self.data_mappings and name not in self._mapped:
+            return self._map_field(name, value)
+        return value
 
     def __setattr__(self, name, value):
         if not hasattr(APIResource, name) and hasattr(self, '_data'):
+            if self._shared:
+                self._copy_data()
             self._data[name] = value
+            if name in self.data_mappings:
+                # Values that are set are used as they are
+                self._mapped = self._mapped | {name}
         else:
             object.__setattr__(self, name, value)
 
@@ -85,23 +185,30 @@ class APIResource(object):
             # Skip over subroute endpoint instances
             if isinstance(v, endpoints.APIEndpoint):
                 continue
-            if isinstance(v, APIResource):
-                d[k] = v.asdict()
-            else:
-                d[k] = v
+            # Mapped fields that haven't been accessed are still raw data
+            d[k] = _resource_asdict(v)
         return d
 
     def register_update_endpoint(self, update_endpoint):
-        """Register endpoint for updating this resource and child resources."""
+        """Register endpoint for updating this resource and child resources.
+
+        The endpoints of child resources are subroutes of update_endpoint,
+        which are only created when needed.
+        """
         self._update_endpoint = update_endpoint
-        for name, mapped_type in self.data_mappings.items():
-            attr = getattr(self, name)
-            if isinstance(attr, APIResource):
-                attr.register_update_endpoint(self.subroute_for(mapped_type))
 
     def subroute_for(self, resource_type):
         """Get a subroute of the update endpoint for given resource type."""
-        return self._update_endpoint.subroutes(self.id).get(resource_type)
+        return self._get_update_endpoint().subroutes(self.id).get(
+            resource_type)
+
+
+def _resource_asdict(value):
+    if isinstance(value, APIResource):
+        return value.asdict()
+    if isinstance(value, list):
+        return [_resource_asdict(item) for item in value]
+    return value
 
 
 class Task(APIResource):
@@ -200,3 +307,158 @@ class Application(APIResource):
 
 class VmType(APIResource):
     id_field_name = 'id'
+
+
+class CompactRecord(object):
+    """Read-only record of a resource's data with a slot per field.
+
+    Records use much less memory than APIResources and have faster
+    attribute access, which suits holding large read-only listings. They
+    have no endpoint, so they can't be updated and have no subroutes.
+    Create them with compact_record().
+    """
+
+    __slots__ = ('_id', '_extra')
+    resource_type = APIResource
+    # Tuple of (key, slot name) of the data fields stored in slots. Keys that
+    # aren't identifiers are stored in the _extra dict instead.
+    _fields = ()
+    # Tuple of (key, slot setter or None, data mapping or None) used to fill
+    # in records from data
+    _plan = ()
+
+    @property
+    def id(self):
+        """Return identifier of this resource."""
+        return self._id
+
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, '_extra')[name]
+        except (AttributeError, KeyError, TypeError):
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{type} records are read-only".format(
+            type=self.resource_type.__name__))
+
+    def __repr__(self):
+        return "<{type} {id!r}>".format(type=type(self).__name__, id=self._id)
+
+    def asdict(self):
+        """Convert record into data dictionary."""
+        d = {key: _record_asdict(getattr(self, slot))
+             for key, slot in self._fields}
+        for key, value in (self._extra or {}).items():
+            d[key] = _record_asdict(value)
+        return d
+
+    def subroute_for(self, resource_type):
+        raise Exception("Compact records have no endpoints")
+
+
+CompactRecord._set_id = CompactRecord._id.__set__
+CompactRecord._set_extra = CompactRecord._extra.__set__
+
+
+def _record_asdict(value):
+    if isinstance(value, CompactRecord):
+        return value.asdict()
+    if isinstance(value, list):
+        return [_record_asdict(item) for item in value]
+    return value
+
+
+# Record types by resource type and data keys
+_record_types = {}
+
+# Max number of distinct values kept in the shared_values of a listing
+MAX_SHARED_VALUES = 256
+
+
+def compact_record(resource_type, data, shared_values=None):
+    """Create a CompactRecord of resource_type from response data.
+
+    A record type is generated for each resource type and set of data keys,
+    with a slot per field and the properties of the resource type. The
+    values of data_mappings fields are also made compact records.
+
+    shared_values is an optional dict, used for all the records of a
+    listing, in which equal nested values (such as the deployment target of
+    deployments) are kept so that records store them only once. Only the
+    unmapped fields of the listed resources are shared, not the payloads of
+    their data_mappings fields, such as task results, which are rarely
+    equal, and at most MAX_SHARED_VALUES values are kept.
+    """
+    keys = tuple(data)
+    record_type = _record_types.get((resource_type, keys))
+    if record_type is None:
+        record_type = _record_types[(resource_type, keys)] = \
+            _create_record_type(resource_type, keys)
+    record = object.__new__(record_type)
+    record_type._set_id(record, data.get(resource_type.id_field_name))
+    extra = None
+    for key, set_value, mapping in record_type._plan:
+        value = data[key]
+        if mapping is not None:
+            value = _compact_mapped(mapping, value)
+        elif shared_values is not None and isinstance(value, (dict, list)):
+            # The repr of decoded JSON values identifies them and is faster
+            # to compute than serializing them
+            value_key = repr(value)
+            if len(shared_values) < MAX_SHARED_VALUES:
+                value = shared_values.setdefault(value_key, value)
+            else:
+                value = shared_values.get(value_key, value)
+        if set_value is not None:
+            set_value(record, value)
+        else:
+            extra = extra or {}
+            extra[key] = value
+    record_type._set_extra(record, extra)
+    return record
+
+
+def _compact_mapped(mapping, value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [_compact_mapped(mapping, item) for item in value]
+    if isinstance(mapping, type) and issubclass(mapping, APIResource):
+        return compact_record(mapping, value)
+    return mapping(value)
+
+
+def _create_record_type(resource_type, keys):
+    # As with resources, attributes of the resource type take precedence over
+    # data fields, whose slots are then given a private name
+    reserved = set(dir(resource_type)) | set(dir(CompactRecord))
+    fields = []
+    for key in keys:
+        if not key.isidentifier() or keyword.iskeyword(key):
+            continue
+        if key in reserved or key.startswith('_'):
+            fields.append((key, '_field_' + key))
+        else:
+            fields.append((key, key))
+    namespace = {
+        '__slots__': tuple(slot for key, slot in fields),
+        '_fields': tuple(fields),
+        'resource_type': resource_type,
+    }
+    # Computed properties, such as Deployment.public_ip, work the same way
+    # on records
+    for cls in reversed(resource_type.__mro__):
+        for name, value in vars(cls).items():
+            if isinstance(value, property) and name != 'id':
+                namespace[name] = value
+    record_type = type(resource_type.__name__ + 'Record', (CompactRecord,),
+                       namespace)
+    # Setters of the slot descriptors, which are faster than setattr
+    slots = dict(fields)
+    record_type._plan = tuple(
+        (key,
+         getattr(record_type, slots[key]).__set__ if key in slots else None,
+         resource_type.data_mappings.get(key))
+        for key in keys)
+    return record_type
@@ -0,0 +1,351 @@
+"""Trace where API calls spend their time.
+
+While a Trace is active (see start() and trace()), every HTTP request made by
+API clients is recorded with the endpoint action it was made for, its
+status, size and the time spent resolving the host name, connecting,
+negotiating TLS, waiting for the first byte of the response, transferring the
+response and decoding it. Named spans, such as fetching the API schema or
+rendering output, are recorded too.
+
+One Trace collects the requests of all threads. The request and spans in
+progress are tracked per thread, so connection level timings are attributed
+to the right request. Listeners added with add_listener(), such as the
+metrics module, are also given each finished request, once its response is
+decoded, whether or not a trace is active. When neither a trace nor
+listeners are active the hooks return immediately.
+
+This module only uses the standard library so that it's cheap to import.
+"""
+import collections
+import contextlib
+import threading
+import time
+
+# Phases of a request, in the order they happen, and the time spent waiting
+# to retry it
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer', 'decode', 'backoff')
+
+_active = None
+_listeners = []
+_local = threading.local()
+
+
+class RequestTrace(object):
+    """Timings of one HTTP request."""
+
+    def __init__(self, method, url, action=None):
+        self.method = method
+        self.url = url
+        # Path of the endpoint action, e.g. ['deployments', 'list']
+        self.action = action
+        self.status = None
+        self.bytes = 0
+        self.not_modified = False
+        # Whether validators of a previous response were looked up for the
+        # request, and whether it was made conditional with them
+        self.validator_lookup = False
+        self.conditional = False
+        self.retries = 0
+        self.error = None
+        # Seconds spent in each phase of PHASES
+        self.timings = collections.OrderedDict()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def record(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def asdict(self):
+        return {
+            'method': self.method,
+            'url': self.url,
+            'action': self.action,
+            'status': self.status,
+            'bytes': self.bytes,
+            'not_modified': self.not_modified,
+            'validator_lookup': self.validator_lookup,
+            'conditional': self.conditional,
+            'retries': self.retries,
+            'error': self.error,
+            'timings': dict(self.timings),
+            'duration': self.duration,
+        }
+
+
+class Span(object):
+    """Named section of a trace, such as fetching the schema."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = None
+        # Seconds of the span spent in requests made on the span's thread
+        self.request_time = 0
+
+
+class Trace(object):
+    """Requests and spans recorded while the trace is active."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.requests = []
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def _add_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def _add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def report(self):
+        """Return text report of the time spent in requests and spans."""
+        with self._lock:
+            requests = list(self.requests)
+            spans = list(self.spans)
+        lines = ["Timings: {total} total, {count} request(s), "
+                 "{size} received".format(
+                     total=_ms(self.duration), count=len(requests),
+                     size=_size(sum(r.bytes for r in requests)))]
+        names = collections.OrderedDict()
+        for span in spans:
+            names.setdefault(span.name, []).append(span)
+        for name, named_spans in names.items():
+            duration = sum(span.duration for span in named_spans)
+            request_time = sum(span.request_time for span in named_spans)
+            line = "  {name:12s} {duration:>10s}".format(
+                name=name, duration=_ms(duration))
+            if request_time:
+                line += "  ({self_time} excluding requests)".format(
+                    self_time=_ms(duration - request_time))
+            lines.append(line)
+        if requests:
+            phases = "  ".join(
+                "{phase} {time}".format(phase=phase, time=_ms(
+                    sum(r.timings.get(phase, 0) for r in requests)))
+                for phase in PHASES
+                if any(phase in r.timings for r in requests))
+            lines.append("  {name:12s} {duration:>10s}  {phases}".format(
+                name='requests', phases=phases, duration=_ms(
+                    sum(r.duration or 0 for r in requests))))
+            lines.append("")
+            for request in requests:
+                lines.append(_format_request(request))
+        return "\n".join(lines)
+
+
+def _format_request(request):
+    action = ('.'.join(request.action) if request.action
+              else request.url)
+    status = request.error or (
+        '304' if request.not_modified else str(request.status))
+    phases = " ".join(
+        "{phase}={time}".format(phase=phase, time=_ms(seconds))
+        for phase, seconds in request.timings.items())
+    return "  {method:6s} {status:4s} {duration:>9s} {size:>9s}  {action}  " \
+        "{phases}".format(method=request.method, status=status,
+                          duration=_ms(request.duration or 0),
+                          size=_size(request.bytes), action=action,
+                          phases=phases)
+
+
+def _ms(seconds):
+    return "{ms:.1f}ms".format(ms=seconds * 1000)
+
+
+def _size(size):
+    if size < 1024:
+        return "{size}B".format(size=size)
+    return "{size:.1f}KB".format(size=size / 1024.0)
+
+
+def start():
+    """Start a new Trace, which becomes the active trace, and return it."""
+    global _active
+    _active = Trace()
+    return _active
+
+
+def stop():
+    """Stop the active trace, if any, and return it."""
+    global _active
+    trace, _active = _active, None
+    if trace:
+        trace.finished = time.perf_counter()
+    return trace
+
+
+def current():
+    """Return the active Trace or None."""
+    return _active
+
+
+def enabled():
+    """Return whether requests are recorded, by a trace or listeners."""
+    return _active is not None or bool(_listeners)
+
+
+def add_listener(listener):
+    """Call listener with each finished RequestTrace.
+
+    Listeners are called on the thread that made the request, after the
+    response body is decoded so that the decode time is included.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+@contextlib.contextmanager
+def trace():
+    """Trace requests made within the block and yield the Trace."""
+    active = start()
+    try:
+        yield active
+    finally:
+        stop()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Record the time spent in the block as a Span of the active trace."""
+    trace = _active
+    if trace is None:
+        yield
+        return
+    spans = _thread_spans()
+    current_span = Span(name)
+    spans.append(current_span)
+    try:
+        yield
+    finally:
+        spans.pop()
+        current_span.duration = time.perf_counter() - current_span.started
+        trace._add_span(current_span)
+
+
+@contextlib.contextmanager
+def action(path):
+    """Attribute requests made within the block to an endpoint action."""
+    if not enabled():
+        yield
+        return
+    previous = getattr(_local, 'action', None)
+    _local.action = path
+    try:
+        yield
+    finally:
+        _local.action = previous
+
+
+def begin_request(method, url):
+    """Start tracing a request made by this thread.
+
+    Returns its RequestTrace, or None if requests aren't recorded.
+    """
+    if not enabled():
+        return None
+    # A response that wasn't decoded by now won't be
+    _notify_undecoded()
+    request = RequestTrace(method, url, getattr(_local, 'action', None))
+    _local.request = request
+    _local.undecoded = None
+    return request
+
+
+def end_request(request, response=None, error=None):
+    """Finish tracing a request started with begin_request()."""
+    request.duration = time.perf_counter() - request.started
+    if response is not None:
+        request.status = response.status_code
+        request.not_modified = getattr(response, 'not_modified', False)
+    if error is not None:
+        request.error = type(error).__name__
+    _local.request = None
+    _add_request_time(request.duration)
+    trace = _active
+    if trace is not None:
+        trace._add_request(request)
+    if request.bytes or request.not_modified:
+        # Response bodies are decoded after the request is finished, so
+        # listeners are called by TimedCodec or the next request
+        _local.undecoded = request
+    else:
+        _notify(request)
+
+
+def _notify_undecoded():
+    request = getattr(_local, 'undecoded', None)
+    if request is not None:
+        _local.undecoded = None
+        _notify(request)
+
+
+def _notify(request):
+    for listener in list(_listeners):
+        listener(request)
+
+
+def record(phase, seconds):
+    """Add seconds spent in phase to the request in progress, if any."""
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request.record(phase, seconds)
+
+
+def _add_request_time(seconds):
+    for open_span in _thread_spans():
+        open_span.request_time += seconds
+
+
+def _thread_spans():
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        spans = _local.spans = []
+    return spans
+
+
+class TimedCodec(object):
+    """Wrap a coreapi codec to time decoding of responses.
+
+    Decoding time is added to the last request of the thread, or recorded as
+    a 'decode' span if the content didn't come from a request, for example
+    a schema read from the cache.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+
+    def __getattr__(self, name):
+        return getattr(self.codec, name)
+
+    def decode(self, *args, **kwargs):
+        if not enabled():
+            return self.codec.decode(*args, **kwargs)
+        request = getattr(_local, 'undecoded', None)
+        _local.undecoded = None
+        if request is None:
+            with span('decode'):
+                return self.codec.decode(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return self.codec.decode(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            request.record('decode', seconds)
+            _add_request_time(seconds)
+            _notify(request)
+
+    def load(self, *args, **kwargs):
+        # Older name of decode(), which coreapi still calls
+        return self.decode(*args, **kwargs)
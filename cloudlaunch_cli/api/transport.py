@@ -0,0 +1,471 @@
+"""HTTP session management for the CloudLaunch API client."""
+import collections
+import email.utils
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import coreapi
+import requests
+import urllib3
+
+from . import tracing
+
+DEFAULT_POOL_SIZE = 10
+
+# Response validators and body of a GET response
+ValidatorEntry = collections.namedtuple(
+    'ValidatorEntry', ['etag', 'last_modified', 'content_type', 'content'])
+
+
+class ValidatorCache(object):
+    """Bounded LRU store of GET response validators and bodies by URL.
+
+    Holds at most max_entries entries whose bodies take at most max_size
+    bytes in total. Responses with larger bodies aren't stored.
+    """
+
+    DEFAULT_MAX_ENTRIES = 512
+    DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_size=DEFAULT_MAX_SIZE):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                self._entries.move_to_end(url)
+            return entry
+
+    def set(self, url, entry):
+        with self._lock:
+            self._remove(url)
+            if len(entry.content) > self.max_size:
+                return
+            self._entries[url] = entry
+            self._size += len(entry.content)
+            while (len(self._entries) > self.max_entries or
+                   self._size > self.max_size):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+
+    def discard(self, url):
+        with self._lock:
+            self._remove(url)
+
+    def _remove(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._size -= len(entry.content)
+
+
+class RetryPolicy(object):
+    """When and how to retry requests that failed transiently.
+
+    Requests are retried after connection errors, timeouts and responses
+    with one of the given statuses, up to max_retries times. Only requests
+    with idempotent methods are retried by default; requests of create
+    actions (POST) are retried only with retry_create, since retrying them
+    may create a resource twice.
+
+    Retries are delayed by exponential backoff with full jitter, a random
+    time between 0 and backoff * 2 ** retry seconds, capped at max_backoff.
+    The delay asked for by the Retry-After header of a response is used
+    instead, unless it's longer than max_backoff, in which case the response
+    is returned without retrying.
+    """
+
+    # Partial updates set fields to the given values, so they're idempotent
+    # too
+    IDEMPOTENT_METHODS = frozenset(
+        ['GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'])
+    STATUSES = frozenset([429, 502, 503, 504])
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30,
+                 retry_create=False, statuses=STATUSES):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = self.IDEMPOTENT_METHODS
+        if retry_create:
+            self.methods = self.methods | {'POST'}
+        self.statuses = frozenset(statuses)
+
+    def allows(self, method, retries):
+        """Return whether a request that has been retried can be again."""
+        return retries < self.max_retries and method in self.methods
+
+    def delay(self, retries, response=None):
+        """Return seconds to wait before the next retry, None to give up."""
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_backoff else None
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** retries))
+
+
+def _retry_after(response):
+    """Return seconds to wait given by the Retry-After header, if any."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, date.timestamp() - time.time())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request to a host that keeps failing."""
+
+
+class CircuitBreaker(object):
+    """Fail fast when a host keeps failing.
+
+    After failure_threshold consecutive failed requests to a host its circuit
+    opens and requests to it raise CircuitOpenError without being made.
+    reset_timeout seconds later a single trial request is let through: if it
+    succeeds the circuit closes again, otherwise it stays open for another
+    reset_timeout. Connection errors, timeouts and responses with one of
+    FAILURE_STATUSES count as failures.
+
+    One breaker can be shared by several clients.
+    """
+
+    FAILURE_STATUSES = frozenset([502, 503, 504])
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Maps host to [consecutive failures, time opened or of last trial]
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """Raise CircuitOpenError if requests to host should fail fast."""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[0] < self.failure_threshold:
+                return
+            now = time.monotonic()
+            wait = state[1] + self.reset_timeout - now
+            if wait > 0:
+                raise CircuitOpenError(
+                    "Circuit open for {host} after {failures} failed "
+                    "requests, retrying in {wait:.0f}s".format(
+                        host=host, failures=state[0], wait=wait))
+            # Let this request through as the trial and make others wait
+            # until it's done
+            state[1] = now
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state[0] >= self.failure_threshold
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, 0])
+            state[0] += 1
+            if state[0] >= self.failure_threshold:
+                state[1] = time.monotonic()
+
+
+class _TracedConnectionMixin(object):
+    """Record connection timings of requests traced by the tracing module.
+
+    When requests aren't recorded the connection behaves like its base
+    class.
+    """
+
+    _ready_at = 0
+    _sent_at = 0
+
+    def _new_conn(self):
+        if not tracing.enabled():
+            return super(_TracedConnectionMixin, self)._new_conn()
+        # Resolve the host separately to tell DNS and connect time apart
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            address = socket.getaddrinfo(host, self.port, 0,
+                                         socket.SOCK_STREAM)[0][4][0]
+        except OSError:
+            # Let the base class raise its usual error
+            return super(_TracedConnectionMixin, self)._new_conn()
+        resolved = time.perf_counter()
+        tracing.record('dns', resolved - started)
+        self._dns_host = address
+        try:
+            sock = super(_TracedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = host
+        self._ready_at = time.perf_counter()
+        tracing.record('connect', self._ready_at - resolved)
+        return sock
+
+    def request(self, *args, **kwargs):
+        self._sent_at = time.perf_counter()
+        return super(_TracedConnectionMixin, self).request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        response = super(_TracedConnectionMixin, self).getresponse(
+            *args, **kwargs)
+        # Plain HTTP connections connect when the request is sent
+        tracing.record('ttfb', time.perf_counter() -
+                       max(self._sent_at, self._ready_at))
+        return response
+
+
+class TracedHTTPConnection(_TracedConnectionMixin,
+                           urllib3.connection.HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnectionMixin,
+                            urllib3.connection.HTTPSConnection):
+
+    def connect(self):
+        super(TracedHTTPSConnection, self).connect()
+        if tracing.enabled():
+            # _new_conn() set _ready_at once the TCP connection was made
+            ready_at, self._ready_at = self._ready_at, time.perf_counter()
+            tracing.record('tls', self._ready_at - ready_at)
+
+
+class TracedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class CloudLaunchHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter with optional retries and conditional GET requests.
+
+    Failed requests are retried according to the retry_policy, a
+    RetryPolicy, and requests to hosts that keep failing are failed fast by
+    the circuit_breaker, a CircuitBreaker.
+
+    If given a ValidatorCache, the ETag/Last-Modified validators and body of
+    GET responses are remembered, later GET requests for the same URL are
+    made conditional and a 304 (Not Modified) response is turned back into
+    the remembered 200 response, so unchanged resources only cost headers on
+    the wire. Responses replayed this way have a 'not_modified' attribute set
+    to True.
+    """
+
+    def __init__(self, validators=None, retry_policy=None,
+                 circuit_breaker=None, **kwargs):
+        self.validators = validators
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        super(CloudLaunchHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(CloudLaunchHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        # Connections record their timings when requests are traced
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TracedHTTPConnectionPool,
+            'https': TracedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        trace = tracing.begin_request(request.method, request.url)
+        if trace is None:
+            return self._send_with_retries(request, **kwargs)
+        try:
+            response = self._send_with_retries(request, trace=trace,
+                                               **kwargs)
+        except Exception as e:
+            tracing.end_request(trace, error=e)
+            raise
+        tracing.end_request(trace, response)
+        return response
+
+    def _send_with_retries(self, request, trace=None, **kwargs):
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        url = urlparse(request.url)
+        host = '{scheme}://{netloc}'.format(scheme=url.scheme,
+                                            netloc=url.netloc)
+        retries = 0
+        while True:
+            if breaker:
+                breaker.before_request(host)
+            response = error = None
+            try:
+                # Each attempt sends a copy, since _send() adds validators to
+                # the headers of the request it's given
+                response = self._send(request.copy(), trace=trace, **kwargs)
+            except requests.exceptions.SSLError:
+                # Retrying doesn't fix certificate problems
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if breaker:
+                if (error is not None or response.status_code in
+                        breaker.FAILURE_STATUSES):
+                    breaker.record_failure(host)
+                else:
+                    breaker.record_success(host)
+            delay = None
+            if (policy and policy.allows(request.method, retries) and
+                    (error is not None or
+                     response.status_code in policy.statuses) and
+                    not (breaker and breaker.is_open(host))):
+                delay = policy.delay(retries, response)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                # Release the connection for the retry
+                response.close()
+            retries += 1
+            if trace is not None:
+                trace.retries = retries
+                trace.record('backoff', delay)
+            time.sleep(delay)
+
+    def _send(self, request, trace=None, **kwargs):
+        entry = None
+        conditional = (self.validators is not None and
+                       request.method == 'GET' and
+                       'If-None-Match' not in request.headers and
+                       'If-Modified-Since' not in request.headers)
+        if conditional:
+            entry = self.validators.get(request.url)
+            if entry and entry.etag:
+                request.headers['If-None-Match'] = entry.etag
+            if entry and entry.last_modified:
+                request.headers['If-Modified-Since'] = entry.last_modified
+        response = super(CloudLaunchHTTPAdapter, self).send(request, **kwargs)
+        if trace is not None:
+            trace.validator_lookup = conditional
+            trace.conditional = bool(entry)
+            if not kwargs.get('stream'):
+                started = time.perf_counter()
+                trace.bytes = len(response.content)
+                trace.record('transfer', time.perf_counter() - started)
+        response.not_modified = False
+        if entry and response.status_code == 304:
+            # Read the empty body so the connection is released to the pool
+            response.content
+            response.status_code = 200
+            response.reason = 'OK'
+            response._content = entry.content
+            if entry.content_type:
+                response.headers['Content-Type'] = entry.content_type
+            response.not_modified = True
+        elif conditional and response.status_code == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.validators.set(request.url, ValidatorEntry(
+                    etag, last_modified, response.headers.get('Content-Type'),
+                    response.content))
+            else:
+                self.validators.discard(request.url)
+        return response
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                   validators=None, retry_policy=None, circuit_breaker=None):
+    """Create a requests session with a connection pool of given size.
+
+    If validators, a ValidatorCache, is given GET requests are made
+    conditional when possible. Failed requests are only retried if given a
+    retry_policy (see CloudLaunchHTTPAdapter).
+    """
+    session = requests.Session()
+    adapter = CloudLaunchHTTPAdapter(validators=validators,
+                                     retry_policy=retry_policy,
+                                     circuit_breaker=circuit_breaker,
+                                     pool_connections=pool_size,
+                                     pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+class APIConnection(object):
+    """Long lived HTTP session, coreapi client and schema for an APIConfig.
+
+    All endpoints created from the same APIConfig share one APIConnection so
+    that connections (and their TLS sessions) are reused between requests.
+    """
+
+    def __init__(self, api_config):
+        url = api_config.url
+        auth_token = api_config.token
+        if not auth_token or not url:
+            raise Exception("Auth token and url are required.")
+        self.api_config = api_config
+        self.validators = (ValidatorCache()
+                           if api_config.conditional_requests else None)
+        self.session = create_session(pool_size=api_config.pool_size,
+                                      keep_alive=api_config.keep_alive,
+                                      validators=self.validators,
+                                      retry_policy=api_config.retry_policy,
+                                      circuit_breaker=(
+                                          api_config.circuit_breaker))
+        http_headers = {}
+        if api_config.cloud_credentials:
+            http_headers = api_config.cloud_credentials.to_http_headers()
+        auth = coreapi.auth.TokenAuthentication(scheme='Token',
+                                                token=auth_token)
+        custom_transports = [
+            coreapi.transports.HTTPTransport(
+                auth=auth,
+                headers=http_headers,
+                session=self.session)
+        ]
+        decoders = [tracing.TimedCodec(codec)
+                    for codec in coreapi.client.get_default_decoders()]
+        self.client = coreapi.Client(decoders=decoders,
+                                     transports=custom_transports)
+        url = url if url.endswith("/") else url + "/"
+        self.schema_url = '{url}schema/'.format(url=url)
+        self._schema = None
+        self._lock = threading.Lock()
+
+    def schema(self):
+        """Return API schema document, downloading it only when needed."""
+        schema_cache = self.api_config.schema_cache
+        if schema_cache:
+            # The schema cache keeps decoded documents in memory and takes
+            # care of expiring them
+            with tracing.span('schema'), tracing.action(['schema']):
+                return schema_cache.get(self.session, self.schema_url,
+                                        self.api_config.token,
+                                        self.client.decoders)
+        with self._lock:
+            if self._schema is None:
+                with tracing.span('schema'), tracing.action(['schema']):
+                    self._schema = self.client.get(self.schema_url)
+            return self._schema
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
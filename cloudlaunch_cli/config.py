@@ -1,4 +1,3 @@
-import configparser
 import os
 from os.path import expanduser
 from urllib.parse import urlparse
@@ -11,7 +10,15 @@ class Configuration(object):
 
     def __init__(self):
         self._filename = "~/.cloudlaunch"
-        self._read_config()
+        self._parser = None
+
+    @property
+    def _config(self):
+        # The config file is read when it's first needed, so that commands
+        # which don't use it start without reading it
+        if self._parser is None:
+            self._read_config()
+        return self._parser
 
     @property
     def url(self):
@@ -53,8 +60,9 @@ class Configuration(object):
         return self._config[SECTION]
 
     def _read_config(self):
-        self._config = configparser.ConfigParser()
-        self._config.read(expanduser(self._filename))
+        import configparser
+        self._parser = configparser.ConfigParser()
+        self._parser.read(expanduser(self._filename))
 
     def _write_config(self):
         with open(expanduser(self._filename), 'w') as configfile:
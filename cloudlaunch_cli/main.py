@@ -1,41 +1,151 @@
+import collections
+import fnmatch
+import functools
 import json
+import time
 
-import arrow
 import click
 
-from .api.client import APIClient
-from .api.cloud_credentials import CloudCredentials
 from .config import Configuration
+from . import output
+
+# Only modules needed to build the command line are imported here. The API
+# client, its dependencies and the modules of single commands are imported
+# when they are used, so that the CLI starts quickly and commands such as
+# --help or 'config show' don't pay for importing them.
+
+# Same as batch.DEFAULT_CONCURRENCY, which isn't imported for option defaults
+DEFAULT_CONCURRENCY = 8
 
 conf = Configuration()
 
 cli_context = {}
 
 
-def create_api_client(cloud=None, cloud_credentials_json=None):
+@functools.lru_cache(maxsize=None)
+def get_schema_cache():
+    """Return the SchemaCache shared by the clients of this process."""
+    from .api.cache import SchemaCache
+    return SchemaCache()
+
 
-    cloudlaunch_client = APIClient(url=conf.url, token=conf.token)
+@functools.lru_cache(maxsize=None)
+def get_circuit_breaker():
+    """Return the CircuitBreaker shared by the clients of this process.
+
+    Commands create a client per cloud, all making requests to the same
+    CloudLaunch server, whose failures are counted together.
+    """
+    from .api.transport import CircuitBreaker
+    return CircuitBreaker()
+
+
+def get_response_cache():
+    """Return the ResponseCache of this invocation, None if it's disabled."""
+    if 'response-cache-options' not in cli_context:
+        return None
+    if 'response-cache' not in cli_context:
+        from .api.cache import ResponseCache, SQLiteCache
+        cli_context['response-cache'] = ResponseCache(
+            persistent=SQLiteCache(),
+            **cli_context['response-cache-options'])
+    return cli_context['response-cache']
+
+
+def create_api_client(cloud=None, cloud_credentials_json=None,
+                      pool_size=None, conditional_requests=False):
+    """Create an APIClient for the configured server.
+
+    Unlike APIClient, conditional requests are off by default: commands read
+    each resource once, so keeping validators and bodies of responses only
+    costs memory. Commands that poll, such as 'deployments watch', turn them
+    on.
+    """
+    from .api.client import APIClient
+    from .api.cloud_credentials import CloudCredentials
+
+    pool_size = pool_size or _pool_size()
+    schema_cache = get_schema_cache()
+    response_cache = get_response_cache()
+    circuit_breaker = get_circuit_breaker()
+    cloudlaunch_client = APIClient(url=conf.url, token=conf.token,
+                                   schema_cache=schema_cache,
+                                   pool_size=pool_size,
+                                   conditional_requests=conditional_requests,
+                                   response_cache=response_cache,
+                                   circuit_breaker=circuit_breaker)
     # Recreate client with cloud credentials if available
     if cloud:
         cloud_resource = cloudlaunch_client.infrastructure.clouds.get(cloud)
         # Try to load if specified on command line first, then look in
         # environment variables
         if 'cloud-credentials' in cli_context:
-            creds_dict = json.loads(cli_context['cloud-credentials'].read())
+            # Only read the file once since it may be needed for many clouds
+            if 'cloud-credentials-dict' not in cli_context:
+                cli_context['cloud-credentials-dict'] = json.loads(
+                    cli_context['cloud-credentials'].read())
             cloud_creds = CloudCredentials.load_from_dict(
-                cloud_resource.resourcetype, creds_dict)
+                cloud_resource.resourcetype,
+                cli_context['cloud-credentials-dict'])
         else:
             cloud_creds = CloudCredentials.load_from_environment(
                 cloud_resource.resourcetype)
         if cloud_creds:
             return APIClient(url=conf.url, token=conf.token,
-                             cloud_credentials=cloud_creds)
+                             cloud_credentials=cloud_creds,
+                             schema_cache=schema_cache,
+                             pool_size=pool_size,
+                             conditional_requests=conditional_requests,
+                             response_cache=response_cache,
+                             circuit_breaker=circuit_breaker)
     return cloudlaunch_client
 
 
+def _create_cloud_clients(clouds, pool_size):
+    """Return dict of cloud id to an API client with the cloud's credentials.
+
+    A cloud whose client can't be created, for example because it doesn't
+    exist, maps to the exception raised so that it only fails the work for
+    that cloud.
+    """
+    clients = {}
+    for cloud in clouds:
+        try:
+            clients[cloud] = create_api_client(cloud, pool_size=pool_size)
+        except Exception as e:
+            clients[cloud] = e
+    return clients
+
+
+def _pool_size(concurrency=0):
+    """Return connection pool size for making concurrency requests at once."""
+    from .api.transport import DEFAULT_POOL_SIZE
+    return max(concurrency, DEFAULT_POOL_SIZE)
+
+
 @click.group()
-def client():
-    pass
+@click.option('--no-cache', is_flag=True,
+              help="Don't use or store locally cached responses")
+@click.option('--refresh', is_flag=True,
+              help='Ignore locally cached responses and refresh them')
+@click.option('--output', type=click.Choice(output.FORMATS),
+              default='table', show_default=True,
+              help='Format of listed resources')
+@click.option('--timings', is_flag=True,
+              help='Show where the command spent its time when it finishes')
+@click.pass_context
+def client(ctx, no_cache, refresh, output, timings):
+    cli_context['output'] = output
+    if timings:
+        from .api import tracing
+        tracing.start()
+        # Shown on stderr so it doesn't mix with JSON or CSV output
+        ctx.call_on_close(
+            lambda: click.echo(tracing.stop().report(), err=True))
+    # Responses of infrastructure endpoints (clouds, regions, zones and vm
+    # types) are cached since they rarely change
+    if not no_cache:
+        cli_context['response-cache-options'] = {'refresh': refresh}
 
 
 @click.group()
@@ -72,6 +182,35 @@ def show_config():
         print("{name}={value}".format(name=name, value=value))
 
 
+@click.group()
+def cache():
+    """Manage locally cached CloudLaunch data."""
+    pass
+
+
+@click.command()
+@click.option('--all', 'all_servers', is_flag=True,
+              help='Clear cached data for all servers and tokens')
+def clear_cache(all_servers):
+    """Clear the cached API schema and responses.
+
+    By default only the schema for the configured url and token is removed,
+    or all schemas if no url is configured.
+    """
+    from .api.cache import SQLiteCache
+
+    schema_cache = get_schema_cache()
+    if all_servers or not conf.url:
+        removed = schema_cache.invalidate()
+    else:
+        url = conf.url if conf.url.endswith("/") else conf.url + "/"
+        removed = schema_cache.invalidate(
+            '{url}schema/'.format(url=url), conf.token)
+    SQLiteCache().clear()
+    print("Removed {removed} cached schema(s) and all cached "
+          "responses.".format(removed=removed))
+
+
 @click.group()
 @click.option('--cloud-credentials', type=click.File('rb'),
               help="JSON file with cloud credentials.")
@@ -114,36 +253,232 @@ def create_deployment(name, application, cloud, target_id, application_version,
     _print_deployments([new_deployment])
 
 
+@click.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--concurrency', type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help='Max number of deployments to create at the same time')
+@click.pass_context
+def create_deployments_batch(ctx, manifest, concurrency):
+    """Create the deployments listed in a manifest file.
+
+    MANIFEST is a JSON, YAML (.yaml/.yml) or NDJSON (.ndjson/.jsonl) file
+    listing deployments with the same fields as the arguments and options of
+    'create': name, application, cloud, target_id, application_version and
+    config_app. A JSON or YAML manifest can also be a mapping with a
+    'deployments' list and 'defaults' applied to each of them. A deployment
+    with a 'count' is created that many times, with '{index}' in its name
+    replaced by 1, 2, ...
+    """
+    from .api import batch
+    from .manifest import load_manifest
+
+    try:
+        specs = load_manifest(manifest)
+    except Exception as e:
+        raise click.BadParameter(str(e), param_hint='MANIFEST')
+    pool_size = _pool_size(concurrency)
+    clients = _create_cloud_clients(set(spec['cloud'] for spec in specs),
+                                    pool_size)
+    failed = 0
+    for result in batch.create_deployments(clients, specs,
+                                           concurrency=concurrency):
+        if result.error:
+            failed += 1
+            print("FAILED   {name}: {error}".format(
+                name=result.item['name'], error=result.error))
+        else:
+            print("CREATED  {name} (id {id})".format(
+                name=result.item['name'], id=result.result.id))
+    print("Created {created} of {total} deployments, {failed} failed.".format(
+        created=len(specs) - failed, total=len(specs), failed=failed))
+    if failed:
+        ctx.exit(1)
+
+
+@click.command()
+@click.argument('deployment_ids', nargs=-1, type=int)
+@click.option('--all', 'all_deployments', is_flag=True,
+              help='Check all (not archived) deployments')
+@click.option('--filter', 'name_filter',
+              help='Check deployments with names matching this glob pattern')
+@click.option('--concurrency', type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help='Max number of requests to make at the same time')
+@click.option('--timeout', type=int, default=600, show_default=True,
+              help='Seconds to wait for health checks to finish')
+def health_check_deployments(deployment_ids, all_deployments, name_filter,
+                             concurrency, timeout):
+    """Run health checks on many deployments.
+
+    Checks the deployments with the given DEPLOYMENT_IDS, all deployments
+    (--all) or those with matching names (--filter), waits for the checks
+    to finish and shows their results.
+    """
+    if not (deployment_ids or all_deployments or name_filter):
+        raise click.UsageError(
+            "Specify deployment ids, --all or --filter")
+    pool_size = _pool_size(concurrency)
+    cloudlaunch_client = create_api_client(pool_size=pool_size)
+    if deployment_ids:
+        targets = [cloudlaunch_client.deployments.get(deployment_id)
+                   for deployment_id in deployment_ids]
+    else:
+        targets = cloudlaunch_client.deployments.list(archived=False)
+    if name_filter:
+        targets = [deployment for deployment in targets
+                   if fnmatch.fnmatch(deployment.name, name_filter)]
+    # Tasks are created with the credentials of each deployment's cloud
+    clients = _create_cloud_clients(
+        set(_deployment_cloud(d) for d in targets), pool_size)
+
+    from .api import batch, resources
+
+    def tasks_for(deployment):
+        client = clients[_deployment_cloud(deployment)]
+        if isinstance(client, Exception):
+            raise client
+        return client.deployments.subroutes(deployment.id)[resources.Task]
+
+    results = batch.run_health_checks(targets, concurrency=concurrency,
+                                      timeout=timeout, tasks_for=tasks_for)
+    _print_health_checks(sorted(results, key=lambda r: r.item.id))
+
+
+def _print_health_checks(results):
+    if len(results) > 0:
+        print("{:6s}  {:24s}  {:6s}  {:15s}  {:s}".format(
+            "ID", "Name", "Cloud", "Status", "Details"))
+    else:
+        print("No deployments.")
+    for result in results:
+        deployment, task = result.item, result.result
+        if result.error:
+            status, details = 'ERROR', str(result.error)
+        else:
+            status = task.instance_status or task.status
+            details = ''
+            if task.status != 'SUCCESS':
+                details = str(task.asdict().get('result') or '')
+        print("{identifier:6d}  {name:24.24s}  {cloud:6.6s}  {status:15.15s}  "
+              "{details:s}".format(
+                  identifier=deployment.id, name=deployment.name,
+                  cloud=_deployment_cloud(deployment), status=status,
+                  details=details))
+
+
 @click.command()
 @click.option('--archived', is_flag=True,
               help='Show only archived deployments')
-def list_deployments(archived):
-    deployments = create_api_client().deployments.list(archived=archived)
+@click.option('--page-size', type=click.IntRange(min=0),
+              help='Number of deployments to fetch per request')
+@click.option('--limit', type=click.IntRange(min=0),
+              help='Max number of deployments to show')
+@click.option('--prefetch', type=click.IntRange(min=0),
+              help='Number of pages of deployments to fetch concurrently')
+def list_deployments(archived, page_size, limit, prefetch):
+    deployments = create_api_client().deployments.iter(
+        archived=archived, page_size=page_size, limit=limit,
+        prefetch=prefetch, compact=True)
     _print_deployments(deployments)
 
 
-def _print_deployments(deployments):
-    if len(deployments) > 0:
-        print("{:6s}  {:24s}  {:6s}  {:15s}  {:20s}  {:15s}".format(
-            "ID", "Name", "Cloud", "Created", "Status", "Address"))
-    else:
-        print("No deployments.")
-    for deployment in deployments:
-        created_date = arrow.get(deployment.added)
-        latest_task = deployment.latest_task
-        latest_task_status = latest_task.instance_status \
-            if latest_task.instance_status else latest_task.status
-        latest_task_display = "{action}:{latest_task_status}".format(
-            action=latest_task.action,
-            latest_task_status=latest_task_status)
-        ip_address = deployment.public_ip if deployment.public_ip else 'N/A'
-        cloud = deployment._data['deployment_target']['target_zone']['cloud']['id']
-        print("{identifier:6d}  {name:24.24s}  {cloud:6.6s}  {created_date:15.15s}  "
-              "{latest_task_display:20.20s}  {ip_address:15.15s}".format(
-                  identifier=deployment._id, cloud=cloud,
-                  created_date=created_date.humanize(),
-                  latest_task_display=latest_task_display,
-                  ip_address=ip_address, **deployment._data))
+@click.command()
+@click.option('--archived', is_flag=True,
+              help='Watch only archived deployments')
+@click.option('--interval', type=float, default=5, show_default=True,
+              help='Seconds between polls after a change')
+@click.option('--max-interval', type=float, default=60, show_default=True,
+              help='Max seconds between polls while nothing changes')
+def watch_deployments(archived, interval, max_interval):
+    """Show deployments, then the ones whose latest task changes.
+
+    Deployments are polled with conditional requests, so a poll only
+    transfers data if something changed, and the time between polls grows
+    while nothing changes. Stop watching with Ctrl-C.
+    """
+    deployments_endpoint = create_api_client(
+        conditional_requests=True).deployments
+    previous = None
+    delay = interval
+    try:
+        while True:
+            current = collections.OrderedDict(
+                (deployment.id, deployment)
+                for deployment in deployments_endpoint.iter(archived=archived))
+            if previous is None:
+                _print_deployments(current.values(), output_format='table')
+                changed = False
+            else:
+                changed = _print_deployment_changes(previous, current)
+            previous = {id: (_latest_task_state(deployment), deployment.name)
+                        for id, deployment in current.items()}
+            delay = interval if changed else min(delay * 1.5, max_interval)
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+
+
+def _latest_task_state(deployment):
+    latest_task = deployment.latest_task
+    return (latest_task.id, latest_task.status, latest_task.instance_status)
+
+
+def _print_deployment_changes(previous, current):
+    """Print deployments that are new or whose latest task changed.
+
+    previous is a dict of deployment id to latest task state and name.
+    Returns whether anything changed.
+    """
+    changed = False
+    for id, deployment in current.items():
+        state = previous.get(id, (None, None))[0]
+        if state != _latest_task_state(deployment):
+            _print_deployment(deployment)
+            changed = True
+    for id, (state, name) in previous.items():
+        if id not in current:
+            print("{identifier:6d}  {name:24.24s}  (removed)".format(
+                identifier=id, name=name))
+            changed = True
+    return changed
+
+
+def _deployment_cloud(deployment):
+    return deployment.deployment_target['target_zone']['cloud']['id']
+
+
+def _latest_task_display(deployment):
+    latest_task = deployment.latest_task
+    return "{action}:{status}".format(
+        action=latest_task.action,
+        status=latest_task.instance_status or latest_task.status)
+
+
+def _humanize(date):
+    import arrow
+    return arrow.get(date).humanize()
+
+
+DEPLOYMENT_COLUMNS = [
+    output.Column('ID', lambda d: d.id, width=6, align='>'),
+    output.Column('Name', lambda d: d.name, width=24),
+    output.Column('Cloud', _deployment_cloud, width=6),
+    output.Column('Created', lambda d: d.added, width=15, display=_humanize),
+    output.Column('Status', _latest_task_display, width=20),
+    output.Column('Address', lambda d: d.public_ip, width=15,
+                  display=lambda ip: ip or 'N/A'),
+]
+
+
+def _print_deployments(deployments, output_format=None):
+    output.render(deployments, DEPLOYMENT_COLUMNS,
+                  output_format or cli_context.get('output', 'table'),
+                  empty_message="No deployments.")
+
+
+def _print_deployment(deployment):
+    print(output.format_row(DEPLOYMENT_COLUMNS, deployment))
 
 
 @click.group()
@@ -166,22 +501,23 @@ def create_application(name, summary, maintainer, description):
 
 @click.command()
 def list_applications():
-    applications = create_api_client().applications.list()
+    applications = create_api_client().applications.iter()
     _print_applications(applications)
 
 
+APPLICATION_COLUMNS = [
+    output.Column('Name', lambda app: app.name, width=24),
+    output.Column('Created Date', lambda app: app.added, width=15,
+                  display=_humanize),
+    output.Column('Maintainer', lambda app: app.maintainer, width=20),
+    output.Column('Summary', lambda app: app.summary, width=30),
+]
+
+
 def _print_applications(applications):
-    if len(applications) > 0:
-        print("{:24s}  {:15s}  {:20s}  {:15s}".format(
-            "Name", "Created Date", "Maintainer", "Summary"))
-    else:
-        print("No applications found.")
-    for app in applications:
-        created_date = arrow.get(app.added)
-        print("{name:24.24s}  {created_date:15.15s}  "
-              "{maintainer!s:20.20}  {summary!s:30.30}".format(
-                  created_date=created_date.humanize(),
-                  **app._data))
+    output.render(applications, APPLICATION_COLUMNS,
+                  cli_context.get('output', 'table'),
+                  empty_message="No applications found.")
 
 
 @click.group()
@@ -228,12 +564,65 @@ def vm_types(ctx):
 @click.option('--min_vcpus', help='Min CPUs', default=0)
 @click.option('--min_ram', help='Min RAM', default=0)
 @click.option('--prefix', help='Prefix of instance family', default="")
+@click.option('--sort', help='Comma separated keys to sort by: vcpus, ram '
+              'and name, prefixed with - for descending order')
+@click.option('--best-fit', is_flag=True,
+              help='Only show the smallest vm type with min CPUs and RAM')
 @click.pass_context
-def list_vm_types(ctx, min_vcpus, min_ram, prefix):
-    cloud = create_api_client().infrastructure.clouds.get(ctx.obj['cloud_id'])
-    region = cloud.regions.get(ctx.obj['region_id'])
-    zone = region.zones.get(ctx.obj['zone_id'])
-    _print_vm_types(zone.vm_types.list(min_vcpus=min_vcpus, min_ram=min_ram, vm_type_prefix=prefix))
+def list_vm_types(ctx, min_vcpus, min_ram, prefix, sort, best_fit):
+    from .api import catalog, resources
+
+    vm_types = _catalog_vm_types(
+        ctx.obj['cloud_id'], ctx.obj['region_id'], ctx.obj['zone_id'])
+    if vm_types is None:
+        cloud = create_api_client().infrastructure.clouds.get(
+            ctx.obj['cloud_id'])
+        region = cloud.regions.get(ctx.obj['region_id'])
+        zone = region.zones.get(ctx.obj['zone_id'])
+        # All vm types of the zone are listed, and filtered by the index, so
+        # that their response is cached once for all queries
+        vm_types = [vm_type.asdict() for vm_type in zone.vm_types.list()]
+    index = catalog.VmTypeIndex(vm_types)
+    if best_fit:
+        match = index.best_fit(min_vcpus=min_vcpus, min_ram=min_ram,
+                               prefix=prefix)
+        matches = [match] if match else []
+    else:
+        matches = index.query(min_vcpus=min_vcpus, min_ram=min_ram,
+                              prefix=prefix,
+                              sort=_sort_keys(sort) if sort else ())
+    _print_vm_types([resources.VmType.from_response(data, shared=True)
+                     for data in matches])
+
+
+def _sort_keys(sort):
+    from .api import catalog
+
+    keys = sort.split(',')
+    for key in keys:
+        if key.lstrip('-') not in catalog.VmTypeIndex.SORT_KEYS:
+            raise click.BadParameter(
+                "Can't sort by {key}".format(key=key), param_hint='--sort')
+    return keys
+
+
+def _catalog_vm_types(cloud_id, region_id, zone_id):
+    """Return vm types of a zone from a fresh catalog, or None.
+
+    The catalog isn't used if caching is disabled or being refreshed.
+    """
+    from .api import catalog
+
+    options = cli_context.get('response-cache-options')
+    if not options or options['refresh']:
+        return None
+    infrastructure = catalog.Catalog.load(catalog.default_path(conf.url))
+    if not infrastructure or infrastructure.age > catalog.MAX_AGE:
+        return None
+    zone = infrastructure.find_zone(cloud_id, region_id, zone_id)
+    if not zone or 'error' in zone:
+        return None
+    return zone.get('vm_types', [])
 
 
 @zones.command(name='list')
@@ -244,6 +633,87 @@ def list_zones(ctx):
     _print_zones(region.zones.list())
 
 
+@clouds.command()
+@click.option('--catalog', 'catalog_path', type=click.Path(dir_okay=False),
+              help='File to write the catalog to')
+@click.option('--concurrency', type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help='Max number of requests to make at the same time')
+def snapshot(catalog_path, concurrency):
+    """Save a catalog of all clouds, regions, zones and vm types.
+
+    The catalog can be queried offline with 'find-vm-types'.
+    """
+    from .api import catalog
+
+    start = time.time()
+    pool_size = _pool_size(concurrency)
+    cloudlaunch_client = create_api_client(pool_size=pool_size)
+    # vm types are listed with the credentials of each cloud
+    cloud_ids = [cloud.id for cloud in
+                 cloudlaunch_client.infrastructure.clouds.list()]
+    clients = _create_cloud_clients(cloud_ids, pool_size)
+    infrastructure = catalog.crawl(cloudlaunch_client,
+                                   concurrency=concurrency, clients=clients)
+    catalog_path = catalog_path or catalog.default_path(conf.url)
+    infrastructure.save(catalog_path)
+    for node in infrastructure.errors():
+        print("Failed to list children of {name}: {error}".format(
+            name=node['name'], error=node['error']))
+    print("Saved {clouds} clouds, {regions} regions, {zones} zones and "
+          "{vm_types} vm types to {path} in {seconds:.1f}s".format(
+              path=catalog_path, seconds=time.time() - start,
+              **infrastructure.counts()))
+
+
+@clouds.command(name='find-vm-types')
+@click.option('--catalog', 'catalog_path',
+              type=click.Path(dir_okay=False, exists=True),
+              help="Catalog file written by 'snapshot'")
+@click.option('--cloud_id', help='Cloud ID')
+@click.option('--region_id', help='Region ID')
+@click.option('--zone_id', help='Zone ID')
+@click.option('--min_vcpus', help='Min CPUs', default=0)
+@click.option('--min_ram', help='Min RAM', default=0)
+@click.option('--prefix', help='Prefix of instance family', default="")
+@click.option('--sort', default='vcpus,ram,name', show_default=True,
+              help='Comma separated keys to sort by: vcpus, ram and name, '
+              'prefixed with - for descending order')
+@click.option('--best-fit', is_flag=True,
+              help='Only show the smallest vm type with min CPUs and RAM')
+def find_vm_types(catalog_path, cloud_id, region_id, zone_id, min_vcpus,
+                  min_ram, prefix, sort, best_fit):
+    """Find vm types in all zones of the saved catalog."""
+    from .api import catalog
+
+    infrastructure = catalog.Catalog.load(
+        catalog_path or catalog.default_path(conf.url))
+    if not infrastructure:
+        raise click.UsageError(
+            "No catalog found, create one with 'cloudlaunch clouds snapshot'")
+    query = {'min_vcpus': min_vcpus, 'min_ram': min_ram, 'prefix': prefix}
+    if not best_fit:
+        query['sort'] = _sort_keys(sort)
+    matches = infrastructure.vm_types(
+        cloud_id=cloud_id, region_id=region_id, zone_id=zone_id,
+        best_fit=best_fit, **query)
+    output.render(matches, [
+        output.Column('Cloud', lambda match: match[0]['id'], width=15),
+        output.Column('Region', lambda match: match[1]['region_id'],
+                      width=20),
+        output.Column('Zone', lambda match: match[2]['zone_id'], width=20),
+        output.Column('Name', lambda match: match[3]['name'], width=30),
+        output.Column('CPUs', lambda match: match[3]['vcpus'], width=6,
+                      align='>'),
+        output.Column('RAM', lambda match: match[3]['ram'], width=8,
+                      align='>'),
+    ], cli_context.get('output', 'table'),
+        empty_message="No vm types found.",
+        data=lambda match: dict(match[3], cloud_id=match[0]['id'],
+                                region_id=match[1]['region_id'],
+                                zone_id=match[2]['zone_id']))
+
+
 @click.command()
 def list_clouds():
     clouds = create_api_client().infrastructure.clouds.list()
@@ -251,76 +721,58 @@ def list_clouds():
 
 
 def _print_clouds(clouds):
-    id_width = max([len(cloud.id) for cloud in clouds]) + 1
-    if len(clouds) > 0:
-        header_format = "{{:{id_width!s}s}} {{:30s}} {{:20s}}"\
-                        .format(id_width=id_width)
-        print(header_format.format(
-            "Id", "Name", "Cloud Type"))
-    else:
-        print("No clouds found.")
-    row_format = "{{id:{id_width!s}.{id_width!s}s}} {{name:30.30s}} "\
-                 "{{resourcetype:20.20}}"\
-                 .format(id_width=id_width)
-    for cloud in clouds:
-        print(row_format.format(**cloud.asdict()))
+    output.render(clouds, [
+        output.Column('Id', lambda cloud: cloud.id),
+        output.Column('Name', lambda cloud: cloud.name, width=30),
+        output.Column('Cloud Type', lambda cloud: cloud.resourcetype,
+                      width=20),
+    ], cli_context.get('output', 'table'), empty_message="No clouds found.")
 
 
 def _print_regions(regions):
-    id_width = max([len(region.id) for region in regions]) + 1
-    if len(regions) > 0:
-        header_format = "{{:{id_width!s}s}} {{:30s}}"\
-                        .format(id_width=id_width)
-        print(header_format.format(
-            "Id", "Name"))
-    else:
-        print("No regions found.")
-    row_format = "{{region_id:{id_width!s}.{id_width!s}s}} {{name:30.30s}}" \
-                 .format(id_width=id_width)
-    for region in regions:
-        print(row_format.format(**region.asdict()))
+    output.render(regions, [
+        output.Column('Id', lambda region: region.id),
+        output.Column('Name', lambda region: region.name, width=30),
+    ], cli_context.get('output', 'table'), empty_message="No regions found.")
 
 
 def _print_zones(zones):
-    id_width = max([len(zone.id) for zone in zones]) + 1
-    if len(zones) > 0:
-        header_format = "{{:{id_width!s}s}} {{:30s}}"\
-                        .format(id_width=id_width)
-        print(header_format.format(
-            "Id", "Name"))
-    else:
-        print("No zones found.")
-    row_format = "{{zone_id:{id_width!s}.{id_width!s}s}} {{name}}" \
-                 .format(id_width=id_width)
-    for zone in zones:
-        print(row_format.format(**zone.asdict()))
+    output.render(zones, [
+        output.Column('Id', lambda zone: zone.id),
+        output.Column('Name', lambda zone: zone.name),
+    ], cli_context.get('output', 'table'), empty_message="No zones found.")
+
+
+VM_TYPE_COLUMNS = [
+    output.Column('Id', lambda vm_type: vm_type.id),
+    output.Column('Name', lambda vm_type: vm_type.name, width=30),
+    output.Column('CPUs', lambda vm_type: vm_type.vcpus, width=20),
+    output.Column('RAM', lambda vm_type: vm_type.ram, width=20),
+]
 
 
 def _print_vm_types(vm_types):
-    id_width = max([len(vm_type.id) for vm_type in vm_types]) + 1
-    if len(vm_types) > 0:
-        header_format = "{{:{id_width!s}s}} {{:30s}} {{:20s}} {{:20s}}"\
-                        .format(id_width=id_width)
-        print(header_format.format(
-            "Id", "Name", "CPUs", "RAM"))
-    else:
-        print("No vm types found.")
-    row_format = "{{id:{id_width!s}.{id_width!s}s}} {{name:30.30s}} {{vcpus:20.20s}} {{ram:20.20s}}" \
-                 .format(id_width=id_width)
-    for vm_type in vm_types:
-        print(row_format.format(**vm_type.asdict()))
+    output.render(vm_types, VM_TYPE_COLUMNS,
+                  cli_context.get('output', 'table'),
+                  empty_message="No vm types found.")
 
 
 client.add_command(deployments)
 client.add_command(applications)
 client.add_command(clouds)
 client.add_command(config)
+client.add_command(cache)
 
 config.add_command(set_config, name='set')
 config.add_command(show_config, name='show')
 
+cache.add_command(clear_cache, name='clear')
+
 deployments.add_command(create_deployment, name='create')
+deployments.add_command(create_deployments_batch, name='create-batch')
 deployments.add_command(list_deployments, name='list')
+deployments.add_command(health_check_deployments, name='health-check')
+deployments.add_command(watch_deployments, name='watch')
 
 applications.add_command(create_application, name='create')
 applications.add_command(list_applications, name='list')
@@ -0,0 +1,88 @@
+"""Read deployment manifests for batch deployment creation.
+
+A manifest is a JSON or YAML file with either a list of deployments or a
+mapping with an optional 'defaults' mapping, applied to every deployment,
+and a 'deployments' list. NDJSON manifests have one deployment per line.
+Each deployment has the same fields as the arguments and options of
+``cloudlaunch deployments create``::
+
+    defaults:
+      application: ubuntu
+      application_version: "16.04"
+      cloud: aws
+      target_id: 1
+    deployments:
+      - name: workshop-{index}
+        count: 20
+        config_app: workshop_config.json
+
+'count' creates that many deployments, formatting '{index}' (starting from
+1) in their name. 'config_app' is either a mapping or the path, relative to
+the manifest, of a JSON file.
+"""
+import json
+import os
+
+REQUIRED_FIELDS = ('name', 'application', 'cloud', 'target_id')
+
+
+def load_manifest(path):
+    """Return list of deployment specs read from manifest at path.
+
+    Specs are dicts with the deployment's 'cloud' and the params with which
+    to create it.
+    """
+    with open(path) as f:
+        content = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.ndjson', '.jsonl'):
+        data = [json.loads(line) for line in content.splitlines()
+                if line.strip()]
+    elif extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise Exception("PyYAML is required to read YAML manifests")
+        data = yaml.safe_load(content)
+    else:
+        data = json.loads(content)
+
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or {}
+        data = data.get('deployments')
+    if not isinstance(data, list):
+        raise Exception("Manifest must contain a list of deployments")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for entry in data:
+        fields = dict(defaults)
+        fields.update(entry)
+        specs.extend(_to_specs(fields, base_dir))
+    return specs
+
+
+def _to_specs(fields, base_dir):
+    missing = [name for name in REQUIRED_FIELDS if not fields.get(name)]
+    if missing:
+        raise Exception("Deployment {name} is missing: {missing}".format(
+            name=fields.get('name', ''), missing=', '.join(missing)))
+    config_app = fields.get('config_app')
+    if isinstance(config_app, str):
+        with open(os.path.join(base_dir, config_app)) as f:
+            config_app = json.load(f)
+    count = int(fields.get('count', 1))
+    specs = []
+    for index in range(1, count + 1):
+        spec = {
+            'cloud': fields['cloud'],
+            'name': (fields['name'].format(index=index) if 'count' in fields
+                     else fields['name']),
+            'application': fields['application'],
+            'deployment_target_id': fields['target_id'],
+            'application_version': fields.get('application_version'),
+        }
+        if config_app:
+            spec['config_app'] = config_app
+        specs.append(spec)
+    return specs
@@ -0,0 +1,157 @@
+"""Render rows of resources as a table, JSON, NDJSON or CSV.
+
+Rows are written as they are read from the iterable, so listings that are
+fetched page by page are rendered in constant memory, except for tables
+with columns whose width is fitted to their content.
+"""
+import csv
+import json
+import sys
+import time
+
+from .api import tracing
+
+FORMATS = ('table', 'json', 'ndjson', 'csv')
+
+
+class Column(object):
+    """Column of rendered rows.
+
+    Arguments:
+    header -- column title
+    value -- callable returning the column's value for a row, as written in
+             CSV output
+
+    Keyword arguments:
+    width -- width of the column in tables, None to fit it to the widest
+             value
+    align -- '<' or '>' to align values left or right in tables
+    display -- callable converting a value to the text shown in tables
+    """
+
+    def __init__(self, header, value, width=None, align='<', display=str):
+        self.header = header
+        self.value = value
+        self.width = width
+        self.align = align
+        self.display = display
+
+    def text(self, row):
+        return str(self.display(self.value(row)))
+
+
+class BufferedWriter(object):
+    """Collect text and write it to a stream in chunks.
+
+    Buffered text is written once it reaches buffer_size characters or
+    flush_interval seconds after the last write to the stream, so rows that
+    arrive slowly are still shown promptly.
+    """
+
+    def __init__(self, stream, buffer_size=64 * 1024, flush_interval=0.5):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._parts = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if (self._size >= self.buffer_size or
+                time.monotonic() - self._flushed_at >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.stream.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+        self.stream.flush()
+        self._flushed_at = time.monotonic()
+
+
+def render(rows, columns, output_format='table', stream=None,
+           empty_message='', data=None):
+    """Write rows in output_format to stream (stdout by default).
+
+    Arguments:
+    rows -- iterable of rows, usually APIResources
+    columns -- list of Columns of table and CSV output
+
+    Keyword arguments:
+    empty_message -- shown instead of a table when there are no rows
+    data -- callable returning the JSON serializable data of a row for JSON
+            and NDJSON output. Defaults to calling the row's asdict().
+    """
+    if output_format not in FORMATS:
+        raise Exception("Unknown output format {output_format}".format(
+            output_format=output_format))
+    writer = BufferedWriter(stream or sys.stdout)
+    data = data or (lambda row: row.asdict())
+    # Rows may be fetched while they're rendered, the trace tells the time
+    # spent in requests apart
+    with tracing.span('render'):
+        try:
+            if output_format == 'table':
+                _render_table(rows, columns, writer, empty_message)
+            elif output_format == 'json':
+                _render_json(rows, writer, data)
+            elif output_format == 'ndjson':
+                for row in rows:
+                    writer.write(json.dumps(data(row), default=str) + '\n')
+            else:
+                csv_writer = csv.writer(writer, lineterminator='\n')
+                csv_writer.writerow([column.header for column in columns])
+                for row in rows:
+                    csv_writer.writerow(
+                        [column.value(row) for column in columns])
+        finally:
+            writer.flush()
+
+
+def format_row(columns, row, widths=None):
+    """Return table line of a row.
+
+    widths defaults to the widths of the columns, which must all be set.
+    """
+    return _format_line([column.text(row) for column in columns],
+                        [column.align for column in columns],
+                        widths or [column.width for column in columns])
+
+
+def _format_line(texts, aligns, widths):
+    return '  '.join(
+        '{text:{align}{width}.{width}}'.format(
+            text=text, align=align, width=width)
+        for text, align, width in zip(texts, aligns, widths)).rstrip()
+
+
+def _render_table(rows, columns, writer, empty_message):
+    widths = [column.width for column in columns]
+    if None in widths:
+        # Widths are fitted to the values, so all rows are needed up front
+        rows = list(rows)
+        widths = [
+            width if width is not None else
+            max([len(column.header)] +
+                [len(column.text(row)) for row in rows])
+            for column, width in zip(columns, widths)]
+    header = None
+    for row in rows:
+        if header is None:
+            header = _format_line([column.header for column in columns],
+                                  ['<'] * len(columns), widths)
+            writer.write(header + '\n')
+        writer.write(format_row(columns, row, widths) + '\n')
+    if header is None and empty_message:
+        writer.write(empty_message + '\n')
+
+
+def _render_json(rows, writer, data):
+    separator = '[\n'
+    for row in rows:
+        writer.write(separator + json.dumps(data(row), default=str))
+        separator = ',\n'
+    writer.write('[]\n' if separator == '[\n' else '\n]\n')
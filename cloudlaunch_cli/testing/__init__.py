@@ -0,0 +1 @@
+"""Tools for testing and benchmarking the CloudLaunch CLI offline."""
@@ -0,0 +1,780 @@
+"""Fake CloudLaunch server for offline testing and benchmarking.
+
+Serves a corejson API schema and the deployments, tasks, applications and
+infrastructure (clouds, regions, zones and vm types) endpoints used by the
+client, backed by generated in-memory data. Lists are paginated like the real
+server, GET responses have ETags, and the latency of responses and the size
+of items are configurable, so the whole client stack can be load tested and
+profiled deterministically without a CloudLaunch server or network.
+
+Run it with::
+
+    python -m cloudlaunch_cli.testing.server --port 8000 --deployments 1000
+
+and point the client at http://127.0.0.1:8000/api/v1 with any token. In
+tests, use a FakeCloudLaunchServer as a context manager::
+
+    with FakeCloudLaunchServer(deployments=100) as server:
+        client = APIClient(url=server.url, token='token')
+"""
+import argparse
+import collections
+import datetime
+import hashlib
+import http.server
+import json
+import re
+import socketserver
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import coreapi
+import coreschema
+
+API_PATH = '/api/v1/'
+
+# Timestamp of generated items, which are a minute apart
+EPOCH = datetime.datetime(2018, 3, 28, 13, 0, tzinfo=datetime.timezone.utc)
+
+CLOUD_TYPES = ('AWSCloud', 'OpenStackCloud', 'AzureCloud', 'GCPCloud')
+
+# Routes of API paths, relative to API_PATH, to the name of the server's
+# handler methods, e.g. get_deployments() for GET deployments/
+ROUTES = [(re.compile(pattern + '$'), name) for pattern, name in [
+    (r'deployments/', 'deployments'),
+    (r'deployments/(?P<id>\d+)/', 'deployment'),
+    (r'deployments/(?P<deployment_pk>\d+)/tasks/', 'tasks'),
+    (r'deployments/(?P<deployment_pk>\d+)/tasks/(?P<id>\d+)/', 'task'),
+    (r'applications/', 'applications'),
+    (r'applications/(?P<slug>[^/]+)/', 'application'),
+    (r'infrastructure/clouds/', 'clouds'),
+    (r'infrastructure/clouds/(?P<id>[^/]+)/', 'cloud'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/', 'regions'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/(?P<id>[^/]+)/',
+     'region'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/'
+     r'(?P<region_pk>[^/]+)/zones/', 'zones'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/'
+     r'(?P<region_pk>[^/]+)/zones/(?P<id>[^/]+)/', 'zone'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/'
+     r'(?P<region_pk>[^/]+)/zones/(?P<zone_pk>[^/]+)/compute/vm_types/',
+     'vm_types'),
+    (r'infrastructure/clouds/(?P<cloud_pk>[^/]+)/regions/'
+     r'(?P<region_pk>[^/]+)/zones/(?P<zone_pk>[^/]+)/compute/vm_types/'
+     r'(?P<id>[^/]+)/', 'vm_type'),
+]]
+
+
+class HTTPError(Exception):
+    """Error response of the fake server."""
+
+    def __init__(self, status, detail):
+        super(HTTPError, self).__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def build_schema():
+    """Return the API schema as a coreapi Document.
+
+    Links are named and nested the same way as in the schema of the real
+    server, generated by Django REST framework.
+    """
+    def field(name, location, required=False, schema=None):
+        return coreapi.Field(name, required=required, location=location,
+                             schema=schema or coreschema.String())
+
+    def path(*names):
+        return [field(name, 'path', required=True) for name in names]
+
+    def form(required=(), optional=()):
+        return ([field(name, 'form', required=True) for name in required] +
+                [field(name, 'form') for name in optional])
+
+    pagination = [field('page', 'query', schema=coreschema.Integer()),
+                  field('page_size', 'query', schema=coreschema.Integer())]
+
+    def resource(url, parents=(), id_name='id', list_fields=(),
+                 create_fields=None, update_fields=None, **children):
+        links = collections.OrderedDict()
+        item_url = '{url}{{{id_name}}}/'.format(url=url, id_name=id_name)
+        links['list'] = coreapi.Link(
+            url=url, action='get',
+            fields=path(*parents) + pagination + list(list_fields))
+        if create_fields is not None:
+            links['create'] = coreapi.Link(
+                url=url, action='post', encoding='application/json',
+                fields=path(*parents) + create_fields)
+        links['read'] = coreapi.Link(url=item_url, action='get',
+                                     fields=path(*(parents + (id_name,))))
+        if update_fields is not None:
+            for action, name in (('put', 'update'),
+                                 ('patch', 'partial_update')):
+                links[name] = coreapi.Link(
+                    url=item_url, action=action, encoding='application/json',
+                    fields=path(*(parents + (id_name,))) + update_fields)
+            links['delete'] = coreapi.Link(
+                url=item_url, action='delete',
+                fields=path(*(parents + (id_name,))))
+        links.update(children)
+        return links
+
+    deployment_fields = ('name', 'application', 'deployment_target_id',
+                         'application_version')
+    infrastructure = API_PATH + 'infrastructure/clouds/'
+    content = {
+        'deployments': resource(
+            API_PATH + 'deployments/',
+            list_fields=[field('archived', 'query',
+                               schema=coreschema.Boolean())],
+            create_fields=form(deployment_fields, ['config_app']),
+            update_fields=form(optional=deployment_fields + ('archived',)),
+            tasks=resource(
+                API_PATH + 'deployments/{deployment_pk}/tasks/',
+                parents=('deployment_pk',),
+                create_fields=form(['action']),
+                update_fields=form(optional=['action']))),
+        'applications': resource(
+            API_PATH + 'applications/', id_name='slug',
+            create_fields=form(['name', 'summary'],
+                               ['maintainer', 'description']),
+            update_fields=form(optional=['name', 'summary', 'maintainer',
+                                         'description'])),
+        'infrastructure': {
+            'clouds': resource(
+                infrastructure,
+                regions=resource(
+                    infrastructure + '{cloud_pk}/regions/',
+                    parents=('cloud_pk',),
+                    zones=resource(
+                        infrastructure + '{cloud_pk}/regions/{region_pk}/'
+                        'zones/',
+                        parents=('cloud_pk', 'region_pk'),
+                        compute={'vm_types': resource(
+                            infrastructure + '{cloud_pk}/regions/'
+                            '{region_pk}/zones/{zone_pk}/compute/vm_types/',
+                            parents=('cloud_pk', 'region_pk', 'zone_pk'),
+                            list_fields=[
+                                field('min_vcpus', 'query'),
+                                field('min_ram', 'query'),
+                                field('vm_type_prefix', 'query')])}))),
+        },
+    }
+    return coreapi.Document(url=API_PATH + 'schema/', title='CloudLaunch API',
+                            content=content)
+
+
+def _timestamp(minutes):
+    return (EPOCH + datetime.timedelta(minutes=minutes)).isoformat()
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 128
+
+
+class FakeCloudLaunchServer(object):
+    """In-memory CloudLaunch server listening on host and port.
+
+    Arguments are the number of items generated: clouds, regions per cloud,
+    zones per region, vm types per zone, applications, deployments and tasks
+    per deployment.
+
+    Keyword arguments:
+    port -- port to listen on, by default a free one
+    token -- auth token requests must have, by default any token is accepted
+    page_size -- number of items per page of lists that are requested
+                 without a page_size parameter
+    max_page_size -- largest number of items per page, whatever page_size is
+                     requested
+    latency -- seconds every response is delayed by
+    payload_size -- characters of log added to the result of each task, to
+                    make tasks and deployments larger
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, token=None, clouds=2,
+                 regions=2, zones=2, vm_types=20, applications=5,
+                 deployments=100, tasks=2, page_size=50, max_page_size=10000,
+                 latency=0, payload_size=0):
+        self.token = token
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.payload_size = payload_size
+        # Number of requests by (method, path)
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), _RequestHandler)
+        self._httpd.fake = self
+        self._thread = None
+        self.schema = build_schema()
+        self._schema_content = coreapi.codecs.CoreJSONCodec().encode(
+            self.schema)
+        self._generate(clouds, regions, zones, vm_types, applications,
+                       deployments, tasks)
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{host}:{port}'.format(host=host, port=port)
+
+    @property
+    def url(self):
+        """URL of the API root, to create clients with."""
+        return self.address + API_PATH.rstrip('/')
+
+    def start(self):
+        """Serve requests on a background thread, if not already started."""
+        if self._thread:
+            return self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name='fake-cloudlaunch-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def request_count(self, method=None, path=None):
+        """Return number of requests made, optionally by method and path."""
+        with self._lock:
+            return sum(count for (m, p), count in self.requests.items()
+                       if (method is None or m == method) and
+                       (path is None or p == path))
+
+    # Data
+
+    def _generate(self, clouds, regions, zones, vm_types, applications,
+                  deployments, tasks):
+        self.clouds = collections.OrderedDict()
+        self.regions = {}
+        self.zones = {}
+        self.vm_types = {}
+        # vm types are the same in every zone
+        zone_vm_types = collections.OrderedDict(
+            (vm_type['id'], vm_type)
+            for vm_type in (self._vm_type(i) for i in range(vm_types)))
+        for i in range(clouds):
+            cloud = self._cloud(i)
+            self.clouds[cloud['id']] = cloud
+            self.regions[cloud['id']] = collections.OrderedDict()
+            for j in range(regions):
+                region = self._region(cloud, j)
+                self.regions[cloud['id']][region['region_id']] = region
+                key = (cloud['id'], region['region_id'])
+                self.zones[key] = collections.OrderedDict()
+                for k in range(zones):
+                    zone = self._zone(cloud, region, k)
+                    self.zones[key][zone['zone_id']] = zone
+                    self.vm_types[key + (zone['zone_id'],)] = zone_vm_types
+        self.applications = collections.OrderedDict()
+        for i in range(applications):
+            application = self._application(i)
+            self.applications[application['slug']] = application
+        self.deployments = collections.OrderedDict()
+        self.tasks = {}
+        self._next_task_id = 1
+        for i in range(deployments):
+            self._add_deployment(
+                i + 1, 'deployment-{i}'.format(i=i + 1),
+                list(self.applications.values())[i % len(self.applications)]
+                if self.applications else None,
+                list(self.clouds.values())[i % len(self.clouds)]
+                if self.clouds else None,
+                actions=['LAUNCH'] + ['HEALTH_CHECK'] * (tasks - 1),
+                minutes=i)
+
+    def _cloud(self, index):
+        cloud_id = 'cloud-{index}'.format(index=index)
+        return {
+            'id': cloud_id,
+            'name': 'Cloud {index}'.format(index=index),
+            'resourcetype': CLOUD_TYPES[index % len(CLOUD_TYPES)],
+            'url': '{url}/infrastructure/clouds/{id}/'.format(
+                url=self.url, id=cloud_id),
+            'access_instructions_url': 'https://example.org/credentials',
+        }
+
+    def _region(self, cloud, index):
+        region_id = '{cloud}-region-{index}'.format(cloud=cloud['id'],
+                                                    index=index)
+        return {
+            'region_id': region_id,
+            'name': 'region-{index}'.format(index=index),
+            'cloud': cloud['id'],
+            'url': '{url}regions/{id}/'.format(url=cloud['url'],
+                                               id=region_id),
+        }
+
+    def _zone(self, cloud, region, index):
+        return {
+            'zone_id': 'zone-{index}'.format(index=index),
+            'name': '{region}-{index}'.format(region=region['name'],
+                                              index=index),
+            'cloud': cloud['id'],
+            'region': region['region_id'],
+        }
+
+    def _vm_type(self, index):
+        vcpus = 2 ** (index % 7)
+        family = 'm{generation}'.format(generation=index // 7 + 1)
+        name = '{family}.{size}xlarge'.format(family=family, size=vcpus)
+        return {
+            'id': name,
+            'name': name,
+            'family': family,
+            'vcpus': str(vcpus),
+            'ram': str(vcpus * 4.0),
+            'size_root_disk': '0',
+            'size_ephemeral_disks': '0',
+            'num_ephemeral_disks': '0',
+        }
+
+    def _application(self, index):
+        slug = 'application-{index}'.format(index=index)
+        return {
+            'slug': slug,
+            'url': '{url}/applications/{slug}/'.format(url=self.url,
+                                                       slug=slug),
+            'name': 'Application {index}'.format(index=index),
+            'summary': 'Summary of application {index}'.format(index=index),
+            'maintainer': 'cloudve.org',
+            'description': 'Description of application {index}'.format(
+                index=index),
+            'info_url': '',
+            'icon_url': '',
+            'status': 'LIVE',
+            'category': [],
+            'default_version': '1.0',
+            'versions': [{'version': '1.0', 'target_config': []}],
+            'added': _timestamp(index),
+            'updated': _timestamp(index),
+        }
+
+    def _task(self, deployment_id, action, minutes):
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        if action == 'LAUNCH':
+            result = {'cloudLaunch': {
+                'instance': {'id': 'i-{id:016x}'.format(id=deployment_id)},
+                'publicIP': '10.0.{high}.{low}'.format(
+                    high=deployment_id // 256 % 256,
+                    low=deployment_id % 256)}}
+        else:
+            result = {'instance_status': 'running'}
+        if self.payload_size:
+            result['log'] = ('Task {id} log. '.format(id=task_id) *
+                             self.payload_size)[:self.payload_size]
+        return {
+            'id': task_id,
+            'url': '{url}/deployments/{deployment}/tasks/{id}/'.format(
+                url=self.url, deployment=deployment_id, id=task_id),
+            'celery_id': None,
+            'action': action,
+            'status': 'SUCCESS',
+            'result': result,
+            'traceback': None,
+            'added': _timestamp(minutes),
+            'updated': _timestamp(minutes),
+            'deployment': deployment_id,
+        }
+
+    def _add_deployment(self, deployment_id, name, application, cloud,
+                        actions, minutes, application_version='1.0',
+                        config_app=None):
+        tasks = [self._task(deployment_id, action, minutes)
+                 for action in actions]
+        self.tasks[deployment_id] = collections.OrderedDict(
+            (task['id'], task) for task in tasks)
+        region = (next(iter(self.regions[cloud['id']].values()), None)
+                  if cloud else None)
+        deployment = {
+            'id': deployment_id,
+            'name': name,
+            'application_version': application_version,
+            'deployment_target': {
+                'id': 1,
+                'target_zone': {
+                    'cloud': cloud,
+                    'region': region,
+                    'zone_id': 'zone-0',
+                    'name': None,
+                },
+                'resourcetype': 'CloudDeploymentTarget',
+            },
+            'application_config': config_app or {},
+            'added': _timestamp(minutes),
+            'updated': _timestamp(minutes),
+            'owner': 'admin',
+            'app_version_details': {
+                'version': application_version,
+                'application': {
+                    'slug': application['slug'] if application else None,
+                    'name': application['name'] if application else None,
+                },
+            },
+            'tasks': '{url}/deployments/{id}/tasks/'.format(
+                url=self.url, id=deployment_id),
+            'latest_task': tasks[-1] if tasks else None,
+            'launch_task': tasks[0] if tasks else None,
+            'archived': False,
+            'credentials': 1,
+        }
+        self.deployments[deployment_id] = deployment
+        return deployment
+
+    # Handlers, called with the server's lock held. Items are replaced
+    # rather than changed so that responses can be encoded without the lock.
+
+    def get_deployments(self, query):
+        deployments = self.deployments.values()
+        if 'archived' in query:
+            archived = query['archived'].lower() == 'true'
+            deployments = [deployment for deployment in deployments
+                           if deployment['archived'] == archived]
+        return list(deployments)
+
+    def post_deployments(self, data):
+        _require(data, 'name', 'application', 'deployment_target_id',
+                 'application_version')
+        application = self.applications.get(data['application'])
+        if not application:
+            raise HTTPError(400, "Application {name} not found.".format(
+                name=data['application']))
+        cloud = next(iter(self.clouds.values()), None)
+        deployment_id = max(self.deployments, default=0) + 1
+        return self._add_deployment(
+            deployment_id, data['name'], application, cloud, ['LAUNCH'],
+            minutes=deployment_id,
+            application_version=data['application_version'],
+            config_app=data.get('config_app'))
+
+    def get_deployment(self, id):
+        return _lookup(self.deployments, int(id))
+
+    def put_deployment(self, data, id):
+        deployment = _lookup(self.deployments, int(id))
+        deployment = dict(deployment, **_writable(data, deployment))
+        self.deployments[deployment['id']] = deployment
+        return deployment
+
+    patch_deployment = put_deployment
+
+    def delete_deployment(self, id):
+        _lookup(self.deployments, int(id))
+        del self.deployments[int(id)]
+        del self.tasks[int(id)]
+
+    def get_tasks(self, query, deployment_pk):
+        return list(_lookup(self.tasks, int(deployment_pk)).values())
+
+    def post_tasks(self, data, deployment_pk):
+        _require(data, 'action')
+        deployment = _lookup(self.deployments, int(deployment_pk))
+        task = self._task(deployment['id'], data['action'],
+                          len(self.tasks[deployment['id']]))
+        self.tasks[deployment['id']][task['id']] = task
+        self.deployments[deployment['id']] = dict(deployment,
+                                                  latest_task=task)
+        return task
+
+    def get_task(self, deployment_pk, id):
+        return _lookup(_lookup(self.tasks, int(deployment_pk)), int(id))
+
+    def delete_task(self, deployment_pk, id):
+        tasks = _lookup(self.tasks, int(deployment_pk))
+        _lookup(tasks, int(id))
+        del tasks[int(id)]
+
+    def get_applications(self, query):
+        return list(self.applications.values())
+
+    def post_applications(self, data):
+        _require(data, 'name', 'summary')
+        slug = re.sub(r'[^a-z0-9]+', '-', data['name'].lower()).strip('-')
+        if slug in self.applications:
+            raise HTTPError(400, "Application {slug} already exists.".format(
+                slug=slug))
+        application = dict(self._application(len(self.applications)),
+                           slug=slug, versions=[],
+                           url='{url}/applications/{slug}/'.format(
+                               url=self.url, slug=slug))
+        application.update(_writable(data, application))
+        self.applications[slug] = application
+        return application
+
+    def get_application(self, slug):
+        return _lookup(self.applications, slug)
+
+    def put_application(self, data, slug):
+        application = dict(_lookup(self.applications, slug))
+        application.update(_writable(data, application))
+        self.applications[slug] = application
+        return application
+
+    patch_application = put_application
+
+    def delete_application(self, slug):
+        _lookup(self.applications, slug)
+        del self.applications[slug]
+
+    def get_clouds(self, query):
+        return list(self.clouds.values())
+
+    def get_cloud(self, id):
+        return _lookup(self.clouds, id)
+
+    def get_regions(self, query, cloud_pk):
+        return list(_lookup(self.regions, cloud_pk).values())
+
+    def get_region(self, cloud_pk, id):
+        return _lookup(_lookup(self.regions, cloud_pk), id)
+
+    def get_zones(self, query, cloud_pk, region_pk):
+        return list(_lookup(self.zones, (cloud_pk, region_pk)).values())
+
+    def get_zone(self, cloud_pk, region_pk, id):
+        return _lookup(_lookup(self.zones, (cloud_pk, region_pk)), id)
+
+    def get_vm_types(self, query, cloud_pk, region_pk, zone_pk):
+        vm_types = _lookup(self.vm_types, (cloud_pk, region_pk, zone_pk))
+        min_vcpus = float(query.get('min_vcpus') or 0)
+        min_ram = float(query.get('min_ram') or 0)
+        prefix = query.get('vm_type_prefix') or ''
+        return [vm_type for vm_type in vm_types.values()
+                if float(vm_type['vcpus']) >= min_vcpus and
+                float(vm_type['ram']) >= min_ram and
+                vm_type['name'].startswith(prefix)]
+
+    def get_vm_type(self, cloud_pk, region_pk, zone_pk, id):
+        return _lookup(
+            _lookup(self.vm_types, (cloud_pk, region_pk, zone_pk)), id)
+
+    # Request handling
+
+    def handle(self, method, path, query, data, base_url):
+        """Return (status, response data) of a request to an API path."""
+        with self._lock:
+            self.requests[(method, path)] += 1
+        if not path.startswith(API_PATH):
+            raise HTTPError(404, "Not found.")
+        path = path[len(API_PATH):]
+        for pattern, name in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            raise HTTPError(404, "Not found.")
+        handler = getattr(self, '{method}_{name}'.format(
+            method=method.lower(), name=name), None)
+        if handler is None:
+            raise HTTPError(405, 'Method "{method}" not allowed.'.format(
+                method=method))
+        kwargs = match.groupdict()
+        # Paths of lists don't end with the id of an item
+        is_list = not ({'id', 'slug'} & set(kwargs))
+        args = [query] if method == 'GET' and is_list else []
+        if method in ('POST', 'PUT', 'PATCH'):
+            args = [data]
+        with self._lock:
+            result = handler(*args, **kwargs)
+        if method == 'GET' and is_list:
+            return 200, self._paginate(result, query, base_url)
+        if method == 'POST':
+            return 201, result
+        if method == 'DELETE':
+            return 204, None
+        return 200, result
+
+    def _paginate(self, items, query, base_url):
+        try:
+            page_size = min(int(query.get('page_size') or self.page_size),
+                            self.max_page_size)
+            page = int(query.get('page') or 1)
+        except ValueError:
+            raise HTTPError(404, "Invalid page.")
+        if page < 1 or page_size < 1 or (
+                page > 1 and (page - 1) * page_size >= len(items)):
+            raise HTTPError(404, "Invalid page.")
+
+        def page_url(number):
+            return '{url}?{query}'.format(url=base_url, query=urlencode(
+                dict(query, page=number)))
+
+        start = (page - 1) * page_size
+        return collections.OrderedDict([
+            ('count', len(items)),
+            ('next', page_url(page + 1)
+             if start + page_size < len(items) else None),
+            ('previous', page_url(page - 1) if page > 1 else None),
+            ('results', items[start:start + page_size]),
+        ])
+
+
+def _lookup(items, key):
+    try:
+        return items[key]
+    except KeyError:
+        raise HTTPError(404, "Not found.")
+
+
+def _require(data, *names):
+    missing = [name for name in names if data.get(name) in (None, '')]
+    if missing:
+        raise HTTPError(400, {name: ["This field is required."]
+                              for name in missing})
+
+
+def _writable(data, item):
+    """Return fields of data that a client may change in item."""
+    read_only = ('id', 'url', 'slug', 'added', 'updated', 'owner', 'tasks',
+                 'latest_task', 'launch_task')
+    return {name: value for name, value in data.items()
+            if name in item and name not in read_only}
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeCloudLaunch/1.0'
+    # Headers and body are written separately, which Nagle's algorithm
+    # would delay until the client acknowledges the headers
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        # Logging every request would slow down benchmarks
+        pass
+
+    def _handle(self, method):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlparse(self.path)
+        query = {name: values[-1] for name, values
+                 in parse_qs(url.query, keep_blank_values=True).items()}
+        try:
+            data = self._read_body()
+            if not self._authorized(fake.token):
+                raise HTTPError(401, "Invalid token.")
+            if url.path == API_PATH + 'schema/':
+                with fake._lock:
+                    fake.requests[(method, url.path)] += 1
+                self._send(200, fake._schema_content,
+                           'application/coreapi+json')
+                return
+            base_url = 'http://{host}{path}'.format(
+                host=self.headers.get('Host'), path=url.path)
+            status, result = fake.handle(method, url.path, query, data,
+                                         base_url)
+        except HTTPError as e:
+            status, result = e.status, (e.detail if isinstance(e.detail, dict)
+                                        else {'detail': e.detail})
+        content = (json.dumps(result).encode('utf-8')
+                   if result is not None else b'')
+        self._send(status, content, 'application/json')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not body:
+            return {}
+        content_type = self.headers.get('Content-Type') or ''
+        try:
+            if content_type.startswith('application/json'):
+                return json.loads(body.decode('utf-8'))
+            return {name: values[-1] for name, values
+                    in parse_qs(body.decode('utf-8')).items()}
+        except ValueError:
+            raise HTTPError(400, "Malformed request.")
+
+    def _authorized(self, token):
+        scheme, _, value = (self.headers.get('Authorization') or '').partition(
+            ' ')
+        return scheme == 'Token' and value and (token is None or
+                                                value == token)
+
+    def _send(self, status, content, content_type):
+        etag = None
+        if status == 200 and self.command == 'GET':
+            etag = '"{digest}"'.format(
+                digest=hashlib.md5(content).hexdigest())
+            if etag in (self.headers.get('If-None-Match') or ''):
+                status, content = 304, b''
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a fake CloudLaunch server for testing and "
+                    "benchmarking the client.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--token',
+                        help='Auth token to require, by default any token')
+    for name, default in (('clouds', 2), ('regions', 2), ('zones', 2),
+                          ('vm-types', 20), ('applications', 5),
+                          ('deployments', 100), ('tasks', 2)):
+        parser.add_argument('--' + name, type=int, default=default,
+                            help='Number of {name} (default {default})'.format(
+                                name=name.replace('-', ' '), default=default))
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds by which responses are delayed')
+    parser.add_argument('--payload-size', type=int, default=0,
+                        help='Characters of log added to each task result')
+    args = parser.parse_args(argv)
+    server = FakeCloudLaunchServer(
+        host=args.host, port=args.port, token=args.token, clouds=args.clouds,
+        regions=args.regions, zones=args.zones, vm_types=args.vm_types,
+        applications=args.applications, deployments=args.deployments,
+        tasks=args.tasks, page_size=args.page_size, latency=args.latency,
+        payload_size=args.payload_size)
+    print("Serving fake CloudLaunch API at {url}".format(url=server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
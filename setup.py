@@ -14,9 +14,14 @@ with open('HISTORY.rst') as history_file:
 REQS_BASE = [
     'Click>=6.0',
     'coreapi>=2.2.3',
+    'requests>=2.18.0',
     'arrow>=0.12.0',
 ]
 
+REQS_ASYNC = [
+    'aiohttp>=3.0',
+]
+
 REQS_TEST = ([
     'tox>=2.9.1',
     'coverage>=4.4.1',
@@ -51,6 +56,8 @@ setup(
     include_package_data=True,
     install_requires=REQS_BASE,
     extras_require={
+        'async': REQS_ASYNC,
+        'yaml': ['PyYAML>=3.12'],
         'dev': REQS_DEV,
         'test': REQS_TEST
     },
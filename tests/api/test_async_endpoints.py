@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+
+from cloudlaunch_cli.api import client, resources
+
+import coreapi
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+
+def _schema():
+    id_field = coreapi.Field(name='id', required=True, location='path')
+    deployment_pk = coreapi.Field(name='deployment_pk', required=True,
+                                  location='path')
+    return coreapi.Document(url='/api/v1/schema/', content={
+        'deployments': {
+            'list': coreapi.Link(
+                url='/api/v1/deployments/', action='get',
+                fields=[coreapi.Field(name='archived', location='query')]),
+            'read': coreapi.Link(url='/api/v1/deployments/{id}/',
+                                 action='get', fields=[id_field]),
+            'tasks': {
+                'create': coreapi.Link(
+                    url='/api/v1/deployments/{deployment_pk}/tasks/',
+                    action='post', encoding='application/json',
+                    fields=[deployment_pk,
+                            coreapi.Field(name='action', location='form')]),
+            },
+        },
+    })
+
+
+def _deployment(id):
+    return {'id': id, 'name': 'deployment-%d' % id,
+            'launch_task': {'id': id * 10, 'action': 'LAUNCH'},
+            'latest_task': {'id': id * 10, 'action': 'LAUNCH'}}
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAsyncAPIClient(unittest.TestCase):
+    """Tests for AsyncAPIClient, against an aiohttp server."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.requests = []
+        self.loop.run_until_complete(self._start_server())
+
+    async def _start_server(self):
+        codec = coreapi.codecs.CoreJSONCodec()
+
+        async def schema(request):
+            return web.Response(body=codec.encode(_schema()),
+                                content_type='application/coreapi+json')
+
+        async def list_deployments(request):
+            self.requests.append(request)
+            page = int(request.query.get('page', 1))
+            base = str(request.url.with_query({}))
+            return web.json_response({
+                'count': 3,
+                'next': base + '?page=2' if page == 1 else None,
+                'previous': None,
+                'results': ([_deployment(1), _deployment(2)] if page == 1
+                            else [_deployment(3)])
+            })
+
+        async def get_deployment(request):
+            self.requests.append(request)
+            return web.json_response(
+                _deployment(int(request.match_info['id'])))
+
+        async def create_task(request):
+            self.requests.append(request)
+            data = await request.json()
+            return web.json_response({'id': 99, 'action': data['action']},
+                                     status=201)
+
+        app = web.Application()
+        app.router.add_get('/api/v1/schema/', schema)
+        app.router.add_get('/api/v1/deployments/', list_deployments)
+        app.router.add_get('/api/v1/deployments/{id}/', get_deployment)
+        app.router.add_post('/api/v1/deployments/{id}/tasks/', create_task)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = 'http://127.0.0.1:{port}/api/v1'.format(port=port)
+        self.addCleanup(self.loop.run_until_complete, self.runner.cleanup())
+
+    def _run(self, coroutine_function):
+        async def run():
+            async with client.AsyncAPIClient(
+                    url=self.url, token='abc123',
+                    schema_cache=False) as api_client:
+                return await coroutine_function(api_client)
+        return self.loop.run_until_complete(run())
+
+    def test_get(self):
+        deployment = self._run(lambda c: c.deployments.get(2))
+        self.assertIsInstance(deployment, resources.Deployment)
+        self.assertEqual(deployment.name, 'deployment-2')
+        self.assertIsInstance(deployment.latest_task, resources.Task)
+        self.assertEqual(self.requests[0].headers['Authorization'],
+                         'Token abc123')
+
+    def test_list_follows_pages(self):
+        deployments = self._run(
+            lambda c: c.deployments.list(archived=False))
+        self.assertEqual([d.id for d in deployments], [1, 2, 3])
+        self.assertEqual(self.requests[0].query['archived'], 'false')
+
+    def test_subroute(self):
+        async def health_check(api_client):
+            deployment = await api_client.deployments.get(2)
+            return await deployment.run_health_check()
+        task = self._run(health_check)
+        self.assertIsInstance(task, resources.Task)
+        self.assertEqual(task.action, 'HEALTH_CHECK')
+        self.assertEqual(self.requests[-1].path,
+                         '/api/v1/deployments/2/tasks/')
@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from cloudlaunch_cli.api import batch
+
+
+class TestRunConcurrently(unittest.TestCase):
+    """Tests for run_concurrently."""
+
+    def test_results_and_errors(self):
+        def square(n):
+            if n == 3:
+                raise ValueError("three")
+            return n * n
+
+        results = list(batch.run_concurrently(square, range(5),
+                                              concurrency=2))
+        self.assertEqual(sorted(r.item for r in results), [0, 1, 2, 3, 4])
+        by_item = {r.item: r for r in results}
+        self.assertEqual(by_item[4].result, 16)
+        self.assertIsNone(by_item[4].error)
+        self.assertIsInstance(by_item[3].error, ValueError)
+
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def work(n):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'],
+                                           state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+        list(batch.run_concurrently(work, range(20), concurrency=3))
+        self.assertEqual(state['max_running'], 3)
+
+
+class TestCreateDeployments(unittest.TestCase):
+    """Tests for create_deployments."""
+
+    def test_uses_client_per_cloud(self):
+        clients = {'aws': Mock(), 'gcp': Mock()}
+        specs = [
+            {'cloud': 'aws', 'name': 'a', 'application': 'ubuntu',
+             'deployment_target_id': 1, 'application_version': '16.04'},
+            {'cloud': 'gcp', 'name': 'b', 'application': 'ubuntu',
+             'deployment_target_id': 2, 'application_version': '16.04'},
+        ]
+        results = list(batch.create_deployments(clients, specs))
+        self.assertEqual(len(results), 2)
+        clients['aws'].deployments.create.assert_called_once_with(
+            name='a', application='ubuntu', deployment_target_id=1,
+            application_version='16.04')
+        clients['gcp'].deployments.create.assert_called_once_with(
+            name='b', application='ubuntu', deployment_target_id=2,
+            application_version='16.04')
+
+    def test_failed_client(self):
+        error = Exception("Cloud not found")
+        clients = {'aws': Mock(), 'gcp': error}
+        specs = [{'cloud': 'gcp', 'name': 'a'}, {'cloud': 'aws', 'name': 'b'},
+                 {'cloud': 'gcp', 'name': 'c'}]
+        results = list(batch.create_deployments(clients, specs))
+        errors = {r.item['name']: r.error for r in results}
+        self.assertEqual(errors, {'a': error, 'b': None, 'c': error})
+        clients['aws'].deployments.create.assert_called_once_with(name='b')
+
+
+class TestRunHealthChecks(unittest.TestCase):
+    """Tests for run_health_checks."""
+
+    def _deployment(self, id, statuses):
+        deployment = Mock(id=id)
+        tasks = [Mock(id=id * 10, status=status) for status in statuses]
+        deployment.tasks.create.return_value = tasks[0]
+        deployment.tasks.get.side_effect = tasks[1:]
+        return deployment
+
+    def test_polls_until_done(self):
+        done = self._deployment(1, ['SUCCESS'])
+        slow = self._deployment(2, ['PENDING', 'STARTED', 'SUCCESS'])
+        failed = self._deployment(3, ['PENDING'])
+        failed.tasks.create.side_effect = ValueError("no credentials")
+        results = list(batch.run_health_checks(
+            [done, slow, failed], poll_interval=0.01))
+        by_id = {r.item.id: r for r in results}
+        self.assertEqual(by_id[1].result.status, 'SUCCESS')
+        self.assertEqual(by_id[2].result.status, 'SUCCESS')
+        self.assertEqual(slow.tasks.get.call_count, 2)
+        slow.tasks.get.assert_called_with(20)
+        self.assertIsInstance(by_id[3].error, ValueError)
+
+    def test_timeout(self):
+        stuck = self._deployment(1, ['PENDING'] * 100)
+        results = list(batch.run_health_checks(
+            [stuck], poll_interval=0.01, timeout=0.05))
+        self.assertEqual(len(results), 1)
+        self.assertIsNotNone(results[0].error)
+        self.assertEqual(results[0].result.status, 'PENDING')
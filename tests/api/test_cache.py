@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from cloudlaunch_cli.api import cache
+
+import coreapi
+
+
+SCHEMA_URL = "http://localhost:8000/api/v1/schema/"
+
+
+def _schema_response(status_code=200, etag='"v1"'):
+    document = coreapi.Document(url=SCHEMA_URL, content={
+        'parent': {
+            'list': coreapi.Link(url='/api/v1/parent/', action='get'),
+        }
+    })
+    response = Mock(status_code=status_code)
+    response.headers = {
+        'ETag': etag,
+        'Content-Type': 'application/coreapi+json',
+    }
+    response.content = coreapi.codecs.CoreJSONCodec().encode(document) \
+        if status_code == 200 else b''
+    return response
+
+
+class TestSchemaCache(unittest.TestCase):
+    """Tests for SchemaCache."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.decoders = coreapi.Client().decoders
+        self.session = Mock()
+        self.session.get.return_value = _schema_response()
+
+    def _get(self, schema_cache, token="abc123"):
+        return schema_cache.get(self.session, SCHEMA_URL, token,
+                                self.decoders)
+
+    def test_fetches_once(self):
+        """Test that the schema is only downloaded once within the ttl."""
+        schema_cache = cache.SchemaCache(cache_dir=self.cache_dir)
+        document = self._get(schema_cache)
+        self.assertIn('parent', document)
+        self._get(schema_cache)
+        # A new instance reads the schema from disk
+        self._get(cache.SchemaCache(cache_dir=self.cache_dir))
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_keyed_by_token(self):
+        """Test that different tokens don't share a cached schema."""
+        schema_cache = cache.SchemaCache(cache_dir=self.cache_dir)
+        self._get(schema_cache, token="abc123")
+        self._get(schema_cache, token="def456")
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_revalidates_when_expired(self):
+        """Test that an expired schema is revalidated using its ETag."""
+        schema_cache = cache.SchemaCache(cache_dir=self.cache_dir, ttl=0)
+        first = self._get(schema_cache)
+        self.session.get.return_value = _schema_response(status_code=304)
+        second = self._get(schema_cache)
+        self.assertIs(first, second)
+        self.assertEqual(
+            self.session.get.call_args[1]['headers']['If-None-Match'],
+            '"v1"')
+
+    def test_invalidate(self):
+        """Test that invalidating forces the schema to be downloaded."""
+        schema_cache = cache.SchemaCache(cache_dir=self.cache_dir)
+        self._get(schema_cache)
+        self.assertEqual(schema_cache.invalidate(SCHEMA_URL, "abc123"), 1)
+        self._get(schema_cache)
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertEqual(schema_cache.invalidate(), 1)
+        self.assertEqual(os.listdir(schema_cache.cache_dir), [])
+
+    def test_expired_entry_on_disk(self):
+        """Test that an expired entry written by another process is used."""
+        schema_cache = cache.SchemaCache(cache_dir=self.cache_dir)
+        self._get(schema_cache)
+        other_cache = cache.SchemaCache(cache_dir=self.cache_dir, ttl=60)
+        key = cache._cache_key(SCHEMA_URL, "abc123")
+        entry = other_cache._read_entry(key)
+        entry['fetched_at'] = time.time() - 120
+        other_cache._write_entry(key, entry)
+        self.session.get.return_value = _schema_response(status_code=304)
+        document = self._get(other_cache)
+        self.assertIn('parent', document)
+        self.assertEqual(self.session.get.call_count, 2)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Tests for ResponseCache and its backends."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.db_path = os.path.join(self.cache_dir, 'responses.sqlite3')
+
+    def test_memory_lru_and_expiry(self):
+        memory = cache.MemoryCache(max_entries=2)
+        expires = time.time() + 60
+        memory.set('a', 1, expires)
+        memory.set('b', 2, expires)
+        memory.get('a')
+        memory.set('c', 3, expires)
+        self.assertIsNone(memory.get('b'))
+        self.assertEqual(memory.get('a'), (1, expires))
+        memory.set('d', 4, time.time() - 1)
+        self.assertIsNone(memory.get('d'))
+
+    def test_sqlite_persists(self):
+        expires = time.time() + 60
+        cache.SQLiteCache(self.db_path).set('a', {'id': 'aws'}, expires)
+        self.assertEqual(cache.SQLiteCache(self.db_path).get('a'),
+                         ({'id': 'aws'}, expires))
+
+    def test_sqlite_eviction(self):
+        sqlite_cache = cache.SQLiteCache(self.db_path, max_entries=2)
+        sqlite_cache.set('expired', 0, time.time() - 1)
+        for key in ('a', 'b', 'c'):
+            sqlite_cache.set(key, key, time.time() + 60)
+        self.assertIsNone(sqlite_cache.get('expired'))
+        self.assertIsNone(sqlite_cache.get('a'))
+        self.assertEqual(sqlite_cache.get('c')[0], 'c')
+        sqlite_cache.clear()
+        self.assertIsNone(sqlite_cache.get('c'))
+
+    def test_get_or_fetch(self):
+        response_cache = cache.ResponseCache(
+            persistent=cache.SQLiteCache(self.db_path))
+        fetch = Mock(return_value=[{'id': 'aws'}])
+        key = ['http://localhost/api/v1', ['clouds'], 'list', {}]
+        self.assertEqual(response_cache.get_or_fetch(key, 60, fetch),
+                         [{'id': 'aws'}])
+        response_cache.get_or_fetch(key, 60, fetch)
+        # A new cache with the same persistent storage is also a hit
+        cache.ResponseCache(
+            persistent=cache.SQLiteCache(self.db_path)).get_or_fetch(
+                key, 60, fetch)
+        self.assertEqual(fetch.call_count, 1)
+        # Refreshing fetches again and updates the cache
+        fetch.return_value = [{'id': 'gcp'}]
+        cache.ResponseCache(persistent=cache.SQLiteCache(self.db_path),
+                            refresh=True).get_or_fetch(key, 60, fetch)
+        self.assertEqual(
+            cache.ResponseCache(
+                persistent=cache.SQLiteCache(self.db_path)).get_or_fetch(
+                    key, 60, fetch),
+            [{'id': 'gcp'}])
+        self.assertEqual(fetch.call_count, 2)
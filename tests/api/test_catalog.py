@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from cloudlaunch_cli.api import catalog, resources
+
+
+def _resource(data, children_name=None, children=None):
+    """Mock an APIResource with an endpoint listing its children."""
+    resource = Mock()
+    resource.id = data.get('id') or data.get('region_id') or data['zone_id']
+    resource.asdict.return_value = data
+    if children_name:
+        getattr(resource, children_name).list.return_value = children
+    return resource
+
+
+def _zone(zone_id, vm_types):
+    return _resource({'zone_id': zone_id, 'name': zone_id}, 'vm_types', [
+        _resource({'id': name, 'name': name, 'vcpus': vcpus, 'ram': ram})
+        for name, vcpus, ram in vm_types])
+
+
+class TestCatalog(unittest.TestCase):
+    """Tests for crawling, saving and querying catalogs."""
+
+    def setUp(self):
+        self.aws = _resource({'id': 'aws', 'name': 'AWS'}, 'regions', [
+            _resource({'region_id': 'us-east-1', 'name': 'us-east-1'},
+                      'zones', [
+                          _zone('us-east-1a', [('m5.large', '2', '8.0'),
+                                               ('m5.2xlarge', '8', '32.0')]),
+                          _zone('us-east-1b', [('t2.micro', '1', '1.0')]),
+                      ]),
+        ])
+        self.gcp = _resource({'id': 'gcp', 'name': 'GCP'})
+        self.gcp.regions.list.side_effect = Exception("No credentials")
+        self.api_client = Mock()
+        self.api_client.api_config.url = "http://localhost:8000/api/v1"
+        self.api_client.infrastructure.clouds.list.return_value = [
+            self.aws, self.gcp]
+
+    def test_crawl(self):
+        infrastructure = catalog.crawl(self.api_client, concurrency=4)
+        self.assertEqual(infrastructure.counts(), {
+            'clouds': 2, 'regions': 1, 'zones': 2, 'vm_types': 3})
+        self.assertEqual([node['id'] for node in infrastructure.errors()],
+                         ['gcp'])
+        self.assertEqual(infrastructure.url, "http://localhost:8000/api/v1")
+        zone = infrastructure.find_zone('aws', 'us-east-1', 'us-east-1b')
+        self.assertEqual([vm_type['name'] for vm_type in zone['vm_types']],
+                         ['t2.micro'])
+
+    def test_crawl_is_concurrent(self):
+        """Test that sibling nodes are listed at the same time."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait_for_sibling(vm_types):
+            # Times out unless both zones are listed at the same time
+            barrier.wait()
+            return vm_types
+
+        for zone in self.aws.regions.list.return_value[0].zones.list():
+            vm_types = zone.vm_types.list.return_value
+            zone.vm_types.list.side_effect = (
+                lambda vm_types=vm_types: wait_for_sibling(vm_types))
+        infrastructure = catalog.crawl(self.api_client, concurrency=2)
+        self.assertEqual(infrastructure.counts()['vm_types'], 3)
+
+    def test_crawl_with_cloud_clients(self):
+        aws_client = Mock()
+        regions = Mock()
+        regions.list.return_value = []
+        aws_client.infrastructure.clouds.subroutes.return_value = {
+            resources.Region: regions}
+        infrastructure = catalog.crawl(self.api_client,
+                                       clients={'aws': aws_client})
+        aws_client.infrastructure.clouds.subroutes.assert_called_with('aws')
+        self.aws.regions.list.assert_not_called()
+        self.assertEqual(infrastructure.counts()['regions'], 0)
+
+    def test_crawl_with_failed_client(self):
+        infrastructure = catalog.crawl(self.api_client, clients={
+            'aws': Exception("Invalid credentials")})
+        self.assertEqual([node['id'] for node in infrastructure.errors()],
+                         ['aws', 'gcp'])
+        self.aws.regions.list.assert_not_called()
+
+    def test_save_and_load(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        path = os.path.join(cache_dir, 'catalogs', 'catalog.json.gz')
+        infrastructure = catalog.crawl(self.api_client)
+        infrastructure.save(path)
+        loaded = catalog.Catalog.load(path)
+        self.assertEqual(loaded.clouds, infrastructure.clouds)
+        self.assertEqual(loaded.created, infrastructure.created)
+        self.assertLess(loaded.age, 60)
+        self.assertIsNone(catalog.Catalog.load(
+            os.path.join(cache_dir, 'missing.json.gz')))
+
+    def test_vm_types(self):
+        infrastructure = catalog.Catalog(
+            catalog.crawl(self.api_client).clouds, created=time.time())
+        matches = infrastructure.vm_types(min_vcpus=2, prefix='m5')
+        self.assertEqual([(zone['zone_id'], vm_type['name'])
+                          for _, _, zone, vm_type in matches],
+                         [('us-east-1a', 'm5.large'),
+                          ('us-east-1a', 'm5.2xlarge')])
+        matches = infrastructure.vm_types(min_ram=16, zone_id='us-east-1b')
+        self.assertEqual(list(matches), [])
+
+
+class TestVmTypeIndex(unittest.TestCase):
+    """Tests for VmTypeIndex queries."""
+
+    def setUp(self):
+        self.vm_types = [
+            {'name': name, 'vcpus': vcpus, 'ram': ram}
+            for name, vcpus, ram in [
+                ('m5.2xlarge', '8', '32.0'),
+                ('c5.2xlarge', '8', '16.0'),
+                ('t2.micro', '1', '1.0'),
+                ('m5.large', '2', '8.0'),
+                ('m5.xlarge', '4', '16.0'),
+                ('r5.large', '2', '16.0'),
+            ]]
+        self.index = catalog.VmTypeIndex(self.vm_types)
+
+    def _names(self, vm_types):
+        return [vm_type['name'] for vm_type in vm_types]
+
+    def test_query_ranges(self):
+        self.assertEqual(
+            self._names(self.index.query(min_vcpus=2, max_vcpus=4)),
+            ['m5.large', 'r5.large', 'm5.xlarge'])
+        self.assertEqual(
+            self._names(self.index.query(min_ram=16, max_ram=16)),
+            ['r5.large', 'm5.xlarge', 'c5.2xlarge'])
+        self.assertEqual(self.index.query(min_vcpus=16), [])
+
+    def test_query_prefix(self):
+        self.assertEqual(
+            self._names(self.index.query(prefix='m5', min_ram=16)),
+            ['m5.xlarge', 'm5.2xlarge'])
+        self.assertEqual(self.index.query(prefix='x1'), [])
+
+    def test_query_sort(self):
+        self.assertEqual(
+            self._names(self.index.query(sort=['-vcpus', 'ram'])),
+            ['c5.2xlarge', 'm5.2xlarge', 'm5.xlarge', 'm5.large',
+             'r5.large', 't2.micro'])
+        self.assertEqual(
+            self._names(self.index.query(sort=['-name'], min_vcpus=8)),
+            ['m5.2xlarge', 'c5.2xlarge'])
+        # Without sort keys items keep the order they were indexed in
+        self.assertEqual(self.index.query(sort=()), self.vm_types)
+        with self.assertRaises(Exception):
+            self.index.query(sort=['price'])
+
+    def test_best_fit(self):
+        self.assertEqual(
+            self.index.best_fit(min_vcpus=2, min_ram=12)['name'], 'r5.large')
+        self.assertEqual(
+            self.index.best_fit(min_ram=12, prefix='m5')['name'], 'm5.xlarge')
+        self.assertIsNone(self.index.best_fit(min_vcpus=8, min_ram=64))
+
+    def test_catalog_best_fit(self):
+        infrastructure = catalog.Catalog([{
+            'id': 'aws', 'regions': [{
+                'region_id': 'us-east-1', 'zones': [
+                    {'zone_id': 'us-east-1a', 'vm_types': self.vm_types[:2]},
+                    {'zone_id': 'us-east-1b', 'vm_types': self.vm_types[2:]},
+                ]}]}])
+        self.assertEqual(
+            [(zone['zone_id'], vm_type['name']) for _, _, zone, vm_type
+             in infrastructure.vm_types(min_vcpus=4, best_fit=True)],
+            [('us-east-1b', 'm5.xlarge')])
+        self.assertEqual(
+            [(zone['zone_id'], vm_type['name']) for _, _, zone, vm_type
+             in infrastructure.vm_types(min_vcpus=4, best_fit=True,
+                                        zone_id='us-east-1a')],
+            [('us-east-1a', 'c5.2xlarge')])
@@ -1,8 +1,11 @@
 
+import concurrent.futures
+import threading
+import time
 import unittest
 import unittest.mock
 
-from cloudlaunch_cli.api import client, endpoints, resources
+from cloudlaunch_cli.api import cache, client, endpoints, resources
 
 import coreapi
 
@@ -49,7 +52,7 @@ class TestCoreAPIBasedAPIEndpoint(unittest.TestCase):
             coreapi.Client, instance=True)
         self.coreapi_client_patcher = unittest.mock.patch(
             'coreapi.Client', return_value=self.coreapi_client_mock)
-        self.coreapi_client_patcher.start()
+        self.coreapi_client_class_mock = self.coreapi_client_patcher.start()
         self.addCleanup(self.coreapi_client_patcher.stop)
         self.config = client.APIConfig(url="http://localhost:8000/api/v1",
                                        token="abc123")
@@ -129,6 +132,57 @@ class TestCoreAPIBasedAPIEndpoint(unittest.TestCase):
             }
         )
 
+    def test_sibling_subroutes_dont_share_parent_url_kwargs(self):
+        """Test that subroutes for different ids keep their own ids."""
+        parent_kwargs = {'parent_parent_pk': 33}
+        child_12 = ChildEndpoint(self.config, parent_id=12,
+                                 parent_url_kwargs=parent_kwargs)
+        child_13 = ChildEndpoint(self.config, parent_id=13,
+                                 parent_url_kwargs=parent_kwargs)
+        self.assertEqual(child_12.parent_url_kwargs,
+                         {'parent_parent_pk': 33, 'parent_pk': 12})
+        self.assertEqual(child_13.parent_url_kwargs,
+                         {'parent_parent_pk': 33, 'parent_pk': 13})
+        self.assertEqual(parent_kwargs, {'parent_parent_pk': 33})
+
+    def test_subroute_registry(self):
+        """Test subroutes declared with subroute()."""
+        self.assertEqual(endpoints.Deployments._subroute_types,
+                         {resources.Task: endpoints.DeploymentTasks})
+        deployments = endpoints.Deployments(self.config)
+        self.assertIsInstance(deployments.tasks, endpoints.DeploymentTasks)
+        self.assertIs(deployments.tasks, deployments.tasks)
+        tasks = deployments.subroutes(12)[resources.Task]
+        self.assertEqual(tasks.parent_url_kwargs, {'deployment_pk': 12})
+        # Subroute endpoints are reused for the same parent id
+        self.assertIs(deployments.subroutes(12)[resources.Task], tasks)
+        self.assertIsNot(deployments.subroutes(13)[resources.Task], tasks)
+
+    def test_subroutes_cache_is_bounded(self):
+        deployments = endpoints.Deployments(self.config)
+        deployments.max_cached_subroutes = 2
+        tasks = deployments.subroutes(1)[resources.Task]
+        deployments.subroutes(2)
+        deployments.subroutes(3)
+        self.assertEqual(list(deployments._subroutes), [2, 3])
+        self.assertIsNot(deployments.subroutes(1)[resources.Task], tasks)
+
+    def test_subroute_properties(self):
+        """Test that properties are only checked once per class."""
+        class Endpoint(ParentEndpoint):
+            pass
+
+        with unittest.mock.patch.object(
+                ChildEndpoint, '__init__', autospec=True,
+                side_effect=ChildEndpoint.__init__) as init:
+            subroutes = Endpoint(self.config).subroutes(12)
+            Endpoint(self.config).subroutes(13)
+        self.assertEqual(list(subroutes), [ChildResource])
+        self.assertEqual(subroutes[ChildResource].parent_url_kwargs,
+                         {'parent_pk': 12})
+        # Once for the property and once per subroutes() call
+        self.assertEqual(init.call_count, 3)
+
     def test_list(self):
         """Test 'list' request that returns paged results."""
         document = {}
@@ -165,6 +219,121 @@ class TestCoreAPIBasedAPIEndpoint(unittest.TestCase):
                 'parent_pk': parent.id
             })
 
+    def test_list_multiple_pages(self):
+        """Test 'list' follows 'next' links to fetch all pages."""
+        document = {}
+        next_url = "http://localhost:8000/api/v1/parent/?page=2"
+        self.coreapi_client_mock.configure_mock(**{
+            'get.side_effect': [document, {
+                'count': 3,
+                'next': None,
+                'previous': "http://localhost:8000/api/v1/parent/",
+                'results': [{'id': 202, 'name': 'parent-202'}]
+            }],
+            'action.return_value': {
+                'count': 3,
+                'next': next_url,
+                'previous': None,
+                'results': [{
+                    'id': 12,
+                    'name': 'parent-12'
+                }, {
+                    'id': 201,
+                    'name': 'parent-201'
+                }]
+            }
+        })
+
+        parents = self.parent_endpoint.list()
+        self.assertEqual([parent.id for parent in parents], [12, 201, 202])
+        self.coreapi_client_mock.get.assert_called_with(next_url)
+
+    def test_iter_is_lazy(self):
+        """Test 'iter' fetches pages on demand and respects limit."""
+        document = {}
+        self.coreapi_client_mock.configure_mock(**{
+            'get.return_value': document,
+            'action.return_value': {
+                'count': 30,
+                'next': "http://localhost:8000/api/v1/parent/?page=2",
+                'previous': None,
+                'results': [{'id': i, 'name': 'parent-%d' % i}
+                            for i in range(10)]
+            }
+        })
+
+        parents = self.parent_endpoint.iter(page_size=10, limit=5)
+        self.coreapi_client_mock.action.assert_not_called()
+        self.assertEqual([parent.id for parent in parents], [0, 1, 2, 3, 4])
+        self.coreapi_client_mock.action.assert_called_once_with(
+            document, ['parent', 'list'], params={'page_size': 10})
+        # Only the schema was fetched with 'get', not the second page
+        self.assertEqual(self.coreapi_client_mock.get.call_count, 1)
+
+    def test_iter_compact(self):
+        """Test 'iter' returning compact records."""
+        self.coreapi_client_mock.configure_mock(**{
+            'get.return_value': {},
+            'action.return_value': [
+                {'id': i, 'name': 'parent-%d' % i, 'tags': ['a']}
+                for i in range(3)]
+        })
+        parents = list(self.parent_endpoint.iter(compact=True))
+        self.assertEqual([parent.name for parent in parents],
+                         ['parent-0', 'parent-1', 'parent-2'])
+        self.assertIsInstance(parents[0], resources.CompactRecord)
+        self.assertEqual(parents[0].resource_type, ParentResource)
+        self.assertIs(parents[0].tags, parents[2].tags)
+
+    def test_iter_prefetch(self):
+        """Test 'iter' with prefetch fetches pages concurrently, in order."""
+        document = {}
+        page_url = "http://localhost:8000/api/v1/parent/?page={page}"
+
+        def get(url):
+            if url.endswith('schema/'):
+                return document
+            page = int(url.split('=')[1])
+            # Make earlier pages slower to verify that order is preserved
+            time.sleep(0.01 * (5 - page))
+            return {
+                'count': 10,
+                'next': page_url.format(page=page + 1) if page < 5 else None,
+                'results': [{'id': page * 2}, {'id': page * 2 + 1}]
+            }
+        self.coreapi_client_mock.configure_mock(**{
+            'get.side_effect': get,
+            'action.return_value': {
+                'count': 10,
+                'next': page_url.format(page=2),
+                'previous': None,
+                'results': [{'id': 2}, {'id': 3}]
+            }
+        })
+
+        parents = self.parent_endpoint.iter(prefetch=4)
+        self.assertEqual([parent.id for parent in parents], list(range(2, 12)))
+        # Schema plus pages 2 to 5
+        self.assertEqual(self.coreapi_client_mock.get.call_count, 5)
+
+    def test_remaining_page_urls(self):
+        """Test computing page URLs for prefetching."""
+        page = {
+            'count': 25,
+            'next': "http://localhost/api/v1/parent/?limit=10&offset=10",
+            'results': [{}] * 10
+        }
+        self.assertEqual(endpoints._remaining_page_urls(page), [
+            "http://localhost/api/v1/parent/?limit=10&offset=10",
+            "http://localhost/api/v1/parent/?limit=10&offset=20",
+        ])
+        page['next'] = "http://localhost/api/v1/parent/?page=2&archived=true"
+        self.assertEqual(endpoints._remaining_page_urls(page, limit=15), [
+            "http://localhost/api/v1/parent/?page=2&archived=true",
+        ])
+        page['next'] = "http://localhost/api/v1/parent/?cursor=abc"
+        self.assertIsNone(endpoints._remaining_page_urls(page))
+
     def test_create(self):
         """Test 'create' method."""
         document = {}
@@ -283,8 +452,117 @@ class TestCoreAPIBasedAPIEndpoint(unittest.TestCase):
         self.coreapi_client_mock.action.assert_called_with(
             document, ['parent', 'delete'], params={'id': 12})
 
+    def test_shared_connection(self):
+        """Test that endpoints of a config share one client and schema."""
+        document = {}
+        self.coreapi_client_mock.configure_mock(**{
+            'get.return_value': document,
+            'action.return_value': {
+                'id': 12,
+                'name': 'parent-12'
+            }
+        })
+
+        parent_12 = self.parent_endpoint.get(12)
+        parent_12.child.get(22)
+        ParentEndpoint(self.config).get(13)
+        self.assertEqual(self.coreapi_client_class_mock.call_count, 1)
+        self.coreapi_client_mock.get.assert_called_once_with(
+            "http://localhost:8000/api/v1/schema/")
+
+        # Closing the config creates a new connection on next use
+        connection = self.config.connection
+        self.config.close()
+        self.assertIsNot(connection, self.config.connection)
+
+    def test_response_cache(self):
+        """Test that endpoints with a cache_ttl use the response cache."""
+        document = {}
+        self.coreapi_client_mock.configure_mock(**{
+            'get.return_value': document,
+            'action.return_value': {
+                'id': 12,
+                'name': 'parent-12'
+            }
+        })
+        self.config.response_cache = cache.ResponseCache()
+
+        self.parent_endpoint.get(12)
+        self.parent_endpoint.get(12)
+        self.assertEqual(self.coreapi_client_mock.action.call_count, 2)
+
+        ParentEndpoint.cache_ttl = 60
+        self.addCleanup(setattr, ParentEndpoint, 'cache_ttl', None)
+        parent_12 = self.parent_endpoint.get(12)
+        self.parent_endpoint.get(12)
+        self.assertEqual(self.coreapi_client_mock.action.call_count, 3)
+        self.assertEqual(self.parent_endpoint.get(12).name, parent_12.name)
+        # Different params aren't served from the cache
+        self.parent_endpoint.get(13)
+        self.assertEqual(self.coreapi_client_mock.action.call_count, 4)
+
+    def test_concurrent_reads_coalesced(self):
+        """Test that concurrent identical reads make one request."""
+        started = threading.Event()
+        finish = threading.Event()
+
+        def action(document, keys, params):
+            started.set()
+            finish.wait(5)
+            return {'id': params['id'], 'name': 'parent'}
+
+        self.coreapi_client_mock.configure_mock(**{
+            'get.return_value': {}, 'action.side_effect': action})
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+        self.addCleanup(executor.shutdown)
+        first = executor.submit(self.parent_endpoint.get, 12)
+        started.wait(5)
+        others = [executor.submit(ParentEndpoint(self.config).get, 12)
+                  for _ in range(3)]
+        other_id = executor.submit(self.parent_endpoint.get, 13)
+        # Let the waiting threads join the request in progress
+        time.sleep(0.1)
+        finish.set()
+        parents = [first.result()] + [f.result() for f in others]
+        self.assertEqual(other_id.result().id, 13)
+        self.assertEqual(self.coreapi_client_mock.action.call_count, 2)
+        # The shared response is copied when changed
+        parents[0].name = 'changed'
+        self.assertEqual([p.name for p in parents[1:]], ['parent'] * 3)
+
     def _assertParentResourceEqual(self, a, b):
         self.assertIsInstance(a, ParentResource)
         self.assertIsInstance(b, ParentResource)
         self.assertEqual(a.id, b.id)
         self.assertEqual(a.name, b.name)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests for coalescing calls with SingleFlight."""
+
+    def test_sequential_calls(self):
+        single_flight = endpoints.SingleFlight()
+        self.assertEqual(single_flight.do('a', lambda: 1), (1, False))
+        self.assertEqual(single_flight.do('a', lambda: 2), (2, False))
+
+    def test_error_shared(self):
+        single_flight = endpoints.SingleFlight()
+        started = threading.Event()
+        finish = threading.Event()
+
+        def fail():
+            started.set()
+            finish.wait(5)
+            raise ValueError("failed")
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        leader = executor.submit(single_flight.do, 'a', fail)
+        started.wait(5)
+        follower = executor.submit(single_flight.do, 'a', fail)
+        time.sleep(0.1)
+        finish.set()
+        for future in (leader, follower):
+            with self.assertRaises(ValueError):
+                future.result()
+        self.assertEqual(single_flight.do('a', lambda: 1), (1, False))
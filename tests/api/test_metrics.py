@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.request
+
+from cloudlaunch_cli.api import cache, metrics
+from cloudlaunch_cli.api.client import APIClient
+from cloudlaunch_cli.testing.server import FakeCloudLaunchServer
+
+
+class TestMetricsFormat(unittest.TestCase):
+    """Tests of the exposition of metrics."""
+
+    def test_counter(self):
+        counter = metrics.Counter('requests', 'Requests.', ['action'])
+        counter.inc(('list',))
+        counter.inc(('list',), 2)
+        counter.inc(('say "hi"\n',), 0.5)
+        self.assertEqual(counter.samples(), [
+            ('_total', (('action', 'list'),), 3),
+            ('_total', (('action', 'say "hi"\n'),), 0.5)])
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('latency', 'Latency.', ['action'],
+                                      buckets=[0.1, 1])
+        for value in (0.05, 0.5, 5):
+            histogram.observe(('get',), value)
+        self.assertEqual(histogram.get(('get',)), (3, 5.55))
+        labels = (('action', 'get'),)
+        self.assertEqual(histogram.samples(), [
+            ('_bucket', labels + (('le', '0.1'),), 1),
+            ('_bucket', labels + (('le', '1'),), 2),
+            ('_bucket', labels + (('le', '+Inf'),), 3),
+            ('_count', labels, 3),
+            ('_sum', labels, 5.55)])
+
+    def test_exposition(self):
+        client_metrics = metrics.ClientMetrics()
+        client_metrics.retries.inc(('deployments', 'list'))
+        client_metrics.cache_lookups.inc(('schema', 'hit'))
+        text = client_metrics.exposition()
+        self.assertIn('# TYPE cloudlaunch_client_retries_total counter\n',
+                      text)
+        self.assertIn('cloudlaunch_client_retries_total'
+                      '{endpoint="deployments",action="list"} 1\n', text)
+        self.assertIn('# TYPE cloudlaunch_client_request_duration_seconds '
+                      'histogram\n', text)
+        self.assertNotIn('# EOF', text)
+        openmetrics = client_metrics.exposition(openmetrics=True)
+        self.assertIn('# TYPE cloudlaunch_client_retries counter\n',
+                      openmetrics)
+        self.assertIn('cloudlaunch_client_cache_lookups_total'
+                      '{cache="schema",result="hit"} 1\n', openmetrics)
+        self.assertTrue(openmetrics.endswith('# EOF\n'))
+
+
+class TestClientMetrics(unittest.TestCase):
+    """Tests of metrics of requests made to the fake server."""
+
+    def setUp(self):
+        self.server = FakeCloudLaunchServer(deployments=3).start()
+        self.addCleanup(self.server.stop)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.metrics = metrics.enable()
+        self.addCleanup(metrics.disable)
+
+    def _client(self, **kwargs):
+        kwargs.setdefault('schema_cache', False)
+        client = APIClient(url=self.server.url, token='token', **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_requests(self):
+        client = self._client()
+        client.deployments.get(1)
+        client.deployments.get(2)
+        client.deployments.tasks  # not a request
+        with self.assertRaises(Exception):
+            client.deployments.get(100)
+        requests = self.metrics.requests
+        self.assertEqual(requests.get(('', 'schema', 'GET', '200')), 1)
+        self.assertEqual(
+            requests.get(('deployments', 'read', 'GET', '200')), 2)
+        self.assertEqual(
+            requests.get(('deployments', 'read', 'GET', '404')), 1)
+        count, total = self.metrics.request_duration.get(
+            ('deployments', 'read'))
+        self.assertEqual(count, 3)
+        self.assertGreater(total, 0)
+        self.assertGreater(self.metrics.request_phases.get(
+            ('deployments', 'read', 'ttfb')), 0)
+        # Requests are observed once their response is decoded
+        self.assertGreater(self.metrics.request_phases.get(
+            ('deployments', 'read', 'decode')), 0)
+        self.assertGreater(self.metrics.response_bytes.get(
+            ('deployments', 'read')), 0)
+
+    def test_subroute_action(self):
+        deployment = self._client().deployments.get(1)
+        deployment.tasks.create(action='HEALTH_CHECK')
+        self.assertEqual(self.metrics.requests.get(
+            ('deployments.tasks', 'create', 'POST', '201')), 1)
+
+    def test_cache_lookups(self):
+        schema_cache = cache.SchemaCache(cache_dir=self.tmpdir)
+        response_cache = cache.ResponseCache()
+        for _ in range(2):
+            client = self._client(schema_cache=schema_cache,
+                                  response_cache=response_cache,
+                                  conditional_requests=True)
+            client.infrastructure.clouds.get('cloud-1')
+            client.applications.get('application-1')
+            client.applications.get('application-1')
+        lookups = self.metrics.cache_lookups
+        # The schema is looked up for each request not served from the
+        # response cache
+        self.assertEqual(lookups.get(('schema', 'miss')), 1)
+        self.assertEqual(lookups.get(('schema', 'hit')), 4)
+        self.assertEqual(lookups.get(('response', 'miss')), 1)
+        self.assertEqual(lookups.get(('response', 'hit')), 1)
+        # Validators are kept per client, so every first GET of a URL by a
+        # client is a miss, including the schema and the cloud
+        self.assertEqual(lookups.get(('conditional', 'hit')), 2)
+        self.assertEqual(lookups.get(('conditional', 'miss')), 4)
+
+    def test_disable(self):
+        metrics.disable()
+        self.assertIsNone(metrics.current())
+        self._client().deployments.get(1)
+        self.assertEqual(self.metrics.exposition().count('\n'), 12)
+
+    def test_http_server(self):
+        self._client().deployments.list()
+        with metrics.start_http_server() as server:
+            with urllib.request.urlopen(server.url) as response:
+                self.assertEqual(response.headers['Content-Type'],
+                                 metrics.PROMETHEUS_CONTENT_TYPE)
+                text = response.read().decode('utf-8')
+            request = urllib.request.Request(server.url, headers={
+                'Accept': 'application/openmetrics-text'})
+            with urllib.request.urlopen(request) as response:
+                self.assertTrue(response.read().endswith(b'# EOF\n'))
+        self.assertIn('cloudlaunch_client_requests_total{endpoint='
+                      '"deployments",action="list",method="GET",'
+                      'status="200"} 1\n', text)
+
+    def test_http_server_context_manager(self):
+        with metrics.MetricsServer() as server:
+            with urllib.request.urlopen(server.url) as response:
+                self.assertEqual(response.status, 200)
+
+    def test_write_textfile(self):
+        self._client().deployments.list()
+        path = os.path.join(self.tmpdir, 'cloudlaunch.prom')
+        metrics.write_textfile(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), self.metrics.exposition())
+        self.assertEqual(os.listdir(self.tmpdir), ['cloudlaunch.prom'])
@@ -2,6 +2,7 @@
 import copy
 import json
 import unittest
+import unittest.mock
 from unittest.mock import Mock
 
 from cloudlaunch_cli.api import client, endpoints, resources
@@ -33,12 +34,63 @@ class TestDeployment(unittest.TestCase):
         self.assertIsNot(self.raw_data, self.deployment._data)
         self.assertEqual(self.raw_data, self.deployment.asdict())
 
+    def test_from_response(self):
+        """Test that from_response takes ownership of data."""
+        deployment = resources.Deployment.from_response(self.raw_data)
+        self.assertIs(deployment._data, self.raw_data)
+        self.assertIsInstance(deployment.launch_task, resources.Task)
+        deployment.archived = True
+        self.assertTrue(self.raw_data['archived'])
+
+    def test_from_response_shared(self):
+        """Test that shared data is copied when a resource is changed."""
+        original = copy.deepcopy(self.raw_data)
+        deployment = resources.Deployment.from_response(self.raw_data,
+                                                        shared=True)
+        other = resources.Deployment.from_response(self.raw_data,
+                                                   shared=True)
+        self.assertEqual(self.raw_data, original)
+        # Nested data isn't copied
+        self.assertIs(deployment.launch_task._data,
+                      self.raw_data['launch_task'])
+        deployment.launch_task.status = 'FAILURE'
+        deployment.archived = True
+        self.assertTrue(deployment.archived)
+        self.assertFalse(other.archived)
+        self.assertEqual(other.launch_task.status,
+                         original['launch_task']['status'])
+        self.assertEqual(self.raw_data, original)
+
     def test_child_task_mapping(self):
         """Test latest_task and launch_task mappings."""
         self.assertIsInstance(self.deployment.latest_task, resources.Task)
         self.assertIsInstance(self.deployment.launch_task, resources.Task)
         self.assertEqual(self.deployment.launch_task.id, 215)
 
+    def test_lazy_mapping(self):
+        """Test that mapped fields are wrapped when first accessed."""
+        self.assertIsInstance(self.deployment._data['launch_task'], dict)
+        launch_task = self.deployment.launch_task
+        self.assertIsInstance(launch_task, resources.Task)
+        self.assertIs(self.deployment.launch_task, launch_task)
+        self.assertIsInstance(self.deployment._data['latest_task'], dict)
+        # asdict handles both mapped and raw fields
+        self.assertEqual(self.raw_data, self.deployment.asdict())
+
+    def test_lazy_child_update_endpoint(self):
+        """Test that child update endpoints are created when needed."""
+        deployments = self.deployment._update_endpoint
+        with unittest.mock.patch.object(
+                deployments, 'subroutes',
+                wraps=deployments.subroutes) as subroutes:
+            latest_task = self.deployment.latest_task
+            subroutes.assert_not_called()
+            task_endpoint = latest_task._get_update_endpoint()
+            subroutes.assert_called_once_with(self.deployment.id)
+        self.assertIsInstance(task_endpoint, endpoints.DeploymentTasks)
+        self.assertEqual(task_endpoint.parent_url_kwargs,
+                         {'deployment_pk': self.deployment.id})
+
     def test_update(self):
         """Test a no-op update and make sure it returns the same values."""
         self.deployment._update_endpoint.update = Mock(
@@ -71,6 +123,20 @@ class TestDeployment(unittest.TestCase):
         self.assertTrue(self.deployment.archived)
         self.assertEqual(updated_data, self.deployment.asdict())
 
+    def test_refresh(self):
+        """Test refreshing the data of a deployment in place."""
+        updated_data = copy.deepcopy(self.raw_data)
+        updated_data['name'] = 'renamed'
+        self.deployment._update_endpoint.get = Mock(
+            return_value=resources.Deployment.from_response(updated_data))
+        self.deployment.archived = True
+        self.deployment.refresh()
+        self.deployment._update_endpoint.get.assert_called_with(
+            self.deployment.id)
+        self.assertEqual(self.deployment.name, 'renamed')
+        self.assertFalse(self.deployment.archived)
+        self.assertEqual(updated_data, self.deployment.asdict())
+
     def test_public_ip(self):
         """Test public_ip computed property."""
         self.assertEqual(self.deployment.public_ip, "34.233.71.64")
@@ -117,3 +183,66 @@ class TestApplication(unittest.TestCase):
             self.assertTrue(isinstance(target_config.target, resources.DeploymentTarget))
             self.assertTrue(isinstance(target_config.image, resources.Image))
         self.assertEqual(len(version2.target_config), 4)
+
+
+class TestCompactRecord(unittest.TestCase):
+    """Tests for compact, read-only records."""
+
+    def setUp(self):
+        self.raw_data = json.loads(load_fixture("ubuntu_deployment_data.json"))
+        self.deployment = resources.compact_record(resources.Deployment,
+                                                   self.raw_data)
+
+    def test_fields(self):
+        self.assertEqual(self.deployment.id, 26)
+        self.assertEqual(self.deployment.name, self.raw_data['name'])
+        self.assertIsInstance(self.deployment.latest_task,
+                              resources.CompactRecord)
+        self.assertEqual(self.deployment.latest_task.resource_type,
+                         resources.Task)
+        self.assertEqual(self.deployment.asdict(), self.raw_data)
+        self.assertFalse(hasattr(self.deployment, '__dict__'))
+
+    def test_properties(self):
+        """Test that computed properties of the resource type work."""
+        self.assertEqual(self.deployment.public_ip, "34.233.71.64")
+        self.assertEqual(self.deployment.latest_task.instance_status,
+                         "running")
+        with self.assertRaises(Exception):
+            self.deployment.tasks
+
+    def test_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.deployment.archived = True
+
+    def test_unusual_keys(self):
+        """Test keys that aren't identifiers or clash with attributes."""
+        record = resources.compact_record(resources.Application, {
+            'slug': 'ubuntu', 'id': 3, 'update': 'x', 'foo-bar': 1})
+        self.assertEqual(record.id, 'ubuntu')
+        self.assertEqual(getattr(record, 'foo-bar'), 1)
+        self.assertEqual(record.asdict(), {
+            'slug': 'ubuntu', 'id': 3, 'update': 'x', 'foo-bar': 1})
+
+    def test_shared_values(self):
+        """Test that equal nested values are only stored once."""
+        shared_values = {}
+        other = resources.compact_record(
+            resources.Deployment,
+            json.loads(load_fixture("ubuntu_deployment_data.json")),
+            shared_values)
+        record = resources.compact_record(resources.Deployment,
+                                          self.raw_data, shared_values)
+        self.assertIs(record.deployment_target, other.deployment_target)
+        # Payloads of mapped fields aren't shared
+        self.assertIsNot(record.launch_task.result, other.launch_task.result)
+        self.assertEqual(record.asdict(), self.raw_data)
+
+    @unittest.mock.patch.object(resources, 'MAX_SHARED_VALUES', 1)
+    def test_shared_values_bounded(self):
+        shared_values = {}
+        for name in ('a', 'b', 'a'):
+            data = dict(self.raw_data, deployment_target={'name': name})
+            resources.compact_record(resources.Deployment, data,
+                                     shared_values)
+        self.assertEqual(list(shared_values), [repr({'name': 'a'})])
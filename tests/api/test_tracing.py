@@ -0,0 +1,100 @@
+import io
+import time
+import unittest
+import unittest.mock
+
+from click.testing import CliRunner
+
+from cloudlaunch_cli import main, output
+from cloudlaunch_cli.api import tracing
+from cloudlaunch_cli.api.client import APIClient
+from cloudlaunch_cli.testing.server import FakeCloudLaunchServer
+
+
+class TestTracing(unittest.TestCase):
+    """Tests of tracing API requests made to the fake server."""
+
+    def setUp(self):
+        self.server = FakeCloudLaunchServer(deployments=3).start()
+        self.addCleanup(self.server.stop)
+        self.client = APIClient(url=self.server.url, token='token',
+                                schema_cache=False)
+        self.addCleanup(self.client.close)
+        self.addCleanup(tracing.stop)
+
+    def test_requests_recorded(self):
+        with tracing.trace() as trace:
+            self.client.deployments.get(1)
+        schema, request = trace.requests
+        self.assertEqual(schema.action, ['schema'])
+        self.assertEqual(request.action, ['deployments', 'read'])
+        self.assertEqual(request.method, 'GET')
+        self.assertEqual(request.status, 200)
+        self.assertGreater(request.bytes, 0)
+        for phase in ('ttfb', 'transfer', 'decode'):
+            self.assertIn(phase, request.timings)
+        # The first request opens the connection
+        self.assertIn('connect', schema.timings)
+        self.assertNotIn('tls', schema.timings)
+        self.assertIn('deployments.read', trace.report())
+
+    def test_list_pages_recorded(self):
+        with tracing.trace() as trace:
+            self.client.deployments.list(page_size=2)
+        actions = [r.action for r in trace.requests[1:]]
+        self.assertEqual(actions, [['deployments', 'list']] * 2)
+
+    def test_error_recorded(self):
+        with tracing.trace() as trace:
+            with self.assertRaises(Exception):
+                self.client.deployments.get(100)
+        self.assertEqual(trace.requests[-1].status, 404)
+
+    def test_span_excludes_requests(self):
+        with tracing.trace() as trace:
+            with tracing.span('work'):
+                self.client.deployments.get(1)
+                time.sleep(0.01)
+        work, = [s for s in trace.spans if s.name == 'work']
+        request_time = sum(r.duration + r.timings['decode']
+                           for r in trace.requests)
+        self.assertAlmostEqual(work.request_time, request_time)
+        self.assertGreaterEqual(work.duration - work.request_time, 0.01)
+
+    def test_render_span(self):
+        with tracing.trace() as trace:
+            output.render([], main.DEPLOYMENT_COLUMNS, 'json',
+                          stream=io.StringIO())
+        self.assertEqual([s.name for s in trace.spans], ['render'])
+
+    def test_inactive(self):
+        self.client.deployments.get(1)
+        self.assertIsNone(tracing.current())
+        self.assertIsNone(tracing.begin_request('GET', self.server.url))
+        with tracing.span('work'), tracing.action(['deployments']):
+            pass
+        with tracing.trace() as trace:
+            pass
+        self.assertEqual(trace.requests, [])
+        self.assertEqual(trace.spans, [])
+
+
+class TestTimingsOption(unittest.TestCase):
+    """Tests of the --timings option of the client commands."""
+
+    def test_report_on_stderr(self):
+        server = FakeCloudLaunchServer(deployments=2).start()
+        self.addCleanup(server.stop)
+        conf = unittest.mock.Mock(url=server.url, token='token')
+        with unittest.mock.patch.object(main, 'conf', conf), \
+                unittest.mock.patch.object(main, 'get_schema_cache',
+                                           return_value=False):
+            result = CliRunner().invoke(
+                main.client, ['--no-cache', '--timings', '--output', 'json',
+                              'deployments', 'list'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('"deployment-1"', result.stdout)
+        self.assertNotIn('Timings', result.stdout)
+        self.assertIn('Timings:', result.stderr)
+        self.assertIn('deployments.list', result.stderr)
+        self.assertIsNone(tracing.current())
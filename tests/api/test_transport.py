@@ -0,0 +1,229 @@
+import unittest
+import unittest.mock
+
+from cloudlaunch_cli.api import transport
+
+import requests
+
+
+def _response(status_code, content=b'', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response._content_consumed = True
+    response.headers.update(headers or {})
+    return response
+
+
+class TestConditionalRequests(unittest.TestCase):
+    """Tests for conditional GET requests in CloudLaunchHTTPAdapter."""
+
+    URL = "http://localhost:8000/api/v1/deployments/"
+
+    def setUp(self):
+        self.send_patcher = unittest.mock.patch(
+            'requests.adapters.HTTPAdapter.send')
+        self.send_mock = self.send_patcher.start()
+        self.addCleanup(self.send_patcher.stop)
+        self.validators = transport.ValidatorCache()
+        self.session = transport.create_session(validators=self.validators)
+
+    def _sent_headers(self):
+        return self.send_mock.call_args[0][0].headers
+
+    def test_not_modified_replays_body(self):
+        self.send_mock.return_value = _response(200, b'{"count": 0}', {
+            'ETag': '"abc"', 'Content-Type': 'application/json'})
+        first = self.session.get(self.URL)
+        self.assertFalse(first.not_modified)
+        self.assertNotIn('If-None-Match', self._sent_headers())
+
+        self.send_mock.return_value = _response(304, headers={'ETag': '"abc"'})
+        second = self.session.get(self.URL)
+        self.assertEqual(self._sent_headers()['If-None-Match'], '"abc"')
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.json(), {'count': 0})
+        self.assertEqual(second.headers['Content-Type'], 'application/json')
+
+    @unittest.mock.patch('time.sleep')
+    def test_retried_not_modified(self, sleep):
+        session = transport.create_session(
+            validators=self.validators, retry_policy=transport.RetryPolicy())
+        self.send_mock.side_effect = [
+            _response(200, b'{"count": 0}', {'ETag': '"abc"'}),
+            _response(503), _response(304, headers={'ETag': '"abc"'})]
+        session.get(self.URL)
+        response = session.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'count': 0})
+        self.assertEqual(
+            [c[0][0].headers.get('If-None-Match')
+             for c in self.send_mock.call_args_list],
+            [None, '"abc"', '"abc"'])
+
+    def test_only_get_requests(self):
+        self.send_mock.return_value = _response(200, b'{}', {'ETag': '"a"'})
+        self.session.post(self.URL, json={})
+        self.session.get(self.URL)
+        self.assertNotIn('If-None-Match', self._sent_headers())
+
+    def test_without_validators(self):
+        session = transport.create_session()
+        self.send_mock.return_value = _response(200, b'{}', {'ETag': '"a"'})
+        session.get(self.URL)
+        session.get(self.URL)
+        self.assertNotIn('If-None-Match', self._sent_headers())
+
+    def test_lru_eviction(self):
+        validators = transport.ValidatorCache(max_entries=2)
+        for url in ('a', 'b', 'a', 'c'):
+            validators.set(url, transport.ValidatorEntry(
+                '"1"', None, None, b''))
+        self.assertIsNone(validators.get('b'))
+        self.assertIsNotNone(validators.get('a'))
+
+    def test_size_eviction(self):
+        validators = transport.ValidatorCache(max_size=10)
+        for url, size in (('a', 4), ('b', 4), ('a', 4), ('c', 4)):
+            validators.set(url, transport.ValidatorEntry(
+                '"1"', None, None, b'x' * size))
+        self.assertIsNone(validators.get('b'))
+        self.assertIsNotNone(validators.get('a'))
+        # Bodies larger than max_size aren't stored at all
+        validators.set('d', transport.ValidatorEntry(
+            '"1"', None, None, b'x' * 11))
+        self.assertIsNone(validators.get('d'))
+        self.assertIsNotNone(validators.get('c'))
+
+
+class TestRetries(unittest.TestCase):
+    """Tests for retrying requests in CloudLaunchHTTPAdapter."""
+
+    URL = "http://localhost:8000/api/v1/deployments/"
+
+    def setUp(self):
+        self.send_patcher = unittest.mock.patch(
+            'requests.adapters.HTTPAdapter.send')
+        self.send_mock = self.send_patcher.start()
+        self.addCleanup(self.send_patcher.stop)
+        sleep_patcher = unittest.mock.patch('time.sleep')
+        self.sleep_mock = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+        self.policy = transport.RetryPolicy(max_retries=2, backoff=1)
+        self.session = transport.create_session(retry_policy=self.policy)
+
+    def test_retry_status(self):
+        self.send_mock.side_effect = [_response(502), _response(503),
+                                      _response(200, b'{}')]
+        response = self.session.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.send_mock.call_count, 3)
+        first, second = [c[0][0] for c in self.sleep_mock.call_args_list]
+        self.assertTrue(0 <= first <= 1)
+        self.assertTrue(0 <= second <= 2)
+
+    def test_max_retries(self):
+        self.send_mock.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            self.session.get(self.URL)
+        self.assertEqual(self.send_mock.call_count, 3)
+
+    def test_not_retried(self):
+        self.send_mock.return_value = _response(500)
+        self.assertEqual(self.session.get(self.URL).status_code, 500)
+        self.send_mock.return_value = _response(404)
+        self.assertEqual(self.session.delete(self.URL).status_code, 404)
+        self.assertEqual(self.send_mock.call_count, 2)
+
+    def test_create_opt_in(self):
+        self.send_mock.return_value = _response(503)
+        self.session.post(self.URL, json={})
+        self.assertEqual(self.send_mock.call_count, 1)
+        session = transport.create_session(
+            retry_policy=transport.RetryPolicy(retry_create=True))
+        session.post(self.URL, json={})
+        self.assertEqual(self.send_mock.call_count, 5)
+
+    def test_retry_after(self):
+        self.send_mock.side_effect = [
+            _response(429, headers={'Retry-After': '7'}),
+            _response(200, b'{}')]
+        self.session.get(self.URL)
+        self.sleep_mock.assert_called_once_with(7.0)
+        # Longer than max_backoff is given up on
+        self.send_mock.side_effect = None
+        self.send_mock.return_value = _response(
+            503, headers={'Retry-After': '3600'})
+        self.assertEqual(self.session.get(self.URL).status_code, 503)
+        self.assertEqual(self.send_mock.call_count, 3)
+
+    def test_retry_after_date(self):
+        response = _response(503, headers={
+            'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(self.policy.delay(0, response), 0)
+        # Invalid values fall back to backoff
+        response = _response(503, headers={'Retry-After': 'soon'})
+        self.assertTrue(0 <= self.policy.delay(0, response) <= 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for failing fast with a CircuitBreaker."""
+
+    URL = "http://localhost:8000/api/v1/deployments/"
+    HOST = "http://localhost:8000"
+
+    def setUp(self):
+        self.send_patcher = unittest.mock.patch(
+            'requests.adapters.HTTPAdapter.send')
+        self.send_mock = self.send_patcher.start()
+        self.addCleanup(self.send_patcher.stop)
+        self.breaker = transport.CircuitBreaker(failure_threshold=2,
+                                                reset_timeout=30)
+        self.session = transport.create_session(circuit_breaker=self.breaker)
+
+    def test_opens_after_failures(self):
+        self.send_mock.return_value = _response(503)
+        self.session.get(self.URL)
+        self.session.get(self.URL)
+        self.assertTrue(self.breaker.is_open(self.HOST))
+        with self.assertRaises(transport.CircuitOpenError):
+            self.session.get(self.URL)
+        self.assertEqual(self.send_mock.call_count, 2)
+        # Other hosts aren't affected
+        self.session.get("http://example.org/")
+        self.assertEqual(self.send_mock.call_count, 3)
+
+    def test_success_resets(self):
+        self.send_mock.side_effect = [_response(503), _response(200),
+                                      _response(503), _response(200)]
+        for _ in range(4):
+            self.session.get(self.URL)
+        self.assertFalse(self.breaker.is_open(self.HOST))
+
+    @unittest.mock.patch('time.monotonic')
+    def test_trial_request(self, monotonic):
+        monotonic.return_value = 100
+        self.breaker.record_failure(self.HOST)
+        self.breaker.record_failure(self.HOST)
+        monotonic.return_value = 131
+        self.breaker.before_request(self.HOST)
+        # Only one trial request is let through at a time
+        with self.assertRaises(transport.CircuitOpenError):
+            self.breaker.before_request(self.HOST)
+        self.breaker.record_failure(self.HOST)
+        monotonic.return_value = 150
+        with self.assertRaises(transport.CircuitOpenError):
+            self.breaker.before_request(self.HOST)
+        monotonic.return_value = 162
+        self.breaker.before_request(self.HOST)
+        self.breaker.record_success(self.HOST)
+        self.assertFalse(self.breaker.is_open(self.HOST))
+
+    def test_stops_retries(self):
+        session = transport.create_session(
+            retry_policy=transport.RetryPolicy(backoff=0),
+            circuit_breaker=self.breaker)
+        self.send_mock.return_value = _response(502)
+        self.assertEqual(session.get(self.URL).status_code, 502)
+        self.assertEqual(self.send_mock.call_count, 2)
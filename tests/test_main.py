@@ -0,0 +1,97 @@
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+from click.testing import CliRunner
+import coreapi
+
+from cloudlaunch_cli import config, main
+from cloudlaunch_cli.api import batch, cache
+
+
+class TestStartup(unittest.TestCase):
+    """Tests that the CLI defers slow imports and reading its config."""
+
+    def test_slow_modules_not_imported(self):
+        modules = ['arrow', 'coreapi', 'requests',
+                   'cloudlaunch_cli.api.client', 'cloudlaunch_cli.api.cache',
+                   'cloudlaunch_cli.manifest']
+        script = ("import sys, cloudlaunch_cli.main; "
+                  "print(','.join(m for m in {modules!r} "
+                  "if m in sys.modules))").format(modules=modules)
+        imported = subprocess.check_output(
+            [sys.executable, '-c', script]).decode().strip()
+        self.assertEqual(imported, '')
+
+    def test_default_concurrency(self):
+        self.assertEqual(main.DEFAULT_CONCURRENCY, batch.DEFAULT_CONCURRENCY)
+
+    def test_config_read_lazily(self):
+        conf = config.Configuration()
+        conf._filename = '/nonexistent/.cloudlaunch'
+        self.assertIsNone(conf._parser)
+        self.assertIn('url', dir(conf))
+        self.assertIsNone(conf._get_config_value('token'))
+        self.assertIsNotNone(conf._parser)
+
+
+class TestCreateAPIClient(unittest.TestCase):
+    """Tests for create_api_client."""
+
+    def test_shared_circuit_breaker(self):
+        conf = unittest.mock.Mock(url='http://localhost:8000', token='token')
+        with unittest.mock.patch.object(main, 'conf', conf):
+            clients = [main.create_api_client() for _ in range(2)]
+        breakers = [c.api_config.circuit_breaker for c in clients]
+        self.assertIsNotNone(breakers[0])
+        self.assertIs(breakers[0], breakers[1])
+
+
+class TestClearCache(unittest.TestCase):
+    """Tests for the 'cache clear' command."""
+
+    def test_no_url_configured(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        schema_cache = cache.SchemaCache(cache_dir=cache_dir)
+        for url in ('http://a/schema/', 'http://b/schema/'):
+            schema_cache.store(url, 'token', coreapi.Client().decoders, 200,
+                               {'Content-Type': 'application/json'}, b'{}')
+        conf = unittest.mock.Mock(url=None, token=None)
+        with unittest.mock.patch.object(main, 'conf', conf), \
+                unittest.mock.patch.object(main, 'get_schema_cache',
+                                           return_value=schema_cache), \
+                unittest.mock.patch.object(cache, 'SQLiteCache'):
+            result = CliRunner().invoke(main.client, ['cache', 'clear'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Removed 2 cached schema(s)', result.stdout)
+
+
+class TestOptionValidation(unittest.TestCase):
+    """Tests that commands reject invalid numeric options."""
+
+    def _assert_invalid(self, args, option):
+        result = CliRunner().invoke(main.client, args)
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn("Invalid value for '{option}'".format(option=option),
+                      result.stderr)
+
+    def test_negative_options(self):
+        for option in ('--limit', '--page-size', '--prefetch'):
+            self._assert_invalid(['deployments', 'list', option, '-1'],
+                                 option)
+
+    def test_concurrency(self):
+        for value in ('0', '-1'):
+            self._assert_invalid(
+                ['deployments', 'create-batch', __file__, '--concurrency',
+                 value], '--concurrency')
+            self._assert_invalid(
+                ['deployments', 'health-check', '--all', '--concurrency',
+                 value], '--concurrency')
+            self._assert_invalid(
+                ['clouds', 'snapshot', '--concurrency', value],
+                '--concurrency')
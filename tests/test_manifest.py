@@ -0,0 +1,67 @@
+"""Tests for reading deployment manifests."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudlaunch_cli import manifest
+
+from tests import fixtures_dir
+
+
+class TestLoadManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        shutil.copy(os.path.join(fixtures_dir, 'app_cfg_ubuntu.json'),
+                    self.tmp_dir)
+
+    def _write(self, filename, content):
+        path = os.path.join(self.tmp_dir, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_json_with_defaults_and_count(self):
+        path = self._write('manifest.json', json.dumps({
+            'defaults': {'application': 'ubuntu', 'cloud': 'aws',
+                         'target_id': 1, 'application_version': '16.04'},
+            'deployments': [
+                {'name': 'workshop-{index}', 'count': 3,
+                 'config_app': 'app_cfg_ubuntu.json'},
+                {'name': 'instructor', 'cloud': 'gcp', 'target_id': 4},
+            ]
+        }))
+        specs = manifest.load_manifest(path)
+        self.assertEqual([spec['name'] for spec in specs], [
+            'workshop-1', 'workshop-2', 'workshop-3', 'instructor'])
+        self.assertEqual(specs[0]['deployment_target_id'], 1)
+        self.assertIn('config_app', specs[0]['config_app'])
+        self.assertEqual(specs[3]['cloud'], 'gcp')
+        self.assertNotIn('config_app', specs[3])
+
+    def test_ndjson(self):
+        path = self._write('manifest.ndjson', '\n'.join([
+            json.dumps({'name': 'a', 'application': 'ubuntu',
+                        'cloud': 'aws', 'target_id': 1}),
+            '',
+            json.dumps({'name': 'b', 'application': 'ubuntu',
+                        'cloud': 'aws', 'target_id': 1}),
+        ]))
+        self.assertEqual(
+            [spec['name'] for spec in manifest.load_manifest(path)],
+            ['a', 'b'])
+
+    def test_yaml(self):
+        path = self._write('manifest.yaml', "- name: a\n"
+                                            "  application: ubuntu\n"
+                                            "  cloud: aws\n"
+                                            "  target_id: 1\n")
+        self.assertEqual(manifest.load_manifest(path)[0]['cloud'], 'aws')
+
+    def test_missing_fields(self):
+        path = self._write('manifest.json', json.dumps([{'name': 'a'}]))
+        with self.assertRaises(Exception):
+            manifest.load_manifest(path)
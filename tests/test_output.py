@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import unittest
+
+from cloudlaunch_cli import output
+
+
+class Row(object):
+
+    def __init__(self, **data):
+        self.data = data
+
+    def asdict(self):
+        return self.data
+
+
+COLUMNS = [
+    output.Column('ID', lambda row: row.data['id'], width=4, align='>'),
+    output.Column('Name', lambda row: row.data['name']),
+    output.Column('Size', lambda row: row.data['size'], width=6,
+                  display=lambda size: size or 'N/A'),
+]
+
+
+class TestRender(unittest.TestCase):
+    """Tests for rendering rows in each output format."""
+
+    def setUp(self):
+        self.rows = [Row(id=1, name='small', size=10),
+                     Row(id=22, name='much-larger', size=None)]
+
+    def _render(self, rows, output_format, **kwargs):
+        stream = io.StringIO()
+        output.render(rows, COLUMNS, output_format, stream=stream, **kwargs)
+        return stream.getvalue()
+
+    def test_table(self):
+        self.assertEqual(
+            self._render(iter(self.rows), 'table').splitlines(), [
+                'ID    Name         Size',
+                '   1  small        10',
+                '  22  much-larger  N/A',
+            ])
+
+    def test_empty(self):
+        self.assertEqual(
+            self._render([], 'table', empty_message="No rows."), "No rows.\n")
+        self.assertEqual(json.loads(self._render([], 'json')), [])
+        self.assertEqual(self._render([], 'ndjson'), '')
+        self.assertEqual(self._render([], 'csv'), 'ID,Name,Size\n')
+
+    def test_json(self):
+        self.assertEqual(json.loads(self._render(iter(self.rows), 'json')),
+                         [row.data for row in self.rows])
+        self.assertEqual(
+            json.loads(self._render(self.rows, 'json',
+                                    data=lambda row: row.data['id'])),
+            [1, 22])
+
+    def test_ndjson(self):
+        lines = self._render(iter(self.rows), 'ndjson').splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [row.data for row in self.rows])
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(
+            self._render(iter(self.rows), 'csv'))))
+        self.assertEqual(rows, [['ID', 'Name', 'Size'],
+                                ['1', 'small', '10'],
+                                ['22', 'much-larger', '']])
+
+    def test_streams_rows(self):
+        """Test that fixed width tables are written without reading ahead."""
+        columns = [COLUMNS[0]]
+        stream = io.StringIO()
+        writer = output.BufferedWriter(stream, buffer_size=1)
+
+        def rows():
+            for row in self.rows:
+                yield row
+                # The previous row has been written before the next is read
+                self.assertIn(str(row.data['id']), stream.getvalue())
+
+        output._render_table(rows(), columns, writer, '')
+
+
+class TestBufferedWriter(unittest.TestCase):
+
+    def test_buffers_writes(self):
+        stream = io.StringIO()
+        writer = output.BufferedWriter(stream, buffer_size=10,
+                                       flush_interval=60)
+        writer.write('12345')
+        self.assertEqual(stream.getvalue(), '')
+        writer.write('67890')
+        self.assertEqual(stream.getvalue(), '1234567890')
+        writer.write('x')
+        writer.flush()
+        self.assertEqual(stream.getvalue(), '1234567890x')
+
+    def test_flushes_after_interval(self):
+        stream = io.StringIO()
+        writer = output.BufferedWriter(stream, flush_interval=0)
+        writer.write('slow row\n')
+        self.assertEqual(stream.getvalue(), 'slow row\n')
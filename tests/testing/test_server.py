@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from click.testing import CliRunner
+import coreapi
+
+from cloudlaunch_cli import main
+from cloudlaunch_cli.api import cache, resources, tracing
+from cloudlaunch_cli.api.client import APIClient
+from cloudlaunch_cli.testing.server import FakeCloudLaunchServer
+
+
+class TestFakeCloudLaunchServer(unittest.TestCase):
+    """Tests of the API client against the fake server."""
+
+    def setUp(self):
+        self.server = FakeCloudLaunchServer(deployments=12, tasks=3,
+                                            page_size=5).start()
+        self.addCleanup(self.server.stop)
+        self.client = APIClient(url=self.server.url, token='token',
+                                schema_cache=False)
+        self.addCleanup(self.client.close)
+
+    def test_paginated_list(self):
+        deployments = self.client.deployments.list()
+        self.assertEqual([d.id for d in deployments], list(range(1, 13)))
+        self.assertEqual(
+            self.server.request_count('GET', '/api/v1/deployments/'), 3)
+        prefetched = self.client.deployments.list(prefetch=2, page_size=4)
+        self.assertEqual([d.id for d in prefetched], list(range(1, 13)))
+
+    def test_get_deployment(self):
+        deployment = self.client.deployments.get(3)
+        self.assertEqual(deployment.name, 'deployment-3')
+        self.assertEqual(deployment.launch_task.action, 'LAUNCH')
+        self.assertEqual(deployment.latest_task.instance_status, 'running')
+        self.assertEqual(deployment.public_ip, '10.0.0.3')
+        self.assertEqual(len(deployment.tasks.list()), 3)
+
+    def test_create_update_delete(self):
+        deployment = self.client.deployments.create(
+            name='new', application='application-0', deployment_target_id=1,
+            application_version='1.0')
+        self.assertEqual(deployment.id, 13)
+        task = deployment.tasks.create(action='HEALTH_CHECK')
+        self.assertEqual(self.client.deployments.get(13).latest_task.id,
+                         task.id)
+        deployment.archived = True
+        deployment.update()
+        self.assertEqual(len(self.client.deployments.list(archived=True)), 1)
+        deployment.delete()
+        with self.assertRaises(coreapi.exceptions.ErrorMessage):
+            self.client.deployments.get(13)
+
+    def test_infrastructure(self):
+        cloud = self.client.infrastructure.clouds.get('cloud-1')
+        region = cloud.regions.list()[0]
+        zone = region.zones.get('zone-1')
+        vm_types = zone.vm_types.list(min_vcpus=8)
+        self.assertIsInstance(vm_types[0], resources.VmType)
+        self.assertTrue(all(float(v.vcpus) >= 8 for v in vm_types))
+        self.assertEqual(len(vm_types), 11)
+
+    def test_conditional_requests(self):
+        client = APIClient(url=self.server.url, token='token',
+                           schema_cache=False, conditional_requests=True)
+        self.addCleanup(client.close)
+        client.applications.get('application-1')
+        session = client.api_config.connection.session
+        response = session.get(
+            self.server.url + '/applications/application-1/',
+            headers={'Authorization': 'Token token'})
+        self.assertTrue(response.not_modified)
+        self.assertEqual(response.json()['slug'], 'application-1')
+        # Connections are reused after 304 responses
+        for _ in range(3):
+            client.applications.get('application-1')
+        pools = session.get_adapter(self.server.url).poolmanager.pools
+        self.assertEqual(
+            {pools[key].num_connections for key in pools.keys()}, {1})
+
+    def test_refresh(self):
+        deployment = self.client.deployments.get(2)
+        with tracing.trace() as trace:
+            deployment.refresh()
+        self.assertTrue(trace.requests[-1].not_modified)
+        self.server.deployments[2]['name'] = 'renamed'
+        with tracing.trace() as trace:
+            deployment.refresh()
+        self.assertFalse(trace.requests[-1].not_modified)
+        self.assertEqual(deployment.name, 'renamed')
+
+    def test_token(self):
+        server = FakeCloudLaunchServer(token='secret').start()
+        self.addCleanup(server.stop)
+        client = APIClient(url=server.url, token='wrong', schema_cache=False)
+        self.addCleanup(client.close)
+        with self.assertRaises(coreapi.exceptions.ErrorMessage):
+            client.deployments.list()
+
+    def test_payload_size(self):
+        server = FakeCloudLaunchServer(deployments=1, payload_size=1000)
+        self.addCleanup(server.stop)
+        task = server.deployments[1]['launch_task']
+        self.assertEqual(len(task['result']['log']), 1000)
+
+    def test_start_twice(self):
+        with FakeCloudLaunchServer(deployments=1).start() as server:
+            self.assertIs(server.start(), server)
+        self.assertIsNone(server._thread)
+
+
+class TestCommandLine(unittest.TestCase):
+    """Tests of the CLI list commands against the fake server."""
+
+    def setUp(self):
+        self.server = FakeCloudLaunchServer(deployments=3).start()
+        self.addCleanup(self.server.stop)
+
+    def _invoke(self, *args, exit_code=0):
+        conf = unittest.mock.Mock(url=self.server.url, token='token')
+        with unittest.mock.patch.object(main, 'conf', conf), \
+                unittest.mock.patch.object(main, 'get_schema_cache',
+                                           return_value=False):
+            result = CliRunner().invoke(main.client, list(args))
+        self.assertEqual(result.exit_code, exit_code, result.output)
+        return result.stdout
+
+    def test_list_commands(self):
+        self.assertIn('Application 1', self._invoke('applications', 'list'))
+        self.assertIn('deployment-3', self._invoke('deployments', 'list'))
+        self.assertIn('Cloud 1', self._invoke('clouds', 'list'))
+        self.assertIn('region-1', self._invoke(
+            'clouds', 'regions', '--cloud_id', 'cloud-1', 'list'))
+
+    def test_list_vm_types(self):
+        region_id = 'cloud-1-region-1'
+        vm_types_path = ('/api/v1/infrastructure/clouds/cloud-1/regions/'
+                         '{region}/zones/zone-1/compute/vm_types/'.format(
+                             region=region_id))
+        response_cache = cache.ResponseCache()
+        with unittest.mock.patch.object(main, 'get_response_cache',
+                                        return_value=response_cache):
+            for min_vcpus in ('8', '32'):
+                stdout = self._invoke(
+                    'clouds', 'regions', '--cloud_id', 'cloud-1', 'zones',
+                    '--region_id', region_id, 'compute', '--zone_id',
+                    'zone-1', 'vm-types', 'list', '--min_vcpus', min_vcpus)
+                self.assertIn('m1.64xlarge', stdout)
+        self.assertNotIn('m1.4xlarge', stdout)
+        # Queries are answered from the cached list of all vm types
+        self.assertEqual(self.server.request_count('GET', vm_types_path), 1)
+
+    def test_snapshot(self):
+        catalog_path = os.path.join(tempfile.mkdtemp(), 'catalog.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(catalog_path))
+        self._invoke('--output', 'json', 'clouds', 'snapshot', '--catalog',
+                     catalog_path)
+        stdout = self._invoke('--output', 'json', 'clouds', 'find-vm-types',
+                              '--catalog', catalog_path, '--min_vcpus', '64')
+        self.assertIn('"m1.64xlarge"', stdout)
+
+    def test_health_check_unknown_cloud(self):
+        del self.server.clouds['cloud-1']
+        stdout = self._invoke('deployments', 'health-check', '--all')
+        # Only the deployment on the unknown cloud fails
+        statuses = [line.split()[3] for line in stdout.splitlines()
+                    if line.split()[0].isdigit()]
+        self.assertEqual(statuses, ['running', 'ERROR', 'running'])
+
+    def test_create_batch_unknown_cloud(self):
+        manifest = os.path.join(tempfile.mkdtemp(), 'manifest.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(manifest))
+        with open(manifest, 'w') as f:
+            json.dump({'defaults': {'application': 'application-0',
+                                    'application_version': '1.0',
+                                    'target_id': 1},
+                       'deployments': [{'name': 'good', 'cloud': 'cloud-1'},
+                                       {'name': 'bad', 'cloud': 'unknown'}]},
+                      f)
+        stdout = self._invoke('deployments', 'create-batch', manifest,
+                              exit_code=1)
+        self.assertIn('CREATED  good', stdout)
+        self.assertIn('FAILED   bad', stdout)
+        self.assertIn('Created 1 of 2 deployments, 1 failed.', stdout)